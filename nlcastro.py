@@ -2,8 +2,12 @@
 
 import pyfits
 import numpy
+import warnings
+import nlcfits
 import nlclib
 
+_whitespace = [ord(c) for c in ' \t\r\v\f'] # sends sex2degarray() the slow way
+
 def coord(ra,dec,dist,angle=0):
    """Returns new ra,dec a given dist away from the input ra,dec in the given
       angle.
@@ -38,26 +42,68 @@ def deg2sex(value,coord):
       Returns a tuple of HMS or DMS, depending on if coord is 'ra' or not.'''
    
    try:
-      tmp = map(float,str(value).split(':'))
+      degrees = sex2degarray([str(value)],coord)
    except ValueError:
       nlclib.error('Invalid string given for conversion to sexagesimal: %s' %value)
 
-   n = len(tmp)
-   if n == 1: # assume it was in degrees
-      junk = tmp[0]
-      if coord == 'ra':
-         junk = junk/15.0
-      hours = int(junk)
-      junk = 60*(numpy.abs(junk) - numpy.abs(hours))
-      minutes = int(junk)
-      junk = 60*(junk - minutes)
-      seconds = float(junk)
-      tmp[0] = hours
-      tmp.append(minutes)
-      tmp.append(seconds)
-   elif n == 2: # assume it was already sexagesimal, but no seconds given
-      tmp.append(0.0)
-   return tmp
+   sign,major,minutes,seconds = deg2sexarray(degrees,coord)
+   if sign[0] < 0 and major[0] == 0: # -0.0 keeps the sign of e.g. -00:30:00
+      return [-0.0,int(minutes[0]),float(seconds[0])]
+   return [int(sign[0]*major[0]),int(minutes[0]),float(seconds[0])]
+
+def deg2sexarray(values,coord,precision=None,strings=False):
+   """Convert a whole array of degrees to sexagesimal at once.
+
+      values    - degrees as a number, list/tuple or numpy array
+      coord     - 'ra' to give hours, anything else gives degrees
+      precision - number of decimal places to round the seconds to.  The
+                  rounding carries into the minutes and hours/degrees, so
+                  59.96s never shows up as 60.0s.  None only removes
+                  floating point noise (rounds to 1e-9 seconds).
+      strings   - set to True to get strings like -dd:mm:ss.s back instead
+                  of the components
+
+      returns sign,major,minutes,seconds as numpy arrays, where sign is +1
+      or -1 and the others are positive, or a list of strings if strings is
+      True.  major is hours for ra and degrees otherwise."""
+
+   values = numpy.asarray(values,dtype=numpy.float64)
+   if precision is None:
+      digits = 9
+   else:
+      digits = int(precision)
+   scale = 10**digits
+
+   # work in integer units of 10**-digits seconds, so the carry is exact
+   tmp = numpy.abs(values)
+   if coord == 'ra':
+      tmp = tmp/15.0
+   units   = numpy.round(tmp*3600*scale).astype(numpy.int64)
+   sign    = numpy.where((values < 0) & (units > 0),-1,1)
+   major   = units//(3600*scale)
+   minutes = (units//(60*scale)) % 60
+   seconds = (units % (60*scale))/float(scale)
+   if not strings:
+      return sign,major,minutes,seconds
+
+   # format everything with one % on a joined format string, which is much
+   # quicker than formatting each value separately
+   n = sign.size
+   if n == 0:
+      return []
+   if precision is None: # no fixed number of decimals, like str()
+      fmt  = '%s%d:%02d:%s'
+      secs = [('','0')[d < 10] + str(d) for d in seconds.ravel().tolist()]
+   else:
+      width = digits + 3 - (digits == 0) # 2 digits, point and decimals
+      fmt  = '%%s%%d:%%02d:%%0%d.%df' %(width,digits)
+      secs = seconds.ravel()
+   flat = numpy.empty(4*n,dtype=object)
+   flat[0::4] = numpy.where(sign < 0,'-','').ravel()
+   flat[1::4] = major.ravel()
+   flat[2::4] = minutes.ravel()
+   flat[3::4] = secs
+   return ('\n'.join([fmt]*n) %tuple(flat.tolist())).split('\n')
 
 def distance(ra1,dec1,ra2,dec2):
    """Compute the angular distance between two points, in degrees"""
@@ -74,13 +120,16 @@ def findExt(fname,extname):
       
       returns the extension number as an integer (starting from zero)"""
    
-   if isinstance(fname,str): # string with filename, so open
-      img = pyfits.open(fname)
+   if isinstance(fname,str): # string with filename, names are cached
+      try:
+         return nlcfits.findext(fname,extname)
+      except (IOError,IndexError,KeyError,TypeError),err:
+         nlclib.error(err.args[-1])
    elif isinstance(fname,pyfits.HDUList):
-      img = fname
+      names = _extNames(fname)
    else:
       nlclib.error("findExt(): fname must be a string or pyfits.HDUList")
-   n = len(img) # number of HDUs
+   n = len(names) # number of HDUs
 
    # first check if string of a integer, e.g. '1'
    try:
@@ -92,30 +141,20 @@ def findExt(fname,extname):
       if 1 <= ext <= n:
          tmp = ext - 1
       else:
-         img.close()
-         nlclib.error("Extension number must be in range %d-%d for %s!" %(1,n,img.filename()))
+         nlclib.error("Extension number must be in range %d-%d for %s!" %(1,n,_fileName(fname)))
    elif isinstance(ext,str):
       ext = ext.lower()
-      junk = [img[i].header['extname'].strip().lower() for i in xrange(1,n)]
-      if 'EXTNAME' in img[0].header.keys():
-         junk.insert(0,img[0].header['extname'].strip().lower())
-      else:
-         junk.insert(0,'primary')
-      if ext in junk:
-         tmp = junk.index(ext)
+      if ext in names:
+         tmp = names.index(ext)
       else:
-         img.close()
-         nlclib.error("Extension name '%s' not found in %s!" %(ext,img.filename()))
+         nlclib.error("Extension name '%s' not found in %s!" %(ext,_fileName(fname)))
    elif isinstance(ext,(list,tuple)):
       tmp = []
       for tmpext in ext:
-         blah = findExt(img,tmpext)
+         blah = findExt(fname,tmpext)
          tmp.append(blah)
    else:
-      img.close()
       nlclib.error("Extension must be an integer or string!")
-   if isinstance(fname,str): # string with filename, so close
-      img.close()
    return tmp
 
 def meanangle(theta,dtheta):
@@ -145,14 +184,104 @@ def sex2deg(value,ctype):
    '''Convert sexagesimal to degrees, unless it is already in degrees'''
 
    if isinstance(value,str): # is a string
-      tmp     = numpy.array(map(float,value.split(':')),dtype=numpy.float32)
-      tmpsign = numpy.sign(tmp[0])
-      fac     = 60**numpy.arange(tmp.shape[0],dtype=numpy.float32)
-      degrees = tmpsign*numpy.sum(numpy.abs(tmp)/fac)
-      if ctype == 'ra' and len(tmp) > 1: # first value is ra, multiply by 15
-         degrees = 15*degrees # convert hours to degrees
+      degrees = float(sex2degarray([value],ctype)[0])
    elif isinstance(value,(float,int)): # assume it is already in degrees
       degrees = value
    else: # assume it is a list,tuple, or array
-      degrees = [sex2deg(a,ctype) for a in value]
+      degrees = sex2degarray(value,ctype).tolist()
    return degrees
+
+def sex2degarray(values,ctype,strict=True):
+   """Convert a whole sequence of sexagesimal strings to degrees at once.
+
+      values - list/tuple/array of strings like hh:mm:ss.s or dd:mm:ss.
+               Strings without a colon, and numbers, are taken as degrees.
+      ctype  - 'ra' to convert hours to degrees (only for values with a
+               colon).  Anything else leaves the first field as degrees.
+      strict - if True, raise ValueError listing the rows that cannot be
+               parsed.  If False, those rows are NaN.
+
+      returns a float64 numpy array with the same shape as values"""
+
+   values = numpy.asarray(values)
+   if values.dtype.kind in 'biuf': # already numbers
+      return values.astype(numpy.float64)
+   text = [str(a).strip() for a in values.ravel().tolist()]
+   nrow = len(text)
+   if nrow == 0:
+      return numpy.zeros(values.shape,dtype=numpy.float64)
+
+   # one newline separated buffer for all rows.  Row numbers, colon counts
+   # and signs are found from the bytes, so no per-row python work is needed
+   joined = '\n'.join(text)
+   buf    = numpy.frombuffer(joined,dtype=numpy.uint8)
+   eol    = numpy.nonzero(buf == ord('\n'))[0]
+   start  = numpy.concatenate(([0],eol + 1))
+   row    = numpy.zeros(buf.shape[0],dtype=numpy.intp)
+   row[eol] = 1
+   row    = numpy.cumsum(row)
+   nfield = numpy.bincount(row[buf == ord(':')],minlength=nrow) + 1
+   first  = numpy.zeros(nrow,dtype=numpy.uint8)
+   ok     = start < buf.shape[0]
+   first[ok] = buf[start[ok]]
+   negative  = first == ord('-') # so -00:30:00 stays negative
+   bad       = nfield > 3
+
+   # parse every field with a single C-level call.  A short read means at
+   # least one row is bad, so fall back to finding it row by row.  Spaces
+   # inside a row would add fields that can make up for a short row
+   # elsewhere, so rows with any whitespace always take the slow way.
+   fields = None
+   if not numpy.in1d(buf,_whitespace).any():
+      with warnings.catch_warnings():
+         warnings.simplefilter('ignore')
+         fields = numpy.fromstring(joined.replace(':',' '),
+            dtype=numpy.float64,sep=' ')
+   if fields is None or fields.shape[0] != nfield.sum():
+      fields = []
+      for i,t in enumerate(text):
+         try:
+            tmp = map(float,t.split(':'))
+         except ValueError:
+            tmp = [0.0]*nfield[i]
+            bad[i] = True
+         fields.extend(tmp)
+      fields = numpy.array(fields,dtype=numpy.float64)
+
+   # weight each field by 60**position within its row, then sum per row
+   offset   = numpy.cumsum(nfield) - nfield
+   rowfield = numpy.repeat(numpy.arange(nrow),nfield)
+   position = numpy.arange(fields.shape[0]) - offset[rowfield]
+   out = numpy.bincount(rowfield,weights=numpy.abs(fields)/60.0**position,
+      minlength=nrow)
+   if ctype == 'ra': # first value is hours, multiply by 15
+      out = numpy.where(nfield > 1,15*out,out)
+   out = numpy.where(negative,-out,out)
+   if bad.any():
+      if strict:
+         rows = numpy.nonzero(bad)[0]
+         msg = ', '.join(['%d (%s)' %(i,text[i]) for i in rows[:10]])
+         if rows.shape[0] > 10:
+            msg = msg + ', ...'
+         raise ValueError("Invalid sexagesimal value in row(s) %s" %msg)
+      out[bad] = numpy.nan
+   return out.reshape(values.shape)
+
+def _extNames(img):
+   """Return the lower-case extension names of a pyfits.HDUList as a list.
+      The primary HDU is called 'primary' unless it has an EXTNAME.  Files
+      on disk use nlcfits.findext() instead."""
+
+   names = [img[i].header.get('extname','').strip().lower() for i in xrange(1,len(img))]
+   if 'EXTNAME' in img[0].header.keys():
+      names.insert(0,img[0].header['extname'].strip().lower())
+   else:
+      names.insert(0,'primary')
+   return names
+
+def _fileName(fname):
+   """Name of the file for error messages"""
+
+   if isinstance(fname,str):
+      return fname
+   return fname.filename()
@@ -0,0 +1,311 @@
+#!/usr/bin/env python
+"""Light-weight access to FITS headers.
+
+Only the 2880-byte header blocks are read.  Data units are skipped with a
+seek, so pixel data is never touched no matter how large the file is.  This
+is much cheaper than pyfits.open() when all you need is a handful of
+keywords (e.g. the WCS) from one extension of a big multi-extension file.
+
+The module also keeps a process-wide LRU cache (see cached()) so parsed
+headers and WCS objects for the same file are built only once, as long as
+the file is not changed on disk."""
+
+from collections import OrderedDict
+import gzip
+import os
+
+_blocksize = 2880 # size of a FITS block in bytes
+_cardsize  = 80   # size of one header card in bytes
+
+_cache     = OrderedDict() # (kind,path,mtime,size,key) -> value, oldest first
+_cachesize = 64            # maximum number of entries in _cache
+_cachestat = {'hits' : 0, 'misses' : 0}
+
+# keywords _scanextnames() needs, besides NAXISn
+_scankeys  = ('EXTNAME','BITPIX','GCOUNT','GROUPS','PCOUNT')
+
+class fitsheader(dict):
+   """Keyword/value pairs of one FITS header.
+
+      Keys are stored in upper case, but lookups are case-insensitive like
+      a pyfits header.  COMMENT, HISTORY and blank cards are not stored as
+      keys.  Extra attributes:
+         cards    - list of the raw 80-character cards (without END)
+         offset   - byte offset of the start of the data unit in the file
+         datasize - size of the data unit in bytes (without padding)"""
+
+   def __init__(self,cards=(),offset=0):
+      dict.__init__(self)
+      self.cards    = list(cards)
+      self.offset   = offset
+      for card in self.cards:
+         key = card[:8].strip().upper()
+         if card[8:10] == '= ' and key not in ('COMMENT','HISTORY',''):
+            self[key] = _parsevalue(card[10:])
+      self.datasize = _datasize(self)
+
+   def __getitem__(self,key):
+      return dict.__getitem__(self,key.upper())
+
+   def __contains__(self,key):
+      return dict.__contains__(self,key.upper())
+
+   def get(self,key,default=None):
+      return dict.get(self,key.upper(),default)
+
+def cached(kind,filename,key,loader):
+   """Return loader() for filename, calling it only if there is no cached
+      value yet.
+
+      kind     - string naming what is cached, e.g. 'header' or 'pywcs'
+      filename - name of the file the value is derived from
+      key      - anything hashable that tells values for the same file
+                 apart, e.g. the extension
+      loader   - function with no arguments that builds the value
+
+      Entries are keyed by the real path, mtime and size of the file, so a
+      file that is rewritten gets reloaded.  Values are shared between all
+      callers and should not be modified."""
+
+   try:
+      st = os.stat(filename)
+   except (OSError,TypeError): # not a file on disk, nothing to key on
+      return loader()
+   index = (kind,os.path.realpath(filename),st.st_mtime,st.st_size,key)
+   if index in _cache:
+      _cachestat['hits'] += 1
+      value = _cache.pop(index) # re-insert to mark as most recently used
+   else:
+      _cachestat['misses'] += 1
+      value = loader()
+   _cache[index] = value
+   while len(_cache) > _cachesize:
+      _cache.popitem(last=False)
+   return value
+
+def cachedheader(filename,ext=0):
+   """Same as readheader(), but through the cache"""
+
+   return cached('header',filename,ext,lambda: readheader(filename,ext))
+
+def cacheinfo():
+   """Return a dictionary with the hits, misses, current size and maximum
+      size of the cache"""
+
+   return {'hits' : _cachestat['hits'], 'misses' : _cachestat['misses'],
+           'size' : len(_cache), 'maxsize' : _cachesize}
+
+def clearcache():
+   """Empty the cache and reset the hit/miss counters"""
+
+   _cache.clear()
+   _cachestat['hits'] = 0
+   _cachestat['misses'] = 0
+
+def setcachesize(n):
+   """Set the maximum number of cached entries.  0 disables caching."""
+
+   global _cachesize
+
+   _cachesize = max(int(n),0)
+   while len(_cache) > _cachesize:
+      _cache.popitem(last=False)
+
+def extmap(filename):
+   """Return (names,index) for filename, where names is the list of
+      lower-case extension names (the primary HDU is 'primary' unless it has
+      an EXTNAME, unnamed extensions are '') and index maps each name to the
+      zero-based number of the first HDU with that name.
+
+      Only the EXTNAME and size keywords of each header are looked at, and
+      the result is cached, so this is cheap even for files with hundreds of
+      extensions."""
+
+   return cached('extmap',filename,None,lambda: _scanextnames(filename))
+
+def findext(filename,ext):
+   """Convert ext to a zero-based extension number of filename.
+
+      ext can be an extension number starting from 1 (as an integer or a
+      string like '2', unless an extension is named '2'), an extension name
+      (case-insensitive), or a list/tuple of these, in which case a list is
+      returned.  All of them are resolved with a single, cached scan of the
+      file (see extmap()).
+
+      Raises IndexError if a number is out of range, KeyError if a name is
+      not found and TypeError for anything else."""
+
+   names,index = extmap(filename)
+   if isinstance(ext,(list,tuple)):
+      return [_resolveext(filename,names,index,e) for e in ext]
+   return _resolveext(filename,names,index,ext)
+
+def iterheaders(filename):
+   """Yield a fitsheader for every HDU in filename, in order."""
+
+   fp = _open(filename)
+   try:
+      while True:
+         head = _readhdu(fp)
+         if head is None:
+            break
+         yield head
+         _skipdata(fp,head)
+   finally:
+      fp.close()
+
+def readheader(filename,ext=0):
+   """Read the header of extension ext (zero-based) of filename without
+      reading any data.  Returns a fitsheader.
+
+      Raises IOError if the file is not FITS and IndexError if ext is
+      beyond the last HDU."""
+
+   for i,head in enumerate(iterheaders(filename)):
+      if i == ext:
+         return head
+   raise IndexError("Extension %d not found in %s!" %(ext,filename))
+
+### Private functions ###
+
+def _datasize(head):
+   """Size in bytes of the data unit described by head, without padding"""
+
+   naxis = head.get('NAXIS',0)
+   if naxis == 0:
+      return 0
+   axes = [head.get('NAXIS%d' %i,0) for i in range(1,naxis+1)]
+   if axes[0] == 0 and head.get('GROUPS',False): # random groups
+      axes = axes[1:]
+   npix = 1
+   for n in axes:
+      npix = npix*n
+   nbytes = abs(head.get('BITPIX',8))//8
+   return nbytes*head.get('GCOUNT',1)*(head.get('PCOUNT',0) + npix)
+
+def _open(filename):
+   """Open filename for binary reading, understanding gzipped files"""
+
+   if not os.path.exists(filename):
+      raise IOError("File %s does not exist!" %filename)
+   if filename.endswith('.gz'):
+      return gzip.open(filename,'rb')
+   return open(filename,'rb')
+
+def _parsevalue(text):
+   """Convert the value part of a card (columns 11-80) to a python value"""
+
+   text = text.strip()
+   if text.startswith("'"): # string, '' is an embedded quote
+      value = []
+      i = 1
+      while i < len(text):
+         if text[i] == "'":
+            if text[i+1:i+2] == "'":
+               value.append("'")
+               i += 2
+               continue
+            break
+         value.append(text[i])
+         i += 1
+      return ''.join(value).rstrip()
+   text = text.split('/',1)[0].strip()
+   if text == 'T':
+      return True
+   elif text == 'F':
+      return False
+   try:
+      return int(text)
+   except ValueError:
+      pass
+   try:
+      return float(text.replace('D','E'))
+   except ValueError:
+      return text
+
+def _readhdu(fp):
+   """Read header blocks from the current position of fp up to and
+      including the END card.  Returns a fitsheader, or None at the end of
+      the file."""
+
+   start = fp.tell()
+   cards = []
+   while True:
+      block = fp.read(_blocksize)
+      if len(block) == 0 and len(cards) == 0:
+         return None
+      if len(block) < _blocksize:
+         raise IOError("Truncated FITS header in %s!" %getattr(fp,'name','file'))
+      for i in range(0,_blocksize,_cardsize):
+         card = block[i:i+_cardsize]
+         if start == 0 and len(cards) == 0 and not card.startswith('SIMPLE'):
+            raise IOError("%s is not a FITS file!" %getattr(fp,'name','file'))
+         if card[:8].rstrip() == 'END':
+            return fitsheader(cards,fp.tell())
+         cards.append(card)
+
+def _resolveext(filename,names,index,ext):
+   """Resolve one extension number or name for findext()"""
+
+   if isinstance(ext,str):
+      if ext.strip().lower() in index: # names win, e.g. an EXTNAME of '2'
+         return index[ext.strip().lower()]
+      try:
+         ext = int(ext)
+      except ValueError:
+         raise KeyError("Extension name '%s' not found in %s!" %(ext,filename))
+   if isinstance(ext,(int,long)) and not isinstance(ext,bool):
+      if 1 <= ext <= len(names):
+         return ext - 1
+      raise IndexError("Extension number must be in range %d-%d for %s!" %(1,len(names),filename))
+   raise TypeError("Extension must be an integer or string!")
+
+def _scanextnames(filename):
+   """Scan the header blocks of filename for extmap(), only parsing the
+      keywords needed to find the names and skip the data units"""
+
+   names = []
+   fp = _open(filename)
+   try:
+      while True:
+         start = fp.tell()
+         keys = {}
+         done = False
+         while not done:
+            block = fp.read(_blocksize)
+            if len(block) == 0 and start == fp.tell():
+               break
+            if len(block) < _blocksize:
+               raise IOError("Truncated FITS header in %s!" %filename)
+            if start == 0 and len(keys) == 0 and not block.startswith('SIMPLE'):
+               raise IOError("%s is not a FITS file!" %filename)
+            for i in range(0,_blocksize,_cardsize):
+               key = block[i:i+8].rstrip()
+               if key == 'END':
+                  done = True
+                  break
+               if key in _scankeys or key.startswith('NAXIS'):
+                  keys[key] = _parsevalue(block[i+10:i+_cardsize])
+         if not done:
+            break
+         if 'EXTNAME' in keys:
+            names.append(str(keys['EXTNAME']).strip().lower())
+         elif start == 0:
+            names.append('primary')
+         else:
+            names.append('')
+         nblocks = (_datasize(keys) + _blocksize - 1)//_blocksize
+         fp.seek(fp.tell() + nblocks*_blocksize)
+   finally:
+      fp.close()
+   index = {}
+   for i,name in enumerate(names):
+      if name != '' and name not in index:
+         index[name] = i
+   return names,index
+
+def _skipdata(fp,head):
+   """Seek past the data unit (including padding) that follows head"""
+
+   nblocks = (head.datasize + _blocksize - 1)//_blocksize
+   fp.seek(head.offset + nblocks*_blocksize)
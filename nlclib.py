@@ -3,6 +3,11 @@
 import commands,math,sys
 import tempfile,os
 import re
+import json,time
+try: # only needed by the array functions, e.g. readchunks(), inside(), bindata()
+   import numpy
+except ImportError:
+   numpy = None
 
 def band2wave(band):
    """Given a bandname return the central wavelength in microns as a string"""
@@ -28,6 +33,94 @@ def band2wave(band):
    else:
       error('Unsupported band %s. Try U,B,V,R,I,Z,J,H,Ks,K,IR1-IR4,MP1-MP3' %band)
 
+def bindata(x,y=None,width=None,edges=None,count=None,origin=0.0,col=(1,2),
+   comment='#',chunksize=65536):
+   '''Bin y as a function of x in python, instead of running nemo's tabbin.
+
+      x,y       - numpy arrays (or lists), or x can be a filename (or - for
+                  stdin) in which case columns col are read a chunk at a time
+                  so the file never has to fit in memory
+      width     - fixed bin width.  Bins are [origin+k*width,origin+(k+1)*width)
+      edges     - explicit bin edges, sorted.  Points outside are ignored.
+      count     - number of points per bin.  The edges come from the sorted
+                  x values, so unlike width and edges this keeps every x
+                  value in memory (just the x column for a file); the data
+                  are still binned a chunk at a time.  Ties are never split,
+                  so if all x are equal there is a single bin.
+      origin    - starting point of the width bins
+      col       - x and y column numbers (starting from 1) when x is a filename
+      comment   - comment character for the file
+      chunksize - number of points handled at a time
+
+      Exactly one of width, edges and count has to be given.  Returns a
+      dictionary of numpy arrays, one element per non-empty bin, with the
+      same keys as tabbin(): xvalue (bin centre), number, x, dx (error in the
+      mean), stdx, y, dy, stdy.  If y is not given, y is the same as x.'''
+
+   if numpy is None:
+      error('bindata() needs numpy!')
+   if [v is None for v in (width,edges,count)].count(False) != 1:
+      error('bindata(): Give one of width, edges or count!')
+   if isinstance(x,str):
+      chunks = lambda: readchunks(x,col,float,comment,chunksize)
+   else:
+      xarr = numpy.asarray(x,dtype=numpy.float64).ravel()
+      yarr = xarr if y is None else numpy.asarray(y,dtype=numpy.float64).ravel()
+      if xarr.shape != yarr.shape:
+         error('bindata(): x and y must have the same size!')
+      chunks = lambda: ((xarr[i:i+chunksize],yarr[i:i+chunksize])
+         for i in xrange(0,max(xarr.shape[0],1),chunksize))
+   if count is not None:
+      if count < 1:
+         error('bindata(): count must be at least 1!')
+      xsort = numpy.sort(numpy.concatenate([c[0] for c in chunks()]))
+      xsort = xsort[numpy.isfinite(xsort)]
+      if xsort.shape[0] == 0:
+         error('bindata(): count given, but there are no finite x values!')
+      edges = numpy.append(xsort[::int(count)],xsort[-1:])
+      edges = numpy.unique(edges) # ties can not be split between bins
+      if edges.shape[0] == 1: # all x equal, the bin [x,x] holds them all
+         edges = numpy.append(edges,edges)
+   elif edges is not None:
+      edges = numpy.asarray(edges,dtype=numpy.float64)
+      if edges.shape[0] < 2 or numpy.any(numpy.diff(edges) <= 0):
+         error('bindata(): edges must be sorted with at least two values!')
+   elif width <= 0:
+      error('bindata(): width must be positive!')
+
+   # running count, mean and sum of squared deviations for every bin, merged
+   # chunk by chunk so the variance stays accurate for large offsets
+   first = 0 # bin number of element 0 of the accumulators
+   acc = numpy.zeros((5,0))
+   for xc,yc in chunks():
+      k,good = _binindex(xc,width,edges,origin)
+      if k.shape[0] == 0:
+         continue
+      xc,yc = xc[good],yc[good]
+      if acc.shape[1] == 0:
+         first = k.min()
+      lo,hi = min(first,k.min()),max(first+acc.shape[1],k.max()+1)
+      if lo < first or hi > first + acc.shape[1]:
+         tmp = numpy.zeros((5,hi-lo))
+         tmp[:,first-lo:first-lo+acc.shape[1]] = acc
+         acc,first = tmp,lo
+      _binmerge(acc,k-first,xc,yc)
+
+   n = acc[0]
+   use = n > 0
+   idx = numpy.nonzero(use)[0] + first
+   if edges is None:
+      centre = origin + (idx + 0.5)*width
+   else:
+      centre = 0.5*(edges[idx] + edges[idx+1])
+   n = n[use]
+   with numpy.errstate(all='ignore'):
+      stdx = numpy.where(n > 1,numpy.sqrt(acc[2][use]/(n - 1)),0.0)
+      stdy = numpy.where(n > 1,numpy.sqrt(acc[4][use]/(n - 1)),0.0)
+   return {'xvalue' : centre, 'number' : n, 'x' : acc[1][use],
+      'dx' : stdx/numpy.sqrt(n), 'stdx' : stdx, 'y' : acc[3][use],
+      'dy' : stdy/numpy.sqrt(n), 'stdy' : stdy}
+
 def check_exist(*files):
    """Given an input file name as a string or a list of filenames will check to
       make sure each file exists.  If not, a fatal error will occur using
@@ -120,15 +213,23 @@ def flux2mag(flux,unc,band):
 def func(x,pars,fit):
    '''Return a list of y values given x values, using pars and the fit type.
    
-      Used in conjunction with tabnllsqfit'''
-      
-   if fit == 'line':
-      y = map(lambda a: pars[0][0] + pars[1][0]*a,x)
-   elif fit == 'gauss1d':
-      y = map(lambda a: pars[0][0] + pars[1][0]*math.exp(-(a-pars[2][0])**2/(2*pars[3][0]**2)),x)
-   return y
+      Used in conjunction with tabnllsqfit and nllsqfit.  pars is a list of
+      [value,error] pairs (or just values), or the dictionary returned by
+      those functions.  If x is a numpy array, a numpy array is returned.'''
 
-def inside(px,py,datax=None,datay=None,out=False,mask=False):
+   if fit not in _models:
+      error('func(): Unknown fit type %s!  Try %s' %(fit,', '.join(sorted(_models))))
+   if isinstance(pars,dict):
+      pars = [pars[c] for c in _parnames[:_models[fit][2]]]
+   p = [a[0] if isinstance(a,(list,tuple)) else a for a in pars]
+   y = _models[fit][0](numpy.asarray(x,dtype=numpy.float64),
+      numpy.array(p,dtype=numpy.float64)[numpy.newaxis,:])
+   if isinstance(x,numpy.ndarray):
+      return y.reshape(numpy.shape(x))
+   return y.ravel().tolist()
+
+def inside(px,py,datax=None,datay=None,out=False,mask=False,chunksize=65536,
+   index=None):
    """Determine which data points, datax,datay, are inside the polygon specified
       by vertices px,py.
       
@@ -147,46 +248,46 @@ def inside(px,py,datax=None,datay=None,out=False,mask=False):
       3 arguments = px, py are 1D arrays of polygon vertices, datax is a 2D
       array of data points.
       
-      4 arguments = px,py,datax,datay are all 1D numpy arrays"""
+      4 arguments = px,py,datax,datay are all 1D numpy arrays
+
+      Points are tested with the even-odd crossing number rule, chunksize
+      points at a time, so memory use does not grow with the number of
+      vertices.  Points outside the bounding box of the polygon are rejected
+      first.  index sets whether each chunk is sorted by y so every edge
+      only looks at the points in its own y range.  This is a big win for
+      polygons with many vertices.  None (the default) decides based on the
+      number of vertices."""
    
-   ncol = px.shape[0]
-   polyx = ones(ncol+1)
-   polyy = ones(ncol+1)
+   if numpy is None:
+      error('inside() needs numpy!')
    if datax is None and datay is None:
-      nrow = py.shape[0]
+      polyx = numpy.asarray(px[:,0],dtype=numpy.float64)
+      polyy = numpy.asarray(px[:,1],dtype=numpy.float64)
       d0 = py[:,0]
       d1 = py[:,1]
-      polyx[:-1] = px[:,0]
-      polyx[-1]  = px[0,0]
-      polyy[:-1] = py[:,1]
-      polyy[-1]  = py[0,1]
    elif datax is not None and datay is None:
-      nrow = datax.shape[0]
+      polyx = numpy.asarray(px,dtype=numpy.float64)
+      polyy = numpy.asarray(py,dtype=numpy.float64)
       d0 = datax[:,0]
       d1 = datax[:,1]
-      polyx[:-1] = px
-      polyx[-1]  = px[0]
-      polyy[:-1] = py
-      polyy[-1]  = py[0]
    else:
-      nrow = datax.shape[0]
+      polyx = numpy.asarray(px,dtype=numpy.float64)
+      polyy = numpy.asarray(py,dtype=numpy.float64)
       d0 = datax
       d1 = datay
-      polyx[:-1] = px
-      polyx[-1]  = px[0]
-      polyy[:-1] = py
-      polyy[-1]  = py[0]
-
-   # tile and broadcast to 2D arrays
-   X1 = tile(polyx[:-1],(nrow,1)) - ones(ncol)*d0[:,newaxis]
-   X2 = tile(polyx[1:],(nrow,1))  - ones(ncol)*d0[:,newaxis]
-   Y1 = tile(polyy[:-1],(nrow,1)) - ones(ncol)*d1[:,newaxis]
-   Y2 = tile(polyy[1:],(nrow,1))  - ones(ncol)*d1[:,newaxis]
-
-   theta = abs(sum(arctan2(X1*Y2 - Y1*X2,X1*X2 + Y1*Y2),1))
-   mask1 = where(theta > pi)
+   if index is None:
+      index = polyx.shape[0] > 8
+
+   nrow = d0.shape[0]
+   isin = numpy.zeros(nrow,dtype=bool)
+   for i in xrange(0,nrow,chunksize):
+      x = numpy.asarray(d0[i:i+chunksize],dtype=numpy.float64)
+      y = numpy.asarray(d1[i:i+chunksize],dtype=numpy.float64)
+      isin[i:i+chunksize] = _crossings(polyx,polyy,x,y,index)
+
+   mask1 = numpy.where(isin)
    if out is True:
-      mask2 = where(theta <= pi)
+      mask2 = numpy.where(~isin)
       if mask is True:
          return mask1,mask2
       elif datax is None and datay is None:
@@ -218,6 +319,113 @@ def mag2flux(mag,dmag,band):
    dflux = 0.4*math.log(10)*flux*float(dmag)
    return flux,dflux
 
+def addmodel(name,model,npar,jacobian=None,guess=None):
+   '''Add a model for nllsqfit() and func().
+
+      name     - name of the model, used as the fit keyword
+      model    - function model(x,p) returning y.  x has shape (nspec,npoint)
+                 (or (1,npoint) when shared) and p has shape (nspec,npar), so
+                 use p[:,0:1] etc. for the parameters.
+      npar     - number of parameters (at most 5, they are called a-e)
+      jacobian - optional function jacobian(x,p) returning dy/dp with shape
+                 (nspec,npoint,npar).  Computed numerically if not given.
+      guess    - optional function guess(x,y) returning initial parameters
+                 with shape (nspec,npar)'''
+
+   if npar > len(_parnames):
+      error('addmodel(): Models can have at most %d parameters!' %len(_parnames))
+   _models[name] = (model,jacobian,npar,guess)
+
+def nllsqfit(x,y,fit='line',initial=None,dy=None,maxiter=200,tol=1e-10):
+   '''Fit a model to data with the Levenberg-Marquardt method, in python
+      instead of running nemo's tabnllsqfit.
+
+      x,y     - 1D numpy arrays, or 2D (nspec,npoint) arrays to fit many
+                independent spectra in one call.  x can stay 1D if all
+                spectra share it.
+      fit     - model name, line (a+b*x), gauss1d
+                (a+b*exp(-(x-c)**2/(2*d**2))) or one added with addmodel()
+      initial - initial parameters, as a list or (nspec,npar) array.
+                Estimated from the data if not given.
+      dy      - uncertainties in y, same shape as y.  If not given, the
+                parameter errors are scaled by the reduced chi-square.
+      maxiter - maximum number of iterations
+      tol     - stop once chi-square improves by less than this fraction
+
+      Returns a dictionary like tabnllsqfit, keys a,b,c... with [value,error].
+      For 2D input the value and error are arrays with one entry per
+      spectrum.'''
+
+   if numpy is None:
+      error('nllsqfit() needs numpy!')
+   if fit not in _models:
+      error('nllsqfit(): Unknown fit type %s!  Try %s' %(fit,', '.join(sorted(_models))))
+   model,jacobian,npar,guess = _models[fit]
+   if jacobian is None:
+      jacobian = lambda x,p: _numjacobian(model,x,p)
+
+   single = numpy.ndim(y) == 1
+   y = numpy.atleast_2d(numpy.asarray(y,dtype=numpy.float64))
+   x = numpy.atleast_2d(numpy.asarray(x,dtype=numpy.float64))
+   nspec,npoint = y.shape
+   if dy is None:
+      w = numpy.ones_like(y)
+   else:
+      w = numpy.ones_like(y)/numpy.asarray(dy,dtype=numpy.float64)
+   if initial is not None:
+      p = numpy.array(initial,dtype=numpy.float64).reshape(-1,npar)
+      p = p*numpy.ones((nspec,1))
+   elif guess is not None:
+      p = guess(x,y)
+   else:
+      p = numpy.ones((nspec,npar))
+
+   # fit all spectra at once.  Each spectrum has its own damping lam, and
+   # only the ones that have not converged yet are computed.
+   r    = (y - model(x,p))*w
+   chi2 = numpy.sum(r**2,axis=1)
+   lam  = 1e-3*numpy.ones(nspec)
+   active = numpy.isfinite(chi2)
+   diag = numpy.arange(npar)
+   for i in xrange(maxiter):
+      idx = numpy.nonzero(active)[0]
+      if idx.shape[0] == 0:
+         break
+      xa = x if x.shape[0] == 1 else x[idx]
+      wa = w[idx]
+      J = jacobian(xa,p[idx])*wa[:,:,numpy.newaxis]
+      A = numpy.einsum('ijk,ijl->ikl',J,J)
+      A[:,diag,diag] *= (1 + lam[idx])[:,numpy.newaxis]
+      dp = _batchsolve(A,numpy.einsum('ijk,ij->ik',J,r[idx]))
+      with numpy.errstate(all='ignore'):
+         pnew = p[idx] + dp
+         rnew = (y[idx] - model(xa,pnew))*wa
+         chi2new = numpy.sum(rnew**2,axis=1)
+      better = chi2new <= chi2[idx]
+      done = better & (chi2[idx] - chi2new <= tol*chi2[idx])
+      keep = idx[better]
+      p[keep] = pnew[better]
+      r[keep] = rnew[better]
+      chi2[keep] = chi2new[better]
+      lam[idx] = numpy.where(better,lam[idx]/10.0,lam[idx]*10.0)
+      active[idx[done]] = False
+      active &= lam < 1e16
+
+   # errors from the curvature matrix at the best fit
+   J = jacobian(x,p)*w[:,:,numpy.newaxis]
+   cov = _batchinverse(numpy.einsum('ijk,ijl->ikl',J,J))
+   err = numpy.sqrt(numpy.abs(cov[:,diag,diag]))
+   if dy is None and npoint > npar:
+      err = err*numpy.sqrt(chi2/(npoint - npar))[:,numpy.newaxis]
+
+   data = {}
+   for k in range(npar):
+      if single:
+         data[_parnames[k]] = [float(p[0,k]),float(err[0,k])]
+      else:
+         data[_parnames[k]] = [p[:,k],err[:,k]]
+   return data
+
 def nlcopen(filename,fmt='r'):
    '''Attempt to open a file for reading or writing.  Checks for existance of
       file and also understands a dash to be stdin/stdout and a period to be
@@ -247,22 +455,258 @@ def nlcopen(filename,fmt='r'):
    return fp
 
 class progressbar:
-   def __init__(self,text,maxval):
-      '''Create a new progress bar instance'''
+   _maxstride = 10 # most items between looks at the clock
+
+   def __init__(self,text,maxval=None,interval=0.5,logfile=None,quiet=False):
+      '''Create a new progress bar instance
+
+         text     - label written in front of the progress
+         maxval   - total number of items, or None if not known in advance
+                    (then only the count and rate are shown)
+         interval - minimum number of seconds between writes
+         logfile  - file name or open file to also write one JSON object
+                    per report to, e.g. for tracking throughput of batch jobs
+         quiet    - set to True to not write anything to stderr'''
       self._msgtext  = text
-      self._stepsize = 100.0/maxval
-      self._percent  = 0.0
-      self._backspace = '\b\b\b\b'
-      sys.stderr.write("%s %3d%%" %(self._msgtext,int(self._percent)))
+      self._maxval   = maxval
+      self._interval = interval
+      self._quiet    = quiet
+      self._count    = 0
+      self._start    = time.time()
+      self._last     = self._start # time of the last report
+      self._checked  = self._start # time of the last look at the clock
+      self._checkn   = 0           # count at the last look at the clock
+      self._next     = 1           # count at which to look at the clock again
+      self._ownlog   = isinstance(logfile,str) # close it in finish()
+      if self._ownlog:
+         self._log = open(logfile,'a')
+      else:
+         self._log = logfile
+      if quiet and self._log is None: # nothing to report, never check
+         self._next = float('inf')
+      if not quiet:
+         self._write(0,0.0)
       
+   def increment(self,n=1):
+      '''Add n items to the count, for streams where only the number of new
+         items is known'''
+      self.update(self._count + n)
+
    def update(self,size):
-      '''Update the current percent complete for this progress bar'''
-      if (size*self._stepsize > self._percent):
-         self._percent = self._percent + self._stepsize
-         sys.stderr.write("%s%3d%%" %(self._backspace,int(self._percent)))
-   def finish(self):
-      '''Ensure progress bar finished at 100%'''
-      sys.stderr.write("%s%3d%%\n" %(self._backspace,100))
+      '''Update the number of items done for this progress bar.  This is
+         cheap to call for every item, the clock is only read every so many
+         items and output is limited to once per interval.'''
+      self._count = size
+      if size < self._next:
+         return
+      now = time.time()
+      # look at the clock again after about a tenth of an interval's worth
+      # of items, based on the rate since the last look.  The stride is
+      # capped so a slowdown is seen within a few items, not after the
+      # thousands a fast stream would allow.
+      rate = (size - self._checkn)/max(now - self._checked,1e-9)
+      self._checked = now
+      self._checkn = size
+      self._next = size + max(1,min(int(0.1*self._interval*rate),
+         self._maxstride))
+      if now - self._last >= self._interval:
+         self._last = now
+         self._report(size,now)
+
+   def finish(self,size=None):
+      '''Ensure progress bar finished at 100%.  size is the final count if
+         it differs from the last update().  A logfile given by name is
+         closed.'''
+      if size is not None:
+         self._count = size
+      elif self._maxval is not None:
+         self._count = max(self._count,self._maxval)
+      self._report(self._count,time.time(),done=True)
+      if not self._quiet:
+         sys.stderr.write('\n')
+      if self._ownlog:
+         self._log.close()
+      elif self._log is not None:
+         self._log.flush()
+
+   def _report(self,size,now,done=False):
+      '''Write the current state to stderr and the log file'''
+      elapsed = now - self._start
+      if not self._quiet:
+         self._write(size,elapsed)
+      if self._log is not None:
+         rate = size/max(elapsed,1e-9)
+         eta = None
+         if self._maxval is not None and rate > 0 and not done:
+            eta = max(self._maxval - size,0)/rate
+         self._log.write(json.dumps({'name' : self._msgtext, 'count' : size,
+            'total' : self._maxval, 'elapsed' : round(elapsed,3),
+            'rate' : round(rate,3), 'eta' : eta, 'done' : done}) + '\n')
+
+   def _write(self,size,elapsed):
+      '''Rewrite the progress line on stderr'''
+      rate = size/max(elapsed,1e-9)
+      if self._maxval is None:
+         sys.stderr.write("\r%s %d items %.1f/s %s" %(self._msgtext,size,rate,
+            _hms(elapsed)))
+      else:
+         percent = 100.0*min(size,self._maxval)/max(self._maxval,1)
+         if rate > 0:
+            eta = _hms(max(self._maxval - size,0)/rate)
+         else:
+            eta = '--:--:--'
+         sys.stderr.write("\r%s %3d%% %d/%d %.1f/s ETA %s" %(self._msgtext,
+            int(percent),size,self._maxval,rate,eta))
+      sys.stderr.flush()
+
+class regionset:
+   def __init__(self,polygons,cellsize=None):
+      '''Index many polygons at once, so points can be labeled with the
+         polygon they fall in using a single pass over the points.
+
+         polygons - list of polygons.  Each is a 2D (n,2) array of vertices,
+                    a pair of 1D arrays px,py, or a pyregion polygon shape
+                    (anything with name 'polygon' and a coord_list of
+                    x1,y1,x2,y2,...).  A pyregion ShapeList works directly.
+         cellsize - size of the cells of the grid index, in the same units
+                    as the vertices.  Defaults to a grid of about 4 cells
+                    per polygon over the area covered by the polygons.'''
+      if numpy is None:
+         error('regionset needs numpy!')
+      self.polyx = []
+      self.polyy = []
+      for p in polygons:
+         px,py = _polygonvertices(p)
+         self.polyx.append(px)
+         self.polyy.append(py)
+      n = len(self.polyx)
+      if n == 0:
+         error('regionset needs at least one polygon!')
+      self.bbox = numpy.array([(px.min(),px.max(),py.min(),py.max()) for px,py
+         in zip(self.polyx,self.polyy)])
+
+      # grid over the bounding box of all polygons.  Each polygon is listed in
+      # every cell its own bounding box touches.
+      self.xmin = self.bbox[:,0].min()
+      self.ymin = self.bbox[:,2].min()
+      width  = max(self.bbox[:,1].max() - self.xmin,1e-12)
+      height = max(self.bbox[:,3].max() - self.ymin,1e-12)
+      if cellsize is None:
+         cellsize = max(width,height)/math.ceil(2*math.sqrt(n))
+      self.cellsize = float(cellsize)
+      self.nx = int(width/self.cellsize) + 1
+      self.ny = int(height/self.cellsize) + 1
+      self.cells = [] # list of grid cell numbers for each polygon
+      for xlo,xhi,ylo,yhi in self.bbox:
+         i0,i1 = [int((v - self.xmin)/self.cellsize) for v in (xlo,xhi)]
+         j0,j1 = [int((v - self.ymin)/self.cellsize) for v in (ylo,yhi)]
+         i = numpy.arange(min(i0,self.nx-1),min(i1,self.nx-1)+1)
+         j = numpy.arange(min(j0,self.ny-1),min(j1,self.ny-1)+1)
+         self.cells.append((j[:,numpy.newaxis]*self.nx + i).ravel())
+
+   def __len__(self):
+      return len(self.polyx)
+
+   def label(self,x,y,chunksize=1048576):
+      '''Return an integer array with the number (starting from zero, in the
+         order given to regionset()) of the first polygon containing each
+         point x,y, or -1 for points outside all polygons.'''
+      x = numpy.asarray(x,dtype=numpy.float64).ravel()
+      y = numpy.asarray(y,dtype=numpy.float64).ravel()
+      labels = -numpy.ones(x.shape[0],dtype=numpy.intp)
+      for start in xrange(0,x.shape[0],chunksize):
+         xc = x[start:start+chunksize]
+         yc = y[start:start+chunksize]
+         tmp = labels[start:start+chunksize]
+         for n,idx,hit in self._candidates(xc,yc):
+            idx = idx[hit]
+            tmp[idx[tmp[idx] < 0]] = n
+      return labels
+
+   def members(self,x,y):
+      '''Return a list with, for every polygon, a 1D array of the indices of
+         the points x,y inside it.  Unlike label(), a point inside several
+         overlapping polygons is listed for each of them.'''
+      x = numpy.asarray(x,dtype=numpy.float64).ravel()
+      y = numpy.asarray(y,dtype=numpy.float64).ravel()
+      tmp = [numpy.zeros(0,dtype=numpy.intp) for p in self.polyx]
+      for n,idx,hit in self._candidates(x,y):
+         tmp[n] = numpy.sort(idx[hit])
+      return tmp
+
+   def _candidates(self,x,y):
+      '''Generator yielding polygon number, indices of the points in the grid
+         cells of that polygon and whether each of them is inside it'''
+      i = numpy.floor((x - self.xmin)/self.cellsize)
+      j = numpy.floor((y - self.ymin)/self.cellsize)
+      good = (i >= 0) & (i < self.nx) & (j >= 0) & (j < self.ny)
+      cell = numpy.where(good,j*self.nx + i,-1).astype(numpy.intp)
+
+      # sort points by cell, so the points in a cell are one slice of order
+      order = numpy.argsort(cell,kind='mergesort')
+      count = numpy.bincount(cell[good],minlength=self.nx*self.ny)
+      first = numpy.concatenate(([0],numpy.cumsum(count))) + (~good).sum()
+      for n in range(len(self.polyx)):
+         idx = [order[first[c]:first[c+1]] for c in self.cells[n] if count[c] > 0]
+         if len(idx) == 0:
+            continue
+         idx = numpy.concatenate(idx)
+         hit = _crossings(self.polyx[n],self.polyy[n],x[idx],y[idx],
+            self.polyx[n].shape[0] > 8)
+         yield n,idx,hit
+
+def readarrays(filename,col,dtype=float,comment='#',chunksize=65536):
+   '''Same as readchunks(), but returns whole numpy arrays instead of chunks.
+      Only the requested columns are ever kept in memory.'''
+
+   cols = _columns(col)
+   data = [[] for c in cols]
+   for chunk in readchunks(filename,[c+1 for c in cols],dtype,comment,chunksize):
+      for d,c in zip(data,chunk):
+         d.append(c)
+   dtype = _numpytype(dtype)
+   tmp = [numpy.concatenate(d) if len(d) > 0 else numpy.zeros(0,dtype=dtype)
+      for d in data]
+   if isinstance(col,(list,tuple)):
+      return tuple(tmp)
+   return tmp[0]
+
+def readchunks(filename,col,dtype=float,comment='#',chunksize=65536):
+   '''Generator that reads a file a piece at a time and yields numpy arrays
+      for the given column number(s), with at most chunksize rows each.  Only
+      the requested columns are converted, so memory use does not depend on
+      the size of the file.
+
+      filename  - name of file to read, or - for stdin
+      col       - column number (starting from 1), or a list/tuple of them
+      dtype     - numpy type of the arrays.  Also understands 'str', 'int'
+                  and 'float' like readcolumns()
+      comment   - ignore parts of lines after this character (set to None
+                  to use the entire line)
+      chunksize - number of rows in each chunk
+
+      Yields one array for a single column, or a tuple of arrays for a
+      list/tuple of columns.'''
+
+   if numpy is None:
+      error('readchunks() needs numpy!')
+   cols    = _columns(col)
+   dtype   = _numpytype(dtype)
+   comment = _commentchar(comment)
+   fp = nlcopen(filename)
+   try:
+      rows = []
+      for line in fp:
+         tmp = line.partition(comment)[0].split()
+         if len(tmp) > 0:
+            rows.append(tmp)
+            if len(rows) == chunksize:
+               yield _chunk(rows,cols,dtype,col)
+               rows = []
+      if len(rows) > 0:
+         yield _chunk(rows,cols,dtype,col)
+   finally:
+      fp.close()
 
 def readcolumns(filename,col,dtype='str',comment='#'):
    '''Reads a file and return a list(s) for a given
@@ -272,29 +716,26 @@ def readcolumns(filename,col,dtype='str',comment='#'):
 
    if dtype not in ('str','int','float'):
       error('value parameter must be str, int, or float!')
-      
-   data = readdata(filename,comment)
 
-   if isinstance(col,(str,int)):
-      x = int(col) - 1
-      tmp = [line[x] for line in data]
-      if dtype == 'int':
-         tmp = map(int,tmp)
-      elif dtype == 'float':
-         tmp = map(float,tmp)
-   elif isinstance(col,(list,tuple)):
-      tmp = []
-      for i in col:
-         x = int(i) - 1
-         junk = [line[x] for line in data]
-         if dtype == 'int':
-            junk = map(int,junk)
-         elif dtype == 'float':
-            junk = map(float,junk)
-         tmp.append(junk)
-   else:
-      error('col must be a string, integer, list, or tuple!')
-   return tmp   
+   # single pass over the file, only keeping the requested columns
+   cols    = _columns(col)
+   comment = _commentchar(comment)
+   data    = [[] for c in cols]
+   fp = nlcopen(filename)
+   for line in fp:
+      tmp = line.partition(comment)[0].split()
+      if len(tmp) > 0:
+         for d,x in zip(data,cols):
+            d.append(tmp[x])
+   fp.close()
+
+   if dtype == 'int':
+      data = [map(int,d) for d in data]
+   elif dtype == 'float':
+      data = [map(float,d) for d in data]
+   if isinstance(col,(list,tuple)):
+      return data
+   return data[0]
 
 def readdata(filename,comment='#',split=True,dtype=str):
    """Read a data file, ignore all the comment lines, and split lines
@@ -304,18 +745,14 @@ def readdata(filename,comment='#',split=True,dtype=str):
                  to use the entire line)
       split    - If true, split each line by whitespace before appending"""
 
-   # set null comment strings to something that can be used by partition()
-   if comment is None:
-      comment = '\n'
-   elif comment == '':
-      comment = '\n'
+   comment = _commentchar(comment)
 
    fp = nlcopen(filename)
    if split:
-      tmp  = [line.partition(comment)[0].split() for line in fp]
+      tmp  = (line.partition(comment)[0].split() for line in fp)
       data = [map(dtype,a) for a in tmp if len(a) > 0]
    else:
-      tmp  = [line.partition(comment)[0].strip() for line in fp]
+      tmp  = (line.partition(comment)[0].strip() for line in fp)
       data = [dtype(a) for a in tmp if len(a) > 0]
    fp.close()
    return data
@@ -402,7 +839,8 @@ def smart_sort(a, b):
 def tabbin(cmd):
    """Run tabbin and return output as a dictionary.
    
-      Keys are: xvalue, number, x, dx, stdx, y, dy, stdy"""
+      Keys are: xvalue, number, x, dx, stdx, y, dy, stdy.  See bindata() to
+      do the same in python without running nemo."""
    
    data = {'xvalue' : [], 'number' : [], 'x' : [], 'dx' : [], 'stdx' : [],
       'y' : [], 'dy' : [], 'stdy' : []}
@@ -466,6 +904,143 @@ def _findfzero(band):
       sys.exit()
    return F0
 
+def _batchinverse(A):
+   '''Invert a stack of matrices, using the pseudo-inverse if any of them
+      are singular'''
+
+   try:
+      return numpy.linalg.inv(A)
+   except numpy.linalg.LinAlgError:
+      return numpy.linalg.pinv(A)
+
+def _batchsolve(A,b):
+   '''Solve a stack of linear systems A x = b, using the pseudo-inverse if
+      any of them are singular'''
+
+   try:
+      return numpy.linalg.solve(A,b[:,:,numpy.newaxis])[:,:,0]
+   except numpy.linalg.LinAlgError:
+      return numpy.einsum('ikl,il->ik',numpy.linalg.pinv(A),b)
+
+def _binindex(x,width,edges,origin):
+   '''Return the bin number of every finite x that falls in a bin, and the
+      mask of those x'''
+
+   with numpy.errstate(invalid='ignore'):
+      if edges is None:
+         k = numpy.floor((x - origin)/width)
+         good = numpy.isfinite(k)
+      else:
+         k = numpy.searchsorted(edges,x,side='right') - 1
+         k[x == edges[-1]] = edges.shape[0] - 2 # last bin includes its edge
+         good = (k >= 0) & (k < edges.shape[0] - 1) & numpy.isfinite(x)
+   return k[good].astype(numpy.int64),good
+
+def _binmerge(acc,k,x,y):
+   '''Merge the per-bin statistics of one chunk into acc, which holds the
+      count, mean x, squared deviations of x, mean y and squared deviations
+      of y of every bin (Chan et al. parallel variance)'''
+
+   size = acc.shape[1]
+   n = numpy.bincount(k,minlength=size).astype(numpy.float64)
+   has = n > 0
+   ntot = acc[0] + n
+   with numpy.errstate(all='ignore'):
+      for i,v in ((1,x),(3,y)):
+         mean = numpy.where(has,numpy.bincount(k,v,size)/n,0.0)
+         m2 = numpy.bincount(k,(v - mean[k])**2,size)
+         delta = mean - acc[i]
+         acc[i] = numpy.where(has,acc[i] + delta*n/ntot,acc[i])
+         acc[i+1] = numpy.where(has,acc[i+1] + m2 + delta**2*acc[0]*n/ntot,
+            acc[i+1])
+   acc[0] = ntot
+
+def _chunk(rows,cols,dtype,col):
+   '''Convert the requested columns of a list of split rows to numpy arrays.
+      Used by readchunks().'''
+
+   tmp = []
+   for x in cols:
+      try:
+         values = [r[x] for r in rows]
+      except IndexError:
+         error('Cannot read column %d, some lines have fewer columns!' %(x+1))
+      if dtype.kind in 'biuf': # fast path, one C-level parse of the column
+         arr = numpy.fromstring(' '.join(values),dtype=dtype,sep=' ')
+         if arr.shape[0] != len(values):
+            try:
+               arr = numpy.array(values).astype(dtype)
+            except ValueError, e:
+               error('Cannot convert column %d: %s' %(x+1,e))
+      else:
+         arr = numpy.array(values,dtype=dtype)
+      tmp.append(arr)
+   if isinstance(col,(list,tuple)):
+      return tuple(tmp)
+   return tmp[0]
+
+def _columns(col):
+   '''Turn a column number or list/tuple of column numbers (starting from
+      1) into a list of zero-based indices'''
+
+   if isinstance(col,(str,int)):
+      return [int(col) - 1]
+   elif isinstance(col,(list,tuple)):
+      return [int(i) - 1 for i in col]
+   else:
+      error('col must be a string, integer, list, or tuple!')
+
+def _commentchar(comment):
+   '''Set null comment strings to something that can be used by partition()'''
+
+   if comment is None or comment == '':
+      return '\n'
+   return comment
+
+def _crossings(polyx,polyy,x,y,index=False):
+   '''Even-odd crossing number test used by inside().  polyx,polyy are the
+      vertices of the polygon (open, the last vertex connects to the first)
+      and x,y the points.  Returns a boolean array that is True for points
+      inside the polygon.'''
+
+   isin = numpy.zeros(x.shape[0],dtype=bool)
+   # anything outside the bounding box of the polygon can't be inside
+   box = numpy.nonzero((x >= polyx.min()) & (x <= polyx.max()) &
+                       (y >= polyy.min()) & (y <= polyy.max()))[0]
+   if box.shape[0] == 0:
+      return isin
+   x = x[box]
+   y = y[box]
+   if index: # sort by y, so an edge only touches the points in its y range
+      order = numpy.argsort(y,kind='mergesort')
+      x = x[order]
+      y = y[order]
+   crossed = numpy.zeros(x.shape[0],dtype=bool)
+
+   x1 = polyx
+   y1 = polyy
+   x2 = numpy.roll(polyx,-1)
+   y2 = numpy.roll(polyy,-1)
+   for xa,ya,xb,yb in zip(x1.tolist(),y1.tolist(),x2.tolist(),y2.tolist()):
+      if ya == yb: # horizontal edges never count as a crossing
+         continue
+      slope = (xb - xa)/(yb - ya)
+      if index: # points with min(ya,yb) <= y < max(ya,yb)
+         lo,hi = numpy.searchsorted(y,sorted((ya,yb)))
+         if lo == hi:
+            continue
+         crossed[lo:hi] ^= x[lo:hi] < xa + slope*(y[lo:hi] - ya)
+      else:
+         span = (ya > y) != (yb > y)
+         crossed ^= span & (x < xa + slope*(y - ya))
+
+   if index:
+      tmp = numpy.zeros(x.shape[0],dtype=bool)
+      tmp[order] = crossed
+      crossed = tmp
+   isin[box] = crossed
+   return isin
+
 def _deleteit(name):
    """Delete directories and files.  Helper function for remove()"""
    if os.path.exists(name):
@@ -474,7 +1049,111 @@ def _deleteit(name):
       else:
          os.remove(name)
 
+def _gauss1d(x,p):
+   '''gauss1d model for nllsqfit(): a + b*exp(-(x-c)**2/(2*d**2))'''
+
+   return p[:,0:1] + p[:,1:2]*numpy.exp(-(x - p[:,2:3])**2/(2*p[:,3:4]**2))
+
+def _gauss1djac(x,p):
+   '''Jacobian of _gauss1d()'''
+
+   dx = x - p[:,2:3]
+   e  = numpy.exp(-dx**2/(2*p[:,3:4]**2))
+   be = p[:,1:2]*e
+   return numpy.dstack(numpy.broadcast_arrays(numpy.ones_like(be),e,
+      be*dx/p[:,3:4]**2,be*dx**2/p[:,3:4]**3))
+
+def _gauss1dguess(x,y):
+   '''Initial gauss1d parameters: baseline from the edges, peak at the
+      maximum and width from the area'''
+
+   x = x*numpy.ones_like(y)
+   a = 0.5*(y[:,0] + y[:,-1])
+   peak = numpy.argmax(y - a[:,numpy.newaxis],axis=1)
+   rows = numpy.arange(y.shape[0])
+   b = y[rows,peak] - a
+   c = x[rows,peak]
+   step = numpy.abs(numpy.median(numpy.diff(x,axis=1),axis=1))
+   with numpy.errstate(all='ignore'):
+      d = numpy.abs(numpy.sum(y - a[:,numpy.newaxis],axis=1)*step/(b*numpy.sqrt(2*numpy.pi)))
+   d = numpy.where(numpy.isfinite(d) & (d > 0),d,step)
+   return numpy.column_stack((a,b,c,d))
+
+def _hms(seconds):
+   '''Format a number of seconds as hh:mm:ss for progressbar'''
+
+   seconds = int(seconds)
+   return '%02d:%02d:%02d' %(seconds//3600,(seconds//60) % 60,seconds % 60)
+
+def _line(x,p):
+   '''line model for nllsqfit(): a + b*x'''
+
+   return p[:,0:1] + p[:,1:2]*x
+
+def _linejac(x,p):
+   '''Jacobian of _line()'''
+
+   return numpy.dstack(numpy.broadcast_arrays(numpy.ones_like(p[:,0:1]*x),x))
+
+def _lineguess(x,y):
+   '''Initial line parameters from linear least squares'''
+
+   x = x*numpy.ones_like(y)
+   xm = x.mean(axis=1)
+   ym = y.mean(axis=1)
+   dx = x - xm[:,numpy.newaxis]
+   with numpy.errstate(all='ignore'):
+      b = numpy.sum(dx*(y - ym[:,numpy.newaxis]),axis=1)/numpy.sum(dx**2,axis=1)
+   b = numpy.where(numpy.isfinite(b),b,0.0)
+   return numpy.column_stack((ym - b*xm,b))
+
+def _numjacobian(model,x,p):
+   '''Forward-difference Jacobian of model, for models without one'''
+
+   y0 = model(x,p)
+   tmp = []
+   for k in range(p.shape[1]):
+      h = 1e-7*numpy.maximum(numpy.abs(p[:,k]),1.0)
+      p2 = p.copy()
+      p2[:,k] += h
+      tmp.append((model(x,p2) - y0)/h[:,numpy.newaxis])
+   return numpy.dstack(tmp)
+
+def _numpytype(dtype):
+   '''Translate the 'str', 'int' and 'float' names used by readcolumns() into
+      numpy dtypes'''
+
+   if dtype == 'str':
+      dtype = str
+   elif dtype == 'int':
+      dtype = int
+   elif dtype == 'float':
+      dtype = float
+   return numpy.dtype(dtype)
+
+def _polygonvertices(poly):
+   '''Return the x and y vertices of poly as float arrays.  poly can be an
+      (n,2) array, a pair of 1D arrays, or a pyregion polygon shape.'''
+
+   if hasattr(poly,'coord_list'): # pyregion shape
+      if getattr(poly,'name','polygon') != 'polygon':
+         error('regionset only understands polygons, not %s!' %poly.name)
+      tmp = numpy.asarray(poly.coord_list,dtype=numpy.float64)
+      return tmp[0::2],tmp[1::2]
+   tmp = numpy.asarray(poly,dtype=numpy.float64)
+   if tmp.ndim == 2 and tmp.shape[1] == 2 and tmp.shape[0] != 2:
+      return tmp[:,0],tmp[:,1]
+   elif tmp.ndim == 2 and tmp.shape[0] == 2:
+      return tmp[0],tmp[1]
+   else:
+      error('Polygons must be (n,2) arrays or px,py pairs!')
+
 def _try_int(s):
     "Convert to integer if possible.  Helper function for smart_sort()"
     try: return int(s)
     except: return s
+
+_parnames = ('a','b','c','d','e') # parameter names used by tabnllsqfit
+_models = {} # fit types for nllsqfit() and func(), see addmodel()
+addmodel('line',_line,2,_linejac,_lineguess)
+addmodel('gauss1d',_gauss1d,4,_gauss1djac,_gauss1dguess)
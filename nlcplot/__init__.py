@@ -1,14 +1,15 @@
 #!/usr/bin/env python
 # Started 6 March 2013
 
-__all__ = ['arc','arrow','axis','colorbar','compass','contour','default',
-           'getlimits','halftone','legend','plot','polygon','rgb','rect',
-           'regionfile','savefig','stick','subplot','subplot2','text','title',
-           'vector','vectorkey','xlabel','ylabel']
+__all__ = ['arc','arrow','axis','channelmaps','colorbar','compass','contour',
+           'default','getlimits','halftone','legend','plot','polygon','rgb',
+           'rect','regionfile','regionset','savefig','stick','subplot',
+           'subplot2','text','title','vector','vectorkey','xlabel','ylabel']
 
 from arc import arc
 from arrow import arrow
 from axis import axis
+from channelmaps import channelmaps
 from colorbar import colorbar
 from compass import compass
 from contour import contour
@@ -20,7 +21,7 @@ from plot import plot
 from polygon import polygon
 from rgb import rgb
 from rect import rect
-from regionfile import regionfile
+from regionfile import regionfile,regionset
 from savefig import savefig
 from stick import stick
 from subplot import subplot
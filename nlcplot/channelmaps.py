@@ -0,0 +1,29 @@
+from . import header
+from halftone import halftone
+
+def channelmaps(image,ext=1,planes=None,window=None,**args):
+   """Generator that plots the planes of a FITS cube one at a time with
+      halftone(), for channel maps or movie frames.  Only one plane (or
+      window of it) is read from disk at a time, so memory use does not
+      depend on the size of the cube.
+
+      image  - string with FITS image
+      ext    - FITS extension as a number or string name
+      planes - list of plane numbers (starting from zero).  Default is all.
+      window - (x1,x2,y1,y2) pixel range to read, as for halftone()
+      args   - anything else halftone() understands, e.g. cmap, vmin, vmax
+
+      Yields the plane number after it is plotted.  Add labels etc. and
+      call savefig() (which clears the figure) inside the loop:
+
+         for n in nlcplot.channelmaps('cube.fits',vmin=0,vmax=5):
+            nlcplot.title('Channel %d' %n)
+            nlcplot.savefig('chan%03d.png' %n)"""
+
+   if not isinstance(image,str):
+      header.error("channelmaps(): image must be a FITS file name!")
+   if planes is None:
+      planes = range(header._planecount(image,ext))
+   for n in planes:
+      halftone(image,ext=ext,plane=n,window=window,**args)
+      yield n
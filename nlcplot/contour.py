@@ -1,9 +1,11 @@
 from . import header
-import pyfits,pywcs
-from numpy import nanmin,nanmax,linspace
+from matplotlib.collections import LineCollection
+from matplotlib.path import Path
+from numpy import nanmin,nanmax,linspace,arange,concatenate,cumsum,split,flatnonzero
 from scipy import ndimage
 
-def contour(image,levels=None,ext=0,align='pix',wcs=None,sigma=None,**args):
+def contour(image,levels=None,ext=0,align='pix',wcs=None,sigma=None,plane=None,
+   window=None,**args):
    """image  - string with FITS image or the data as a numpy array
       levels - either an integer number of levels, or a list or numpy array of
                levels
@@ -15,6 +17,10 @@ def contour(image,levels=None,ext=0,align='pix',wcs=None,sigma=None,**args):
       sigma  - Smooth the input data by a gaussian filter with a standard
                deviation equal to this value, in pixels.  Default is no
                smoothing.
+      plane  - plane number (starting from zero) to contour from a cube
+      window - (x1,x2,y1,y2) pixel range (starting from zero) to read and
+               contour.  For a FITS image only this part of the plane is
+               read.
 
       Supported optional arguments:
       color  - Color of contour lines"""
@@ -24,12 +30,25 @@ def contour(image,levels=None,ext=0,align='pix',wcs=None,sigma=None,**args):
    z = header.updateZorder()
 
    if isinstance(image,str):
-      data = pyfits.getdata(image,ext=ext)
-      head = pyfits.getheader(image,ext=ext)
-      wcs2 = pywcs.WCS(head)
+      if isinstance(ext,int): # header counts extensions from one
+         ext = ext + 1
+      if window is not None:
+         window = header._window(image,ext,window)
+      data = header.getplane(image,ext,plane,window)
+      wcs2 = header.getwcs(image,ext)
    else:
       data = image
+      if plane is not None:
+         data = data[plane]
+      if window is not None:
+         window = [int(w) for w in window]
+         data = data[window[2]:window[3]+1,window[0]:window[1]+1]
       wcs2 = wcs
+   if window is None:
+      xy = () # contours in pixels of data
+   else: # keep pixel coordinates of the full image
+      xy = (arange(window[0],window[0]+data.shape[1]),
+            arange(window[2],window[2]+data.shape[0]))
 
    if sigma is not None: # smooth data for cleaner contours
       data = ndimage.gaussian_filter(data,sigma)
@@ -41,31 +60,57 @@ def contour(image,levels=None,ext=0,align='pix',wcs=None,sigma=None,**args):
 
    lw = 0.5*a['linewidth']
    if align == 'pix': # align by pixel number (ignore wcs)
-      header.plt.contour(data,colors=a['color'],levels=levels,linewidths=lw,zorder=z)
+      header.plt.contour(*(xy + (data,)),colors=a['color'],levels=levels,linewidths=lw,zorder=z)
    elif align == 'wcs':
       wcs1 = header.updateWcs(None) # current wcs of image
       if wcs1 is None or wcs2 is None:
          header.error("contour(): no wcs in image to align with!")
       ctype1 = header.translateCtype(wcs1) # get ctype, i.e. ra, glon
       ctype2 = header.translateCtype(wcs2)
+      if ctype1 != ctype2:
+         header.error("contour(): Can't align %s and %s images yet!" %(ctype1,ctype2))
 
-      contourset = header.plt.contour(data,alpha=0.0,levels=levels) # get contours
-      nlevels = len(contourset.collections)
-      for n in range(nlevels): # loop over each contour
-         paths = contourset.collections[n].get_paths()
-         for path in paths: # loop over each partial contour (path)
-            if path.codes is not None:
-               header.error("contour(): Can't handle codes right now!")
-            vert = path.vertices # get pixel paths, convert to sky coords
-            vert2 = wcs2.wcs_pix2sky(vert,0) # 0-based pixels b/c internal
+      contourset = header.plt.contour(*(xy + (data,)),alpha=0.0,levels=levels) # get contours
+      segments = [] # pixel segments of each level
+      for coll in contourset.collections:
+         segments.append([seg for path in coll.get_paths()
+            for seg in _pathsegments(path)])
+         coll.remove() # only needed the paths
 
-            # now convert sky coords back to underlying pixel coords
-            if ctype1 == ctype2:
-               vert3 = wcs1.wcs_sky2pix(vert2,0) # 0-based pixels b/c internal
-            header.plt.plot(vert3[:,0],vert3[:,1],ls='-', lw=lw, color=a['color'],zorder=z)
+      # convert all vertices of all levels in one go, first to sky coords and
+      # then back to the underlying pixel coords (0-based pixels b/c internal)
+      lengths = [len(seg) for level in segments for seg in level]
+      if sum(lengths) > 0:
+         vert = concatenate([seg for level in segments for seg in level])
+         vert = wcs1.wcs_sky2pix(wcs2.wcs_pix2sky(vert,0),0)
+         pieces = split(vert,cumsum(lengths)[:-1])
+         ax = header.plt.gca()
+         for level in segments: # one artist per level
+            lines = LineCollection(pieces[:len(level)],colors=a['color'],
+               linewidths=lw,linestyles='solid',zorder=z)
+            pieces = pieces[len(level):]
+            ax.add_collection(lines)
+         ax.autoscale_view()
    else:
       header.error("contour(): Other alignments not supported yet")
 
    # update wcs with new one for this image
    if wcs2 is not None:
       header._fig['wcs'] = wcs2
+
+def _pathsegments(path):
+   """Split a matplotlib path into arrays of vertices of connected lines,
+      closing loops that end with CLOSEPOLY"""
+
+   vert = path.vertices
+   if path.codes is None:
+      return [vert]
+   vert = vert.copy()
+   starts = flatnonzero(path.codes == Path.MOVETO)
+   if len(starts) == 0 or starts[0] != 0:
+      starts = concatenate([[0],starts])
+   segs = split(vert,starts[1:])
+   codes = split(path.codes,starts[1:])
+   for seg,code in zip(segs,codes):
+      seg[code == Path.CLOSEPOLY] = seg[0]
+   return [seg for seg in segs if len(seg) > 1]
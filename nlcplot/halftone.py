@@ -1,7 +1,7 @@
 from . import header
-import pywcs
 
-def halftone(image,cmap='gray_r',ext=1,plane=1,vmin=None,vmax=None,**args):
+def halftone(image,cmap='gray_r',ext=1,plane=1,vmin=None,vmax=None,window=None,
+   downsample=False,blockfunc='mean',dpi=None,**args):
    """Plot a halftone image with specified colormap.
    
       returns: numpy array of the halftone data.
@@ -13,6 +13,16 @@ def halftone(image,cmap='gray_r',ext=1,plane=1,vmin=None,vmax=None,**args):
       cmap  = Colormap to use for plotting
       vmin  = Minimum halftone value.  None is minimum of image
       vmax  = Maximum halftone value.  None is maximum of image
+      window = (x1,x2,y1,y2) pixel range (starting from zero) to read and
+               plot, e.g. the plot limits.  Pixels keep their coordinates.
+               For a FITS image only this part of the plane is read.
+      downsample = False to always plot every pixel, an integer to bin the
+               image down by that factor, or 'auto' to pick the largest
+               power of two that still gives at least one image pixel per
+               output pixel (for the axes size, window and dpi).  Binned
+               FITS images are cached, see header.getbinned().
+      blockfunc = How to bin pixels when downsampling, 'mean' or 'max'
+      dpi   = Output dpi for downsample='auto'.  Default is the savefig dpi.
       
       optional keywords:
       wcs    - The wcs (as defined by pywcs) used to convert from world coords
@@ -25,24 +35,61 @@ def halftone(image,cmap='gray_r',ext=1,plane=1,vmin=None,vmax=None,**args):
    z = header.updateZorder()
 
    if isinstance(image,str):
-      data = header.getdata(image,ext=ext)
-      head = header.getheader(image,ext=ext)
-      header._fig['wcs'] = pywcs.WCS(head)
+      if header._planecount(image,ext) == 1:
+         plane = None # 2-D image
+      shape = header._imageshape(image,ext)
+      if window is not None:
+         window = header._window(image,ext,window)
    else:
       data = image
+      naxis = len(data.shape)
+      if naxis == 1:
+         header.error("halftone(): Image must be 2-D or 3-D to plot!")
+      elif naxis == 2:
+         pass
+      elif naxis == 3:
+         data = data[plane,:,:] # select a single plane from cube
+      else:
+         header.error("halftone(): Image must be 2-D or 3-D to plot!")
+      shape = data.shape
+      if window is not None:
+         x1,x2,y1,y2 = [int(w) for w in window]
+         x1,y1 = max(x1,0),max(y1,0)
+         x2,y2 = min(x2,data.shape[1]-1),min(y2,data.shape[0]-1)
+         window = (x1,x2,y1,y2)
+   if window is None:
+      window = (0,shape[1]-1,0,shape[0]-1)
    a = header.translateArgs(**args)
 
-   naxis = len(data.shape)
-   if naxis == 1:
-      header.error("halftone(): Image must be 2-D or 3-D to plot!")
-   elif naxis == 2:
-      pass
-   elif naxis == 3:
-      data = data[plane,:,:] # select a single plane from cube
+   if blockfunc not in ('mean','max'):
+      header.error("halftone(): blockfunc must be mean or max!")
+   if downsample == 'auto':
+      factor = header._displayfactor(window[1]-window[0]+1,window[3]-window[2]+1,dpi)
+   elif downsample:
+      factor = int(downsample)
    else:
-      header.error("halftone(): Image must be 2-D or 3-D to plot!")
+      factor = 1
+   factor = min(factor,shape[0],shape[1])
+   if factor > 1: # plot binned pixels, each covering factor x factor pixels
+      if isinstance(image,str):
+         data = header.getbinned(image,ext,plane,factor,blockfunc)
+      else:
+         data = header._blockreduce(data,factor,blockfunc)
+      x1,y1 = window[0]//factor,window[2]//factor
+      x2 = min(window[1]//factor,data.shape[1]-1)
+      y2 = min(window[3]//factor,data.shape[0]-1)
+      data = data[y1:y2+1,x1:x2+1]
+      extent = (x1*factor-0.5,(x2+1)*factor-0.5,y1*factor-0.5,(y2+1)*factor-0.5)
+   else:
+      if isinstance(image,str):
+         data = header.getplane(image,ext,plane,window)
+      else:
+         data = data[window[2]:window[3]+1,window[0]:window[1]+1]
+      extent = (window[0]-0.5,window[1]+0.5,window[2]-0.5,window[3]+0.5)
+   if isinstance(image,str):
+      header._fig['wcs'] = header.getwcs(image,ext=ext)
 
    header.plt.imshow(data,origin='lower',cmap=cmap,interpolation='nearest',
-      aspect='equal',vmin=vmin,vmax=vmax,zorder=z)
+      aspect='equal',vmin=vmin,vmax=vmax,zorder=z,extent=extent)
    #header.plt.axis('off') # turn off axis plot
    return data
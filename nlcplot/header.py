@@ -7,9 +7,14 @@ from matplotlib.patches import Arc,Ellipse
 import pyfits # to read fits files
 from numpy import loadtxt,cos,sin,pi,sqrt,array,arange,isnan,arcsin,arctan2
 import tickmarks3
+import nlcfits # cache of headers and wcs
+import nlcastro
+import numpy
 import pywcs
+import worldpos # tabulated approximation used by approxwcs()
 import os
 import sys
+import warnings
 
 _options = {'backgroundcolor' : 'none', # background color for text boxes
             'facecolor'  : 'k', 'markerfacecolor' : 'k',
@@ -38,6 +43,10 @@ _options = {'backgroundcolor' : 'none', # background color for text boxes
                                   # parameter instead of being variable
 _lstyles = ('-','--','-.',':')
 
+# numpy types of the FITS BITPIX values, used by getplane()
+_dtypes = {8 : 'u1', 16 : '>i2', 32 : '>i4', 64 : '>i8', -32 : '>f4', -64 : '>f8'}
+_stripbytes = 1 << 26 # bytes of full resolution data read at a time by getbinned()
+
 # dictionary containing common info about the plot
 _fig = {'quiver' : None, # quiver key returned by quiver() command.  Used to
                          # make quiverkey()
@@ -57,6 +66,38 @@ _fig = {'quiver' : None, # quiver key returned by quiver() command.  Used to
 
 matplotlib.rc('font',family=_options['family']) # set default font for plots
 
+def approxwcs(wcs,tol=1e-3,limits=None):
+   """Wrap a pywcs WCS so wcs_pix2sky() and wcs_sky2pix() use a tabulated
+      approximation good to tol pixels (see worldpos.tabwcs), which is much
+      faster for many points, e.g. overlays and coordinate maps of large
+      images.  Everything else is passed on to wcs, so the result can be
+      used wherever a wcs is taken (e.g. the wcs option or updateWcs()).
+
+      wcs    - pywcs WCS
+      tol    - maximum error in pixels
+      limits - (x1,x2,y1,y2) 0-based pixel range where the approximation is
+               used.  Defaults to the whole image."""
+
+   if limits is None:
+      try:
+         limits = (-0.5,wcs._naxis1 - 0.5,-0.5,wcs._naxis2 - 0.5)
+      except AttributeError:
+         error("approxwcs(): Image size not known, please give limits!")
+
+   def xy2sky(x,y):
+      ra,dec = wcs.wcs_pix2sky(x.ravel(),y.ravel(),0)
+      return numpy.reshape(ra,x.shape),numpy.reshape(dec,x.shape)
+
+   def sky2xy(ra,dec):
+      x,y = wcs.wcs_sky2pix(ra.ravel(),dec.ravel(),0)
+      return numpy.reshape(x,ra.shape),numpy.reshape(y,ra.shape)
+
+   try:
+      tab = worldpos.tabwcs(xy2sky,sky2xy,limits,tol)
+   except ValueError,err:
+      error("approxwcs(): %s" %err.args[-1])
+   return _approxwcs(wcs,tab)
+
 def error(msg):
    '''Print the error message to standard error'''
    if msg[-1] == '\n':
@@ -116,23 +157,128 @@ def getdata(image,ext):
       extension name/number and gets the header using pyfits"""
 
    if os.path.exists(image):
+      ext = _findExt(image,ext)
       img = pyfits.open(image)
-      ext = _findExt(img,ext)
       data = img[ext].data
       img.close()
       return data
    else:
       error("getdata(): File '%s' does not exist!" %image)
 
+def getbinned(image,ext,plane,factor,func='mean'):
+   """Get one plane of FITS data binned down by factor in both axes, for
+      showing big images at a lower resolution.  ext and plane are as for
+      getplane().
+
+      func   - how to combine each factor x factor block of pixels, 'mean'
+               or 'max' (keeps point sources visible).  NaNs are ignored.
+
+      The plane is read a strip of rows at a time, so the full resolution
+      data never have to fit in memory.  Pixels that do not fill a whole
+      block at the top and right edges are dropped.  The result is cached,
+      so treat it as read-only."""
+
+   if func not in ('mean','max'):
+      error("getbinned(): func must be mean or max!")
+   factor = int(factor)
+   if factor <= 1:
+      return getplane(image,ext,plane)
+
+   def load():
+      head = nlcfits.cachedheader(image,_findExt(image,ext))
+      nx,ny = head['NAXIS1']//factor,head['NAXIS2']//factor
+      if nx == 0 or ny == 0:
+         error("getbinned(): Image is smaller than a %dx%d block!" %(factor,factor))
+      out = numpy.empty((ny,nx),dtype=numpy.float64)
+      step = max(_stripbytes//(8*head['NAXIS1']*factor),1) # binned rows per strip
+      for y in range(0,ny,step):
+         n = min(step,ny-y)
+         strip = getplane(image,ext,plane,(0,nx*factor-1,y*factor,(y+n)*factor-1))
+         out[y:y+n] = _blockreduce(strip,factor,func)
+      return out
+
+   return nlcfits.cached('nlcplot.binned',image,(ext,plane,factor,func),load)
+
 def getheader(image,ext):
    """Get FITS header.  ext can be a string or integer.  Checks for valid
-      extension name/number and gets the header using pyfits"""
+      extension name/number and gets the header using pyfits.  Headers are
+      cached, so treat the result as read-only."""
 
-   img = pyfits.open(image)
-   ext = _findExt(img,ext)
-   header = img[ext].header
-   img.close()
-   return header
+   def load():
+      tmp = _findExt(image,ext)
+      img = pyfits.open(image)
+      header = img[tmp].header
+      img.close()
+      return header
+
+   return nlcfits.cached('nlcplot.header',image,ext,load)
+
+def getplane(image,ext,plane=None,window=None):
+   """Get one plane of FITS data without reading the rest of the file.
+      ext can be a string or integer as for getdata().
+
+      plane  - plane number (starting from zero, so data[plane] of a cube).
+               Axes beyond the third are folded into the planes.  Can be
+               None for 2-D images.
+      window - optional (x1,x2,y1,y2) pixel range (starting from zero,
+               inclusive) to read, e.g. matching the plot limits.  It is
+               clipped to the image, see _window().
+
+      The data are memory-mapped, so only the requested pixels are read
+      from disk.  BSCALE, BZERO and BLANK are applied like pyfits does."""
+
+   tmp = _findExt(image,ext)
+   head = nlcfits.cachedheader(image,tmp)
+   naxis = head.get('NAXIS',0)
+   if naxis < 2:
+      error("getplane(): Image must be at least 2-D!")
+   if head['BITPIX'] not in _dtypes:
+      error("getplane(): Unknown BITPIX %s in %s" %(head['BITPIX'],image))
+   shape = tuple(head['NAXIS%d' %i] for i in range(naxis,0,-1))
+   if image.endswith('.gz'): # can not memory-map, fall back to pyfits
+      data = getdata(image,ext).reshape((-1,) + shape[-2:])
+      scale = False
+   else:
+      data = numpy.memmap(image,dtype=_dtypes[head['BITPIX']],mode='r',
+         offset=head.offset,shape=shape).reshape((-1,) + shape[-2:])
+      scale = True
+   if plane is None:
+      if data.shape[0] > 1:
+         error("getplane(): %s is a cube, give a plane number!" %image)
+      plane = 0
+   if not 0 <= plane < data.shape[0]:
+      error("getplane(): plane must be in range 0-%d!" %(data.shape[0]-1))
+   data = data[plane]
+   if window is not None:
+      x1,x2,y1,y2 = _window(image,ext,window)
+      data = data[y1:y2+1,x1:x2+1]
+   if not scale:
+      return numpy.array(data)
+   if head['BITPIX'] in (-32,-64):
+      out = numpy.array(data,dtype=data.dtype.newbyteorder('='))
+   else:
+      out = numpy.array(data,dtype=numpy.float32 if head['BITPIX'] < 32 else numpy.float64)
+      if 'BLANK' in head:
+         out[data == head['BLANK']] = numpy.nan
+   if head.get('BSCALE',1) != 1:
+      out *= head['BSCALE']
+   if head.get('BZERO',0) != 0:
+      out += head['BZERO']
+   return out
+
+def getwcs(image,ext,tol=None):
+   """Get the pywcs WCS for a FITS image.  ext can be a string or integer,
+      as for getheader().  The WCS is cached, so treat it as read-only.
+      With tol, get approxwcs() of it instead, good to tol pixels over the
+      whole image."""
+
+   wcs = nlcfits.cached('nlcplot.wcs',image,ext,
+      lambda: pywcs.WCS(getheader(image,ext)))
+   if tol is None:
+      return wcs
+   ny,nx = _imageshape(image,ext)
+   return nlcfits.cached('nlcplot.approxwcs',image,(ext,tol),
+      lambda: approxwcs(wcs,tol,(-0.5,nx - 0.5,-0.5,ny - 0.5)))
 
 def lineStyleToText(style):
    """Translate a line style of -, --, -., or : into a text equivalent and
@@ -300,50 +446,120 @@ def updateZorder():
    #print "zorder = %f" %x
    return x
 
-def _findExt(img,extname):
+class _approxwcs(object):
+   """pywcs WCS whose wcs_pix2sky() and wcs_sky2pix() go through a
+      worldpos.tabwcs built on 0-based pixels.  See approxwcs()."""
+
+   def __init__(self,wcs,tab):
+      self._wcs = wcs
+      self._tab = tab
+
+   def __getattr__(self,name):
+      if name == '_wcs': # not set up yet, e.g. while unpickling
+         raise AttributeError(name)
+      return getattr(self._wcs,name)
+
+   def wcs_pix2sky(self,*args):
+      """Same as pywcs WCS.wcs_pix2sky(), but approximate"""
+
+      if len(args) not in (2,3):
+         return self._wcs.wcs_pix2sky(*args)
+      x,y,origin = self._split(args)
+      ra,dec = self._tab.xy2sky(x - origin,y - origin)
+      return self._join(ra,dec,args)
+
+   def wcs_sky2pix(self,*args):
+      """Same as pywcs WCS.wcs_sky2pix(), but approximate"""
+
+      if len(args) not in (2,3):
+         return self._wcs.wcs_sky2pix(*args)
+      ra,dec,origin = self._split(args)
+      x,y = self._tab.sky2xy(ra,dec)
+      return self._join(x + origin,y + origin,args)
+
+   def _join(self,a,b,args):
+      """Return a,b the way pywcs would for the arguments args"""
+
+      if len(args) == 2:
+         return numpy.column_stack((a.ravel(),b.ravel()))
+      return a,b
+
+   def _split(self,args):
+      """Split pywcs arguments, either x,y,origin or an Nx2 array and
+         origin, into two float arrays and origin"""
+
+      if len(args) == 2:
+         pairs = numpy.asarray(args[0],dtype=float).reshape(-1,2)
+         return pairs[:,0],pairs[:,1],args[1]
+      return (numpy.atleast_1d(numpy.asarray(args[0],dtype=float)),
+         numpy.atleast_1d(numpy.asarray(args[1],dtype=float)),args[2])
+
+def _blockreduce(data,factor,func):
+   """Combine factor x factor blocks of a 2-D array with nanmean or nanmax,
+      dropping rows/columns that do not fill a whole block"""
+
+   ny,nx = data.shape[0]//factor,data.shape[1]//factor
+   blocks = data[:ny*factor,:nx*factor].reshape(ny,factor,nx,factor)
+   with warnings.catch_warnings(): # all-NaN blocks just stay NaN
+      warnings.simplefilter('ignore',RuntimeWarning)
+      if func == 'max':
+         return numpy.nanmax(numpy.nanmax(blocks,axis=3),axis=1)
+      return numpy.nanmean(blocks,axis=(1,3))
+
+def _displayfactor(nx,ny,dpi=None):
+   """Largest power of two binning factor that still leaves at least one
+      image pixel per output pixel, for nx x ny image pixels shown on the
+      current axes.  dpi defaults to the savefig dpi."""
+
+   fig = plt.gcf()
+   if dpi is None:
+      dpi = matplotlib.rcParams['savefig.dpi']
+      if not isinstance(dpi,(int,float)): # 'figure'
+         dpi = fig.dpi
+   box = plt.gca().get_window_extent()
+   width,height = box.width/fig.dpi*dpi,box.height/fig.dpi*dpi
+   ratio = min(nx/max(width,1.),ny/max(height,1.))
+   factor = 1
+   while 2*factor <= ratio:
+      factor = 2*factor
+   return factor
+
+def _findExt(image,extname):
    """Try to match extname, which is a either an integer or string, with
-      the extension in img (a pyfits hdu)"""
-
-   n = len(img) # number of HDUs
-   fname = img.filename()
+      the extension in image (a filename).  The extension names are only
+      read once per file, see nlcfits.findext()"""
 
-   if isinstance(extname,int):
-      if 1 <= extname <= n:
-         tmp = extname - 1
-      else:
-         img.close()
-         error("_findExt(): Extension number must be in range %d-%d for %s!" %(1,n,fname))
-   elif isinstance(extname,str):
-      junk = [img[i].name.strip().lower() for i in xrange(n)]
-      if 'EXTNAME' in img[0].header.keys():
-         junk[0] = img[0].header['extname'].strip().lower()
-      
-      if extname.lower() in junk:
-         tmp = junk.index(extname.lower())
-      else:
-         img.close()
-         error("_findExt(): Extension name '%s' not found in %s!" %(extname,fname))
-   else:
-      img.close()
+   if not isinstance(extname,(int,str)):
       error("_findExt(): Extension must be an integer or string!")
-   return tmp
+   try:
+      return nlcfits.findext(image,extname)
+   except (IOError,IndexError,KeyError,TypeError),err:
+      error("_findExt(): %s" %err.args[-1])
+
+def _imageshape(image,ext):
+   """Return (NAXIS2,NAXIS1) of image, from the cached header"""
+
+   head = nlcfits.cachedheader(image,_findExt(image,ext))
+   return head['NAXIS2'],head['NAXIS1']
+
+def _planecount(image,ext):
+   """Number of planes getplane() can read from image"""
+
+   head = nlcfits.cachedheader(image,_findExt(image,ext))
+   n = 1
+   for i in range(3,head.get('NAXIS',0)+1):
+      n = n*head['NAXIS%d' %i]
+   return n
 
 def _sex2deg(value,ctype):
    '''Convert sexagesimal to degrees, unless it is already in degrees'''
 
    if isinstance(value,str): # is a string
-      negFlag = 1 # set to -1 if negative declination
-      if value.strip()[0] == '-':
-         negFlag = -1
-      tmp = array(map(float,value.split(':')))
-      fac = 60**arange(tmp.shape[0])
-      degrees = negFlag*sum(abs(tmp)/fac)
-      if ctype == 'ra' and len(tmp) > 1: # first value is ra, multiply by 15
-         degrees = 15*degrees # convert hours to degrees
+      degrees = float(nlcastro.sex2degarray([value],ctype)[0])
    elif isinstance(value,(float,int)): # assume it is already in degrees
       degrees = value
    else: # assume it is a list,tuple, or array
-      degrees = [_sex2deg(a,ctype) for a in value]
+      degrees = nlcastro.sex2degarray(value,ctype).tolist()
    return degrees
 
 def _translateEquinox(wcs):
@@ -370,3 +586,16 @@ def _translateEquinox(wcs):
             error("_translateEquinox(): Unknown equinox %s" %equinox)
       except ValueError:
          error("_translateEquinox(): Unknown equinox %s" %equinox)
+
+def _window(image,ext,window):
+   """Clip a (x1,x2,y1,y2) pixel window (starting from zero, inclusive) to
+      the size of image and return it as integers"""
+
+   ny,nx = _imageshape(image,ext)
+   x1,x2 = sorted(window[:2])
+   y1,y2 = sorted(window[2:])
+   x1,x2 = max(int(numpy.floor(x1)),0),min(int(numpy.ceil(x2)),nx-1)
+   y1,y2 = max(int(numpy.floor(y1)),0),min(int(numpy.ceil(y2)),ny-1)
+   if x1 > x2 or y1 > y2:
+      error("_window(): Pixel window is outside %s!" %image)
+   return x1,x2,y1,y2
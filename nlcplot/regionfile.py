@@ -1,5 +1,6 @@
 from . import header
 from . import rect
+import nlclib
 import pyregion
 
 def regionfile(filename):
@@ -23,3 +24,21 @@ def regionfile(filename):
    for p in patch_list:
       p.set_zorder(p)
       ax.add_patch(p)
+
+def regionset(filename,head=None):
+   """Read the polygons in a ds9 region file into an nlclib.regionset, for
+      labeling catalog positions with the region they fall in.
+
+      filename - DS9 region file
+      head     - pyfits header that defines the pixel coordinates.  Defaults
+                 to the wcs of the current image.
+
+      Only polygons are kept, so labels count the polygons in file order."""
+
+   if head is None:
+      wcs = header.updateWcs(None)
+      if wcs is None:
+         header.error("regionset(): no wcs to convert the regions with!")
+      head = wcs.to_header()
+   r = pyregion.open(filename).as_imagecoord(head)
+   return nlclib.regionset([shape for shape in r if shape.name == 'polygon'])
@@ -2,9 +2,19 @@
 """Script to generate proper WCS tickmarks for matplotlib."""
 
 from . import header
+import nlcastro
 import pywcs,pyfits
 import numpy as np
 from numpy import pi,sin,cos,arccos,where,isnan
+from collections import OrderedDict
+
+_adaptivelength  = 2048 # edges longer than this (pixels) are sampled adaptively
+_adaptivesamples = 64   # number of coarse samples along an adaptive edge
+
+_tickcache     = OrderedDict() # (wcs fingerprint,limits,side,unit,adaptive) -> ticks
+_tickcachesize = 128           # maximum number of entries in _tickcache
+_tickwcs       = None          # header._fig['wcs'] when _tickcache was filled
+_wcsdistortions = ('sip','cpdis1','cpdis2','det2im1','det2im2') # pywcs extras
 
 def _angdist(ra1,dec1,ra2,dec2):
    """Compute the angular distance between two points, in degrees
@@ -29,59 +39,7 @@ def _convert(value,coord,precision=0):
       coord     = either 'ra' or 'dec' to specify coordinate type
       precision = number of decimal places for rounding seconds"""
 
-   negFlag = False # set to true if value is negative
-   try:
-      tmp = map(float,value.split(':'))
-      if tmp[0] < 0:
-         negFlag = True
-         tmp[0] = abs(tmp[0])
-   except ValueError:
-      header.error('Invalid string given for conversion to sexagesimal: %s' %value)
-
-   n = len(tmp)
-   if n == 1: # assume it was in degrees
-      junk = tmp[0]
-      if coord == 'ra':
-         junk = junk/15.0
-      hours = int(junk)
-      try:
-         junk = 60*(junk%hours)
-         minutes = int(junk)
-      except ZeroDivisionError:
-         minutes = int(60*junk)
-      try:
-         seconds = 60*(junk%minutes)
-      except ZeroDivisionError:
-         seconds = 60*junk
-      while seconds >= 60:
-         seconds = seconds - 60
-         minutes += 1
-      while minutes >= 60:
-         minutes = minutes - 60
-         hours += 1
-      tmp = [hours,minutes,seconds]
-   elif n == 2: # assume it was already sexagesimal, but no seconds given
-      tmp.append(0.0)
-
-   # now convert to a string
-   seconds = round(tmp[2],precision)
-   if precision == 0:
-      seconds = int(seconds)
-   while seconds >= 60:
-      seconds -= 60
-      tmp[1] += 1
-   minutes = tmp[1]
-   while minutes >= 60:
-      minutes -= 60
-      tmp[0] += 1
-   if seconds < 10:
-      tmp = "%d:%02d:0%s" %(tmp[0],minutes,str(seconds))
-   else:
-      tmp = "%d:%02d:%s" %(tmp[0],minutes,str(seconds))
-   if negFlag: # catch cases where deg. is neg
-      tmp = '-' + tmp
-
-   return tmp
+   return _deg2sex(value,coord,precision)
 
 def _deg2sex(value,coord,precision=0):
    """Convert degrees to sexagesimal
@@ -91,13 +49,48 @@ def _deg2sex(value,coord,precision=0):
       precision = number of decimal places for rounding seconds"""
 
    if isinstance(value,float) or isinstance(value,int) or isinstance(value,str):
-      tmp = _convert(str(value),coord,precision)
+      values = [value]
    else:
-      tmp = []
-      for c in value:
-         tmp.append(_convert(str(c),coord,precision))
+      values = value
+   try:
+      degrees = nlcastro.sex2degarray(values,coord)
+   except ValueError, e:
+      header.error('Invalid string given for conversion to sexagesimal: %s' %e)
+   tmp = nlcastro.deg2sexarray(degrees,coord,precision,strings=True)
+   if isinstance(value,float) or isinstance(value,int) or isinstance(value,str):
+      tmp = tmp[0]
    return tmp
 
+def _edgefunc(wcs,coord,unit,x=None,y=None):
+   """Return a function giving the RA (coord='ra', along a row y) or Dec
+      (coord='dec', along a column x) at any pixels on an edge, as offsets
+      from crval for units do, mo and so"""
+
+   crval = wcs.wcs.crval
+   def func(pixels):
+      n = len(pixels)
+      if coord == 'ra':
+         ra,dec = wcs.wcs_pix2sky(pixels,[y]*n,0)
+         if unit in ('do','mo','so'):
+            return np.sign(ra-crval[0])*_angdist(ra,dec,crval[0],dec)
+         return np.asarray(ra)
+      ra,dec = wcs.wcs_pix2sky([x]*n,pixels,0)
+      if unit in ('do','mo','so'):
+         return np.sign(dec-crval[1])*_angdist(ra,dec,ra,crval[1])
+      return np.asarray(dec)
+   return func
+
+def _edgesamples(pixels,func,adaptive):
+   """Return the pixels along an edge to evaluate func at, and the
+      function _getTickLocs() should refine ticks with (None to use every
+      pixel of the edge)"""
+
+   if adaptive is None:
+      adaptive = pixels.shape[0] > _adaptivelength
+   if not adaptive or pixels.shape[0] <= _adaptivesamples:
+      return pixels,None
+   return np.linspace(pixels[0],pixels[-1],_adaptivesamples),func
+
 def _getstepdec_dms(dec):
    """Get stepdec and declabel in for the range of DEC plotted.  This is
       computed for degrees/minutes/seconds plotting.
@@ -164,17 +157,37 @@ def _getstepdeg(deg):
          break
    return tmpstep[idx],tmplabel[idx]
 
-def _getTickLocs(pixels,coords,stepsize,wcsrange=(0,360)):
-   """Get tickmark locations in pixel coordinates."""
+def _getTickLocs(pixels,coords,stepsize,wcsrange=(0,360),func=None,tol=0.01):
+   """Get tickmark locations in pixel coordinates.  Only the ticks between
+      the smallest and largest coords are generated.  A wcsrange of (0,360)
+      is treated as periodic, so an axis can cross RA=0.
+
+      If pixels is only a coarse sampling of the edge, give func(pixels),
+      which returns the exact coords at any pixels, to refine each tick
+      position by bisection down to tol pixels (see _refineTicks())."""
 
+   coords = np.asarray(coords,dtype=float)
+   periodic = tuple(wcsrange) == (0,360)
+   if periodic: # unwrap jumps across 360 -> 0
+      coords = coords + 360*np.concatenate(([0],np.cumsum(np.diff(coords) < -180)))
    if not np.all(np.diff(coords) > 0):
       header.error("coords passed to _getTickLocs() must be monotonically increasing!")
    minval = np.amin(coords)
    maxval = np.amax(coords)
-   tickmark = np.arange(wcsrange[0],wcsrange[1]+stepsize,stepsize)
+   if not periodic:
+      minval = max(minval,wcsrange[0])
+      maxval = min(maxval,wcsrange[1])
+   first = np.floor((minval - wcsrange[0])/stepsize)
+   last  = np.ceil((maxval - wcsrange[0])/stepsize)
+   tickmark = wcsrange[0] + stepsize*np.arange(first,last+1)
    mask = np.where((tickmark >= minval) & (tickmark <= maxval))
    tickmark = tickmark[mask]
-   tickpix  = np.interp(tickmark,coords,pixels)
+   if func is None:
+      tickpix = np.interp(tickmark,coords,pixels)
+   else:
+      tickpix = _refineTicks(func,pixels,coords,tickmark,periodic,tol)
+   if periodic: # back to 0-360
+      tickmark = np.mod(tickmark,360)
    return tickpix,tickmark
 
 def _makelabel_hms(tickmark,step,coord):
@@ -266,7 +279,29 @@ def _makelabel_off(tickmark,tickstep,unit):
       mylabel.append(r"$%g%s$" %(junk,unit))
    return mylabel
 
-def getcoord(wcs,limits,side='left',unit='hms'):
+def _refineTicks(func,pixels,coords,tickmark,periodic,tol):
+   """Find the pixel of every tickmark value by bisection.  coords are the
+      (unwrapped, increasing) values of func at the coarse pixels, which
+      bracket each tickmark.  All ticks are refined together, so func is
+      called once per iteration no matter how many ticks there are."""
+
+   pixels = np.asarray(pixels,dtype=float)
+   k = np.clip(np.searchsorted(coords,tickmark),1,len(coords)-1)
+   lo,hi = pixels[k-1],pixels[k]
+   clo,chi = coords[k-1],coords[k]
+   while len(lo) > 0 and np.amax(np.abs(hi - lo)) > tol:
+      mid = 0.5*(lo + hi)
+      cmid = np.asarray(func(mid),dtype=float)
+      if periodic: # put value on the same turn as the tickmark
+         cmid = tickmark + np.mod(cmid - tickmark + 180,360) - 180
+      below = cmid < tickmark
+      lo,clo = np.where(below,mid,lo),np.where(below,cmid,clo)
+      hi,chi = np.where(below,hi,mid),np.where(below,chi,cmid)
+   with np.errstate(all='ignore'): # linear within the final bracket
+      frac = np.where(chi > clo,(tickmark - clo)/(chi - clo),0.5)
+   return lo + np.clip(frac,0,1)*(hi - lo)
+
+def getcoord(wcs,limits,side='left',unit='hms',adaptive=None):
    """Return two lists of locations (in pixels) and axis labels for the
       given side.
 
@@ -279,7 +314,33 @@ def getcoord(wcs,limits,side='left',unit='hms'):
       unit     = string.  Controls units of tickmark labels Can be 'deg'
                  (decimal degrees), 'hms' (degrees/minutes/seconds and
                  hours/minutes/seconds, i.e. sexagesimal), 'do', 'mo', 'so'
-                 (degrees/arcminutes/arcseconds offset) from crval1,crval2)"""
+                 (degrees/arcminutes/arcseconds offset) from crval1,crval2)
+      adaptive = boolean.  If True, the wcs is only evaluated at a few
+                 points along the edge and each tick is then found by
+                 bisection, so the work depends on the number of ticks
+                 instead of the length of the edge.  If None (default),
+                 True for edges longer than _adaptivelength pixels."""
+
+   global _tickwcs
+
+   if header._fig['wcs'] is not _tickwcs: # new image, drop old ticks
+      _tickcache.clear()
+      _tickwcs = header._fig['wcs']
+   wcskey = _wcskey(wcs)
+   if wcskey is None: # cannot tell when this wcs changes, so do not cache
+      return _getcoord(wcs,limits,side,unit,adaptive)
+   key = (wcskey,tuple(limits),side,unit,adaptive)
+   if key in _tickcache:
+      ticks = _tickcache.pop(key) # re-insert to mark as most recently used
+   else:
+      ticks = _getcoord(wcs,limits,side,unit,adaptive)
+   _tickcache[key] = ticks
+   while len(_tickcache) > _tickcachesize:
+      _tickcache.popitem(last=False)
+   return np.array(ticks[0]),list(ticks[1]),np.array(ticks[2])
+
+def _getcoord(wcs,limits,side,unit,adaptive):
+   """Does the work for getcoord(), without the cache"""
 
    xmin = limits[0] - 1
    xmax = limits[1] - 1
@@ -288,19 +349,22 @@ def getcoord(wcs,limits,side='left',unit='hms'):
 
    if side in ('bottom','top'): # top or bottom edge
       pixels = np.arange(xmax,xmin-1,-1) # reverse b/c ra increase to the left
-      nx = pixels.shape[0]
       if side == 'bottom': # get RA for every pixel along given side
-         ra,dec = wcs.wcs_pix2sky(pixels,[ymin]*nx,0)
+         func = _edgefunc(wcs,'ra',unit,y=ymin)
       elif side == 'top':
-         ra,dec = wcs.wcs_pix2sky(pixels,[ymax]*nx,0)
+         func = _edgefunc(wcs,'ra',unit,y=ymax)
+      pixels,refine = _edgesamples(pixels,func,adaptive)
+      ra = func(pixels)
+      # ra increases along pixels, so this is the width even across RA=0
+      raspan = (0,np.mod(ra[-1] - ra[0],360))
 
       if unit == 'hms':
          # find step size given size of image plotted
-         stepra,ralabel = _getstepra_hms((ra[0],ra[-1]))
+         stepra,ralabel = _getstepra_hms(raspan)
 
          # find pixel and wcs locations for major and minor tickmarks
-         minorpix,minortick = _getTickLocs(pixels,ra,stepra,(0,360))
-         majorpix,majortick = _getTickLocs(pixels,ra,ralabel,(0,360))
+         minorpix,minortick = _getTickLocs(pixels,ra,stepra,(0,360),refine)
+         majorpix,majortick = _getTickLocs(pixels,ra,ralabel,(0,360),refine)
 
          # convert degrees to sexagesimal with required precision (returns strings)
          if ralabel < 1/240.: # label steps less than 1 hour-second
@@ -312,22 +376,20 @@ def getcoord(wcs,limits,side='left',unit='hms'):
          # format labels for plotting by matplotlib
          majorwcs = _makelabel_hms(majorwcs,ralabel,'ra')
       elif unit == 'deg':
-         stepra,ralabel = _getstepdeg((ra[0],ra[-1]))
+         stepra,ralabel = _getstepdeg(raspan)
 
          # find pixel and wcs locations for major and minor tickmarks
-         minorpix,minortick = _getTickLocs(pixels,ra,stepra,(0,360))
-         majorpix,majortick = _getTickLocs(pixels,ra,ralabel,(0,360))
+         minorpix,minortick = _getTickLocs(pixels,ra,stepra,(0,360),refine)
+         majorpix,majortick = _getTickLocs(pixels,ra,ralabel,(0,360),refine)
 
          majorwcs = _makelabel_off(majortick,ralabel,'do') # ralabel > 1 for deg labeling
          majorwcs.reverse() # reverse order so positive offset first
       elif unit in ('do','mo','so'):
-         crval = wcs.wcs.crval
-         ra = np.sign(ra-crval[0])*_angdist(ra,dec,crval[0],dec)
          stepra,ralabel = _getstepdec_dms((ra[0],ra[-1]))
          
          # find pixel and wcs locations for major and minor tickmarks
-         minorpix,minortick = _getTickLocs(pixels,ra,stepra,(-180,180))
-         majorpix,majortick = _getTickLocs(pixels,ra,ralabel,(-180,180))
+         minorpix,minortick = _getTickLocs(pixels,ra,stepra,(-180,180),refine)
+         majorpix,majortick = _getTickLocs(pixels,ra,ralabel,(-180,180),refine)
 
          majorwcs = _makelabel_off(majortick,ralabel,unit)
          majorwcs.reverse() # reverse order so positive offset first
@@ -338,17 +400,14 @@ def getcoord(wcs,limits,side='left',unit='hms'):
    elif side in ('left','right'): # left or right edge
       # pixels for entire edge
       pixels = np.arange(ymin,ymax+1)
-      ny = pixels.shape[0]
 
       # get declination for every pixel on edge
       if side == 'left':
-         ra,dec = wcs.wcs_pix2sky([xmin]*ny,pixels,0)
+         func = _edgefunc(wcs,'dec',unit,x=xmin)
       elif side == 'right':
-         ra,dec = wcs.wcs_pix2sky([xmax]*ny,pixels,0)
-
-      if unit in ('do', 'mo', 'so'):
-         crval = wcs.wcs.crval
-         dec = np.sign(dec-crval[1])*_angdist(ra,dec,ra,crval[1])
+         func = _edgefunc(wcs,'dec',unit,x=xmax)
+      pixels,refine = _edgesamples(pixels,func,adaptive)
+      dec = func(pixels)
 
       # find step size given range of declination plotted
       if unit == 'hms':
@@ -359,8 +418,8 @@ def getcoord(wcs,limits,side='left',unit='hms'):
          stepdec,declabel = _getstepdec_dms((dec[0],dec[-1]))
       
       # find pixel and wcs locations for major and minor tickmarks
-      minorpix,minortick = _getTickLocs(pixels,dec,stepdec,(-90,90))
-      majorpix,majortick = _getTickLocs(pixels,dec,declabel,(-90,90))
+      minorpix,minortick = _getTickLocs(pixels,dec,stepdec,(-90,90),refine)
+      majorpix,majortick = _getTickLocs(pixels,dec,declabel,(-90,90),refine)
 
       if unit == 'hms':
          # convert degrees to sexagesimal with required precision
@@ -379,6 +438,26 @@ def getcoord(wcs,limits,side='left',unit='hms'):
          header.error("tickmarks.getcoord(): unit must be hms, deg, or off!")
       return majorpix,majorwcs,minorpix
 
+def _wcskey(wcs):
+   """Return a hashable fingerprint of a pywcs WCS, so equal WCS objects
+      (e.g. of panels showing the same field) share cached tickmarks.
+      Distortion tables (sip, cpdis, det2im) cannot be compared by value,
+      so the objects themselves go into the key; holding them keeps their
+      id from being reused while the entry is cached.  Returns None for
+      objects that are not a pywcs WCS, which are then not cached."""
+
+   try:
+      w = wcs.wcs
+      key = (tuple(w.crpix),tuple(w.crval),tuple(w.cdelt),tuple(w.ctype),
+         tuple(np.ravel(w.get_pc())),tuple(w.get_pv()),
+         tuple([str(u) for u in w.cunit]),str(w.radesys),float(w.lonpole),
+         float(w.latpole),str(w.equinox),
+         tuple([getattr(wcs,d,None) for d in _wcsdistortions]))
+      hash(key)
+      return key
+   except (AttributeError,TypeError,ValueError): # unknown object
+      return None
+
 if __name__ == "__main__":
 
    xmin = 20
@@ -86,9 +86,10 @@ equal to), \leq (for less than or equal to), \propto (for proportionality),
 \cu{} (for cursive)'''
 
 __all__ = ['arc','arrow','axis','bar','beam','bin','blowup','compass','connect',
-           'contour','curve','default','errorbar','halftone','inputwip',
-           'legend','panel','plot','poly','rect','savefig','text',
-           'title','tools','vector','viewport','winadj','wedge','xlabel','ylabel']
+           'contour','curve','default','endsession','errorbar','figure',
+           'halftone','inputwip','legend','panel','plot','poly','rect',
+           'render','savefig','text','title','tools','vector','viewport',
+           'winadj','wedge','xlabel','ylabel']
 
 import header as _hd
 _palettes = _hd._palettes
@@ -111,6 +112,7 @@ from contour import contour
 from curve import curve
 from default import default
 from errorbar import errorbar
+from figure import figure
 from halftone import halftone
 from inputwip import inputwip
 from legend import legend
@@ -118,7 +120,8 @@ from panel import panel
 from plot import plot
 from poly import poly
 from rect import rect
-from savefig import savefig
+from render import render
+from savefig import savefig,endsession
 from text import text
 from title import title
 import tools
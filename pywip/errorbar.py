@@ -39,7 +39,7 @@ def errorbar(xcol,ycol,datafile=None,xerr=None,yerr=None,**args):
    if header._panelobj.get('logx'): fp.write('log x\n')
    if header._panelobj.get('logy'): fp.write('log y\n')
    header._panelobj.writelimits(fp,**args)
-   if xerr:
+   if xerr is not None:
       fp.write('ecol %d\n' %ecol)
       if header._panelobj.get('logx'):
          fp.write('log err\n')
@@ -51,7 +51,7 @@ def errorbar(xcol,ycol,datafile=None,xerr=None,yerr=None,**args):
       else:
          fp.write('errorbar 5\n')
       ecol = ecol + 1
-   if yerr:
+   if yerr is not None:
       fp.write('ecol %d\n' %ecol)
       if header._panelobj.get('logy'):
          fp.write('log err\n')
@@ -0,0 +1,45 @@
+from . import header
+from . import savefig as _savefig
+
+class figure(object):
+   '''Holds everything pywip needs to build one plot, so several plots can be
+      built side by side.  Normally pywip keeps this in module globals and
+      can only build one plot at a time.  Commands given inside a with block
+      go to this figure:
+
+         fig = pywip.figure()
+         with fig:
+            pywip.plot(x,y)
+            pywip.xlabel('x')
+         fig.savefig('x.ps')
+
+      A figure can be entered again later to add more commands.  Outside of
+      any with block, pywip commands use the globals as always.  Use
+      pywip.render() to run wip on many figures in parallel.'''
+
+   _state = ('_wipfile','_tmplist','_optionsobj','_panelobj')
+
+   def __init__(self):
+      self._wipfile    = '???' # the temporary wip file with all the commands
+      self._tmplist    = []    # list of temp files made for this figure
+      self._optionsobj = None
+      self._panelobj   = None
+      self._saved      = []    # stack of global states replaced by __enter__
+
+   def __enter__(self):
+      self._saved.append([getattr(header,key) for key in self._state])
+      for key in self._state:
+         setattr(header,key,getattr(self,key))
+      return self
+
+   def __exit__(self,exctype,value,traceback):
+      for key,old in zip(self._state,self._saved.pop()):
+         setattr(self,key,getattr(header,key))
+         setattr(header,key,old)
+      return False
+
+   def savefig(self,filename,**args):
+      '''Same as pywip.savefig(), but for this figure'''
+
+      with self:
+         _savefig.savefig(filename,**args)
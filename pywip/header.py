@@ -1,6 +1,10 @@
 #!/usr/bin/env python
 
 import os,sys,tempfile,string,math,re
+try: # optional, used to translate long lists of coordinates in one pass
+   import nlcastro
+except ImportError:
+   nlcastro = None
 
 _palettes = ('gray','rainbow','heat','iraf','aips','pgplot','a','bb','he','i8','ds','cyclic')
 
@@ -252,6 +256,37 @@ def _count(datafile):
       _error("_count(): datafile %s does not exist!" %datafile)
       return 0
 
+def _errorcolumns(columns,fmt,values,errors,logFlag):
+   '''Helper function for _maketempfile that consolidates the code for making
+      errorbars and log errorbars with WIP.  You have to do some extra
+      gymnastics to make these happen in WIP.  Appends the errorbar columns
+      to columns, and their formats to fmt.'''
+   values = map(float,_tolist(values))
+   errors = map(float,_tolist(errors))
+   if logFlag:
+      lower = []
+      upper = []
+      for value,error in zip(values,errors):
+         if value == 0:
+            lower.append(1)
+         else:
+            lower.append((value+error)/value)
+         if value == error:
+            upper.append(1)
+         elif value - error < 0:
+            # when value-err < 0, this causes the errorbars to be drawn funny
+            # due to taking the log of a negative number.  So, we fix
+            # by forcing err, the errorbar value to be ~99% of value.  This
+            # reduces the value/(value-err) to 99.
+            upper.append(99)
+         else:
+            upper.append(value/(value-error))
+      columns.extend([lower,upper])
+      fmt.extend(['%6.6e','%6.6e'])
+   else:
+      columns.append(errors)
+      fmt.append('%s')
+
 def _error(msg):
    '''Print the error message to standard error'''
    if msg[-1] == '\n':
@@ -260,10 +295,25 @@ def _error(msg):
       sys.stderr.write('### PyWip Error! %s\n' %msg)
    sys.exit()
 
+def _formatcolumns(columns,fmt):
+   '''Return columns (a list of equal length sequences) as one string, with
+      a line per row formatted by fmt, which has one % code per column.  All
+      rows are formatted by a single % operation, which is a lot faster than
+      writing each value separately.'''
+   columns = [_tolist(c) for c in columns]
+   n = len(columns[0])
+   if n == 0:
+      return ''
+   flat = [v for row in zip(*columns) for v in row]
+   return '\n'.join([fmt]*n) %tuple(flat) + '\n'
+
 def _isseq(var):
-   '''Test whether var is a list or tuple'''
+   '''Test whether var is a sequence (list, tuple, numpy array, ...), but not
+      a string'''
 
-   return isinstance(var,(list,tuple))
+   if isinstance(var,basestring):
+      return False
+   return hasattr(var,'__len__') and getattr(var,'ndim',1) != 0
 
 def _lookup(rcol=1,gcol=2,bcol=3,scol=4,datafile=None,reverse=False):
    '''Define a color palette using RGB values.
@@ -288,37 +338,30 @@ def _lookup(rcol=1,gcol=2,bcol=3,scol=4,datafile=None,reverse=False):
    
    ## TODO: Can probably simplify this a lot by hard-coding some things.
    ## I don't think anyone would ever want to call this manually.
-   fp = _wipopen('_lookup')
+   fp = _wipopen('_lookup',[],[])
    if datafile is None:
       nr = len(rcol)
       ng = len(gcol)
       nb = len(bcol)
       ns = len(scol)
       if nr == ng == nb == ns:
-         blah = tempfile.mktemp()
-         _tmplist.append(blah)
-         fp2 = open(blah,'w')
-         for r,g,b,s in zip(rcol,gcol,bcol,scol):
-            fp2.write("%g  %g  %g  %g\n" %(r,g,b,s))
-         fp2.close()
+         datafile = _writecolumns([rcol,gcol,bcol,scol],'%g  %g  %g  %g')
          rcol = 1
          gcol = 2
          bcol = 3
          scol = 4
-         datafile = blah
       else:
          _error("_lookup(): You must have equal # of elements for rcol, gcol, bcol, scol!")
+   fp.write("data %s\n" %datafile)
+   fp.write("xcol %d\n" %rcol)
+   fp.write("ycol %d\n" %gcol)
+   fp.write("ecol %d\n" %bcol)
+   fp.write("pcol %d\n" %scol)
+   if reverse is True:
+      fp.write("lookup -1\n")
    else:
-      fp.write("data %s\n" %datafile)
-      fp.write("xcol %d\n" %rcol)
-      fp.write("ycol %d\n" %gcol)
-      fp.write("ecol %d\n" %bcol)
-      fp.write("pcol %d\n" %scol)
-      if reverse is True:
-         fp.write("lookup -1\n")
-      else:
-         fp.write("lookup\n")
-      fp.close()
+      fp.write("lookup\n")
+   fp.close()
 
 def _makecurve(**args):
    '''Does all the stuff for adding a curve to the legend().  This does
@@ -367,6 +410,8 @@ def _maketempfile(xcol,ycol,datafile=None,xerr=None,yerr=None,**args):
    logx = _panelobj.get('logx')
    logy = _panelobj.get('logy')
    if not datafile:
+      xcol = _tolist(xcol)
+      ycol = _tolist(ycol)
       if xcol == 'NR':
          xcol = range(len(ycol))
       elif ycol == 'NR':
@@ -374,10 +419,10 @@ def _maketempfile(xcol,ycol,datafile=None,xerr=None,yerr=None,**args):
       n1 = len(xcol)
       n2 = len(ycol)
       if n1 != n2: _error('_maketempfile(): x and y arrays must be the same length!')
-      if xerr:
+      if xerr is not None:
          if len(xerr) != n1:
             _error('_maketempfile(): xerr array must have same length as x and y arrays!')
-      if yerr:
+      if yerr is not None:
          if len(yerr) != n1:
             _error('_maketempfile(): yerr array must have same length as x and y arrays!')
       if args.has_key('color') and _isseq(args['color']):
@@ -398,85 +443,50 @@ def _maketempfile(xcol,ycol,datafile=None,xerr=None,yerr=None,**args):
    elif not os.path.exists(datafile):
       _error('_maketempfile(): file %s does not exist for reading!' %datafile)
 
-   blah = tempfile.mktemp()
-   _tmplist.append(blah)
-   fp2 = open(blah,'w')
-
-   idx = 0 # counting for cases where xcol or ycol is NR
+   # build whole columns first, then write the file in one go
    if datafile:
       fp1 = open(datafile,'r')
-      line = fp1.readline()
-      while line:
-         if line[0] != '#':
-            tmp = line.split()
-            if xcol == 'NR':
-               xtmp = idx
-               idx += 1
-            else:
-               xtmp = tmp[xcol-1]
-            if ycol == 'NR':
-               ytmp = idx
-               idx += 1
-            else:
-               ytmp = tmp[ycol-1]
-            if _panelobj.get('image') and _panelobj.get('header') == 'rd':
-               fp2.write('%6.6e %6.6e ' %(_translatecoords(xtmp,'ra'),
-                  _translatecoords(ytmp,'dec')))
-            else:
-               fp2.write('%s %s ' %(xtmp,ytmp))
-            if xerr:
-               _maketemphelper(fp2,float(xtmp),float(tmp[xerr-1]),logx)
-            if yerr:
-               _maketemphelper(fp2,float(ytmp),float(tmp[yerr-1]),logy)
-            fp2.write('\n')
-         line = fp1.readline()
+      rows = [line.split() for line in fp1 if line[0] != '#' and line.strip()]
       fp1.close()
-   else:
-      for i in range(n1):
-         fp2.write('%6.6e %6.6e ' %(_translatecoords(xcol[i],'ra'),
-            _translatecoords(ycol[i],'dec')))
-         if xerr:
-            _maketemphelper(fp2,float(xcol[i]),float(xerr[i]),logx)
-         if yerr:
-            _maketemphelper(fp2,float(ycol[i]),float(yerr[i]),logy)
-         if eFlag:
-            fp2.write('%s ' %(_translatecolor(ecol[i])))
-         else:
-            fp2.write('0 ')
-         if sFlag:
-            fp2.write('%s ' %(_translatesymbol(pcol[i])))
-         else:
-            fp2.write('0 ')
-         if fFlag:
-            fp2.write('%s ' %(_translatecolor(fcol[i])))
-         else:
-            fp2.write('0 ')
-         fp2.write('\n')
-   fp2.close()
-   return blah
-
-def _maketemphelper(fp,value,error,logFlag):
-   '''Helper function for _maketempfile that consolidates the code for making
-      errorbars and log errorbars with WIP.  You have to do some extra
-      gymnastics to make these happen in WIP.'''
-   if logFlag:
-      if value == 0:
-         fp.write('1 ')
+      if xcol == 'NR':
+         xtmp = range(len(rows))
       else:
-         fp.write('%6.6e ' %((value+error)/value))
-      if value == error:
-         fp.write('1 ')
+         xtmp = [t[xcol-1] for t in rows]
+      if ycol == 'NR':
+         ytmp = range(len(rows))
       else:
-         # when value-err < 0, this causes the errorbars to be drawn funny
-         # due to taking the log of a negative number.  So, we fix
-         # by forcing err, the errorbar value to be ~99% of value.  This
-         # reduces the value/(value-err) to 99.
-         if value - error < 0:
-            fp.write('%6.6e ' %99)
-         else:
-            fp.write('%6.6e ' %(value/(value-error)))
+         ytmp = [t[ycol-1] for t in rows]
+      if _panelobj.get('image') and _panelobj.get('header') == 'rd':
+         columns = [_translatecoordlist(xtmp,'ra'),_translatecoordlist(ytmp,'dec')]
+         fmt     = ['%6.6e','%6.6e']
+      else:
+         columns = [xtmp,ytmp]
+         fmt     = ['%s','%s']
+      if xerr:
+         _errorcolumns(columns,fmt,xtmp,[t[xerr-1] for t in rows],logx)
+      if yerr:
+         _errorcolumns(columns,fmt,ytmp,[t[yerr-1] for t in rows],logy)
    else:
-      fp.write('%s ' %error)
+      columns = [_translatecoordlist(xcol,'ra'),_translatecoordlist(ycol,'dec')]
+      fmt     = ['%6.6e','%6.6e']
+      if xerr is not None:
+         _errorcolumns(columns,fmt,xcol,xerr,logx)
+      if yerr is not None:
+         _errorcolumns(columns,fmt,ycol,yerr,logy)
+      if eFlag:
+         columns.append([_translatecolor(c) for c in ecol])
+      else:
+         columns.append([0]*n1)
+      if sFlag:
+         columns.append([_translatesymbol(c) for c in pcol])
+      else:
+         columns.append([0]*n1)
+      if fFlag:
+         columns.append([_translatecolor(c) for c in fcol])
+      else:
+         columns.append([0]*n1)
+      fmt.extend(['%s','%s','%s'])
+   return _writecolumns(columns,' '.join(fmt))
 
 def _mtext(fp,text,offset=0,align='center',side='top',**args):
    '''Combine stuff for using mtext, which is used by xlabel(), ylabel(),
@@ -612,6 +622,13 @@ def _readimage(fp,image):
    else:
       return None
 
+def _tolist(values):
+   '''Turn numpy arrays (or anything else with a tolist() method) into
+      lists of python numbers.  Other sequences are returned unchanged.'''
+   if hasattr(values,'tolist'):
+      return values.tolist()
+   return values
+
 def _translatealign(align):
    '''Take useful alignment string and convert to wip format.'''
    if   align == 'left':    return '0.0'
@@ -738,7 +755,7 @@ def _translatecoords(text,coord):
       for x in tmp:
          outval = outval + abs(mul*float(x))
          mul = mul/60.0
-      if float(tmp[0]) < 0:
+      if tmp[0].strip().startswith('-'): # so -00:30:00 stays negative
          outval = -1*outval
       if len(tmp) == 1: # didn't split by :, so assume user input degrees
          if coord == 'ra':
@@ -747,6 +764,25 @@ def _translatecoords(text,coord):
    else: # If user didn't give a string, assume coordinates are okay as-is
       return text
 
+def _translatecoordlist(values,coord):
+   '''Same as _translatecoords(), but for a whole list of values.  A list of
+      strings is converted in one pass by nlcastro.sex2degarray() when it
+      is available.'''
+   values = _tolist(values)
+   isstr  = [issubclass(t,str) for t in set(map(type,values))]
+   if not any(isstr): # numbers are passed through untouched
+      return list(values)
+   if nlcastro is None or not all(isstr):
+      return [_translatecoords(a,coord) for a in values]
+   try:
+      degrees = nlcastro.sex2degarray(values,coord)
+   except ValueError, e:
+      _error('_translatecoordlist(): %s' %e)
+   if coord == 'ra':
+      return (240.0*degrees).tolist() # degrees to hour-seconds
+   else:
+      return (3600.0*degrees).tolist() # degrees to arcseconds
+
 def _translatefill(fill):
    '''Take useful fill string and convert to wip format.
 
@@ -951,6 +987,18 @@ def _translatesymbol(sym):
    elif symbol == 'arrow': return '29' # an arrow, or \(29)
    else: return '99'
 
+def _writecolumns(columns,fmt):
+   '''Write columns to a new temporary file with a single write() and return
+      the name of the file.  See _formatcolumns() for columns and fmt.'''
+   global _tmplist
+
+   blah = tempfile.mktemp()
+   _tmplist.append(blah)
+   fp = open(blah,'w')
+   fp.write(_formatcolumns(columns,fmt))
+   fp.close()
+   return blah
+
 def _vptoxy(fp,x,y,r1,r2):
    '''Convert viewport x/y to physical x/y.
 
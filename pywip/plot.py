@@ -76,11 +76,13 @@ def plot(xcol,ycol,datafile=None,**args):
       if args['text'] is not None:
          header._makecurve(**args) #stuff for a legend
    if datafile is None:
+      xcol = header._tolist(xcol) # numpy arrays become lists, so the 'NR'
+      ycol = header._tolist(ycol) # tests compare strings, not every element
       if xcol == 'NR':
          num = len(ycol)
          xcol = range(num)
       elif ycol == 'NR':
-         num = len(ycol)
+         num = len(xcol)
          ycol = range(num)
       if header._isseq(xcol) and header._isseq(ycol):
          num = len(xcol)
@@ -0,0 +1,60 @@
+from . import header
+from . import savefig as _savefig
+import multiprocessing
+import os
+import subprocess
+
+def render(jobs,processes=None,orient='portrait',color=True,debug=False):
+   '''Run wip on many figures at once, using a pool of processes.
+
+      jobs      - list/tuple of (fig,filename) pairs, where fig is a
+                  pywip.figure and filename is a string or list/tuple of
+                  output files, as for savefig()
+      processes - number of wip processes to run at once.  Defaults to the
+                  number of cpus.
+      orient    - make plots portrait or landscape orientation?
+      color     - set to False to make black and white plots
+      debug     - set to True if you do not want to delete all the temp files
+                  needed by wip
+
+      Returns one list per job, in the same order as jobs, holding the wip
+      exit status of each of its output files (None for a figure with
+      nothing plotted).  E.g. [[0],[0,0]] for jobs [(f1,'a.ps'),
+      (f2,['b.ps','b.gif'])].'''
+
+   if orient not in ('landscape','portrait'):
+      header._error('render(): invalid orient option.  Try landscape or portrait')
+
+   tasks = []
+   for fig,filename in jobs:
+      if header._isseq(filename):
+         fileseq = filename
+      else:
+         fileseq = [filename]
+      devices = [_savefig._device(f,orient,color) for f in fileseq]
+      tasks.append((fig._wipfile,devices))
+
+   pool = multiprocessing.Pool(processes)
+   try:
+      status = pool.map(_runwip,tasks)
+   finally:
+      pool.close()
+      pool.join()
+
+   for fig,filename in jobs:
+      if not debug and fig._wipfile != '???':
+         os.remove(fig._wipfile)
+         for f in fig._tmplist:
+            os.remove(f)
+      fig._wipfile = '???'
+      fig._tmplist = []
+   return status
+
+def _runwip(task):
+   '''Run wip once for every device of one figure.  This has to be a module
+      level function so multiprocessing can send it to the worker processes.'''
+
+   wipfile,devices = task
+   if wipfile == '???': # nothing was plotted
+      return [None]*len(devices)
+   return [subprocess.call(['wip','-x','-d',dev,wipfile]) for dev in devices]
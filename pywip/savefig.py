@@ -1,14 +1,44 @@
 from . import header
+import atexit
 import os
+import pty
+import subprocess
+import sys
+import tempfile
 
-def savefig(filename,orient='portrait',color=True,debug=False):
+_session   = None # running wip process used when savefig(session=True)
+_output    = None # pty file descriptor that reads the output of the session
+_pending   = []   # temp files to delete once the session has finished
+_resetfile = None # one-row data file used to clear the data of the last plot
+_syncs     = 0    # number of sync points sent to the session so far
+
+# sent before each plot in a session, so that the data columns, limits,
+# palette, etc. left over from the previous plot do not leak into the next.
+# Reading the columns again from _resetfile also undoes any earlier 'log'.
+_reset = ('xcol 1','ycol 2','ecol 3','pcol 4','limits 0 1 0 1','palette 1',
+          'ITF 0','panel 1 1 1','angle 0','ticksize 0 0 0 0','rgb 1 0 0 0')
+
+def savefig(filename,orient='portrait',color=True,debug=False,session=False,
+            wait=True):
    '''Make the output plot by actually running wip.
 
       filename - a string or list/tuple giving the output filename(s) with
                  .gif or .ps extension (files) or .xs for an xwindow (e.g. 1.xs).
       orient   - make plot portrait or landscape orientation?
       color    - set to False to make a black and white plot
-      debug    - set to True if you do not want to delete all the temp files needed by wip'''
+      debug    - set to True if you do not want to delete all the temp files needed by wip
+      session  - set to True to send the plot to a single wip process that
+                 stays alive between savefig() calls, instead of starting
+                 wip once per output file.  wip state is reset before each
+                 plot.  Note that wip still reads the command and data files
+                 once per output file; it cannot draw one parsed plot on
+                 several devices.
+      wait     - only used with session=True.  If True, wait until wip has
+                 finished the plot before returning, and stop with an error
+                 if wip quit.  If False, return as soon as the plot is sent;
+                 wip output and errors then show up at the next waiting
+                 savefig() or at endsession(), and temp files are only
+                 deleted by endsession().'''
 
    if orient not in ('landscape','portrait'):
       header._error('savefig(): invalid orient option in savefig.  Try landscape or portrait')
@@ -17,25 +47,146 @@ def savefig(filename,orient='portrait',color=True,debug=False):
       fileseq = filename
    else:
       fileseq = [filename]
-   for f in fileseq:
-      if f.endswith('.gif'):
-         dev = '%s/gif' %f
-      elif f.endswith('.ps'):
-         dev = '%s/' %f
-         if orient == 'portrait':
-            dev = dev + 'v'
-         if color:
-            dev = dev + 'c'
-         dev = dev + 'ps'
-      elif f.endswith('.xs'):
-         dev = '%s/xs' %f[:-3]
+   devices = [_device(f,orient,color) for f in fileseq]
+   if header._wipfile != '???':
+      if session:
+         fp = _startsession()
+         try:
+            for dev in devices:
+               fp.write('device %s\n' %dev)
+               fp.write('data %s\n' %_resetfile)
+               fp.write('\n'.join(_reset) + '\n')
+               fp.write('input %s\n' %header._wipfile)
+            fp.flush()
+         except IOError: # wip quit, which _sync() reports below
+            wait = True
+         if wait:
+            _sync()
       else:
-         header._error('savefig(): Invalid output plot filename suffix.  Try .ps or .gif')
-      if header._wipfile != '???':
-         os.system('wip -x -d %s %s' %(dev,header._wipfile))
+         for dev in devices:
+            os.system('wip -x -d %s %s' %(dev,header._wipfile))
    if not debug:
-      os.remove(header._wipfile)
-      for f in header._tmplist:
-         os.remove(f)
+      if session and not wait:
+         _pending.append(header._wipfile)
+         _pending.extend(header._tmplist)
+      else:
+         for f in [header._wipfile] + header._tmplist:
+            if os.path.exists(f):
+               os.remove(f)
    header._wipfile = '???'
    header._tmplist = []
+
+def endsession():
+   '''Finish the wip session started by savefig(session=True).  Waits for wip
+      to draw everything it was sent, passes on its output, warns if it
+      quit with an error and then deletes the temp files.  This is called
+      automatically when python exits.'''
+
+   global _session,_output,_pending,_resetfile
+
+   if _session is not None:
+      try:
+         _session.stdin.close() # end of input makes wip close the device and quit
+      except IOError:           # wip already quit
+         pass
+      chunk = _readoutput()
+      while chunk:
+         sys.stdout.write(chunk)
+         chunk = _readoutput()
+      status = _session.wait()
+      os.close(_output)
+      _session = None
+      _output = None
+      _resetfile = None
+      if status != 0:
+         header._warning('endsession(): wip quit with exit status %d' %status)
+   for f in _pending:
+      if os.path.exists(f):
+         os.remove(f)
+   _pending = []
+
+def _device(filename,orient,color):
+   '''Translate an output filename into a wip/pgplot device name'''
+
+   if filename.endswith('.gif'):
+      dev = '%s/gif' %filename
+   elif filename.endswith('.ps'):
+      dev = '%s/' %filename
+      if orient == 'portrait':
+         dev = dev + 'v'
+      if color:
+         dev = dev + 'c'
+      dev = dev + 'ps'
+   elif filename.endswith('.xs'):
+      dev = '%s/xs' %filename[:-3]
+   else:
+      header._error('savefig(): Invalid output plot filename suffix.  Try .ps or .gif')
+   return dev
+
+def _readoutput():
+   '''Return the next chunk of output from the wip session, or an empty
+      string once wip has quit'''
+
+   try:
+      return os.read(_output,4096).replace('\r','')
+   except OSError: # the pty gives EIO once wip has closed it
+      return ''
+
+def _startsession():
+   '''Return the stdin of the wip session, starting wip if needed.  The
+      output of wip goes to a pty, so that it is line buffered and _sync()
+      sees the echoed marker straight away.'''
+
+   global _session,_output,_resetfile
+
+   if _session is not None and _session.poll() is not None:
+      endsession() # report how the old session ended
+   if _session is None:
+      master,slave = pty.openpty()
+      try:
+         _session = subprocess.Popen(['wip','-d','/null'],stdin=subprocess.PIPE,
+            stdout=slave)
+      except OSError:
+         header._error('savefig(): Cannot start wip.  Is it in your path?')
+      finally:
+         os.close(slave)
+      _output = master
+      _resetfile = tempfile.mktemp()
+      fp = open(_resetfile,'w')
+      fp.write('0 0 0 0\n')
+      fp.close()
+      _pending.append(_resetfile)
+   return _session.stdin
+
+def _sync():
+   '''Wait until the wip session has worked through everything sent to it,
+      by asking wip to echo a marker number and reading its output up to
+      that number.  Any other output is passed on to stdout.'''
+
+   global _syncs
+
+   _syncs += 1
+   marker = -_syncs - 0.25 # a number wip would not print by itself
+   try:
+      _session.stdin.write('echo %g\n' %marker)
+      _session.stdin.flush()
+   except IOError: # wip quit, reported below
+      pass
+   buf = ''
+   chunk = _readoutput()
+   while chunk:
+      lines = (buf + chunk).split('\n')
+      buf = lines.pop()
+      for line in lines:
+         for word in line.split():
+            try:
+               if float(word) == marker:
+                  return
+            except ValueError:
+               pass
+         sys.stdout.write(line + '\n')
+      chunk = _readoutput()
+   sys.stdout.write(buf)
+   header._error('savefig(): wip quit with exit status %d before finishing the plot' %_session.wait())
+
+atexit.register(endsession)
@@ -1,70 +1,182 @@
 from .. import header
+import atexit
+import nlcfits
+import numpy
+import os
 import pyfits
 import tempfile
 
-def imextract(image,ext=1,headerext=None):
+_blockbytes = 1 << 24 # bytes copied at a time when streaming data
+_extracted  = {}      # (file identity,ext,headerext,plane,region) -> temp file
+_dtypes     = {8 : 'u1', 16 : '>i2', 32 : '>i4', 64 : '>i8', -32 : '>f4',
+               -64 : '>f8'}
+
+def imextract(image,ext=1,headerext=None,plane=None,region=None,cache=True):
    """Extract the given extension/plane and save to a new file.
-   
-      Returns a string with the name of the temporary file.  This filename
-      is also added to pywip's internal list of temporary files, meaning it
-      will automatically be deleted after savefig() is called.
-      
+
+      Returns a string with the name of the temporary file.  With
+      cache=False this filename is also added to pywip's internal list of
+      temporary files, meaning it will automatically be deleted after
+      savefig() is called.
+
       imextract() is often needed because WIP doesn't know what to do with
       multi-extension FITS images.
 
       image     - image name
       ext       - extension number, defaults to 1
       headerext - Extension number to use for header.  Defaults to same value
-                  as ext"""
-   
-   junk = tempfile.mktemp(suffix='.fits')
+                  as ext
+      plane     - plane number (starting from 1) along the third axis to
+                  extract from a cube.  Defaults to all of the data.
+      region    - (x1,x2,y1,y2) pixel range to extract (starting from 1,
+                  inclusive).  CRPIX1/2 are shifted to match.
+      cache     - set to False to always write a new file.  Otherwise the
+                  same (image,ext,headerext,plane,region) gives back the same
+                  file as long as image is not changed, and the file is only
+                  deleted when python exits.
+
+      The data are memory-mapped and only the requested pixels are copied,
+      a block at a time, so extracting a plane of a cube that does not fit
+      in memory is fine.  Compressed (.gz) images are read with pyfits."""
+
    try:
-      fp = pyfits.open(img)
-   except IOError:
-      header._error("Cannot open file `%s'" %img)
-
-   next = len(fp)
-   ext = _decode_ext(fp,ext)
-   if headerext is None:
-      headerext = ext
+      ext = _decode_ext(image,ext)
+      if headerext is None:
+         headerext = ext
+      else:
+         headerext = _decode_ext(image,headerext)
+      st = os.stat(image)
+   except (IOError,OSError):
+      header._error("Cannot open file `%s'" %image)
+
+   key = (os.path.realpath(image),st.st_mtime,st.st_size,ext,headerext,plane,
+      None if region is None else tuple(region))
+   if cache and key in _extracted and os.path.exists(_extracted[key]):
+      return _extracted[key]
+
+   junk = tempfile.mktemp(suffix='.fits')
+   if image.endswith('.gz'):
+      _pyfitsextract(image,ext,headerext,plane,region,junk)
+   else:
+      _streamextract(image,ext,headerext,plane,region,junk)
+   if cache:
+      _extracted[key] = junk
    else:
-      headerext = _decode_ext(fp,headerext)
-   
-   data = fp[ext].data
+      header._tmplist.append(junk)
+   return junk
+
+### Private functions ###
+
+def _card(key,value):
+   """Format a FITS header card with a number or logical value"""
+
+   if isinstance(value,bool):
+      value = 'T' if value else 'F'
+   elif isinstance(value,float):
+      value = repr(value).upper()
+   return ('%-8s= %20s' %(key,value)).ljust(80)
+
+def _cleanup():
+   """Delete the cached extracted files when python exits"""
+
+   for f in _extracted.values():
+      if os.path.exists(f):
+         os.remove(f)
+   _extracted.clear()
+
+def _decode_ext(image,ext):
+   """Decode ext, which may be string to proper fits extension number.  The
+      extension names are read once per file and cached by nlcfits."""
+
+   try:
+      return nlcfits.findext(image,ext)
+   except (IndexError,KeyError,TypeError),err:
+      header._error(err.args[-1])
+
+def _outputcards(datahead,head,shape,region):
+   """Build the cards of the output header: the structure keywords for
+      an image of shape (numpy order), the scaling keywords of the data
+      extension datahead and everything else from head"""
+
+   skip = ('SIMPLE','XTENSION','BITPIX','EXTEND','PCOUNT','GCOUNT','GROUPS',
+      'BSCALE','BZERO','BLANK','END')
+   cards = [_card('SIMPLE',True),_card('BITPIX',datahead['BITPIX']),
+      _card('NAXIS',len(shape))]
+   for i,n in enumerate(shape[::-1]):
+      cards.append(_card('NAXIS%d' %(i+1),n))
+   for card in datahead.cards:
+      if card[:8].rstrip() in ('BSCALE','BZERO','BLANK'):
+         cards.append(card)
+   for card in head.cards:
+      key = card[:8].rstrip()
+      if key in skip or key.startswith('NAXIS'):
+         continue
+      if region is not None and key in ('CRPIX1','CRPIX2') and key in head:
+         shift = region[0] if key == 'CRPIX1' else region[2]
+         card = _card(key,float(head[key]) - (shift - 1))
+      cards.append(card)
+   cards.append('END'.ljust(80))
+   return cards
+
+def _pyfitsextract(image,ext,headerext,plane,region,junk):
+   """Extract with pyfits, for files that can not be memory-mapped"""
+
+   fp = pyfits.open(image)
+   data = _select(fp[ext].data,plane,region)
    hdu = pyfits.PrimaryHDU(data)
    hdu.header = fp[headerext].header
+   if region is not None:
+      for key,shift in (('CRPIX1',region[0]),('CRPIX2',region[2])):
+         if key in hdu.header:
+            hdu.header[key] = hdu.header[key] - (shift - 1)
    hdu.writeto(junk)
    fp.close()
-   header._tmplist.append(junk)
-   return junk
 
-def _decode_ext(fp,ext):
-   """Decode ext, which may be string to proper fits extension number"""
-
-   next = len(fp)
-   if isinstance(ext,str): # extension is a string name, try to decode
-      found = False
-      for i in range(next):
-         try:
-            hdrkey = fp[i].header['extname'].strip()
-            if hdrkey.lower() == ext:
-               ext = i
-               found = True
-               break
-         except KeyError:
-            pass
-   elif isinstance(ext,int):
-      ext = ext - 1 # make zero-based
-      found = True
-   else:
-      fp.close()
-      header._error("extension must be a integer or string!")
-      
-   if found is False:
-      fp.close()
-      header._error("Extension named %s not found!" %ext)
+def _select(data,plane,region):
+   """Return the view of data (numpy order) given by plane and region"""
+
+   if plane is not None:
+      if data.ndim < 3:
+         header._error("imextract(): plane given, but image has only %d axes!" %data.ndim)
+      data = data.reshape((-1,) + data.shape[-3:])[0] # drop axes beyond 3
+      if not 1 <= plane <= data.shape[0]:
+         header._error("imextract(): plane must be in range 1-%d!" %data.shape[0])
+      data = data[plane-1]
+   if region is not None:
+      x1,x2,y1,y2 = [int(r) for r in region]
+      if not (1 <= x1 <= x2 <= data.shape[-1] and 1 <= y1 <= y2 <= data.shape[-2]):
+         header._error("imextract(): region is outside the image!")
+      data = data[...,y1-1:y2,x1-1:x2]
+   return data
 
-   if ext not in range(next):
-      header._error("Extension # %d is not in allowed range 1-%d" %(ext,next))
+def _streamextract(image,ext,headerext,plane,region,junk):
+   """Copy the header once, then the selected pixels a block at a time
+      from a memory map, without ever converting the data"""
+
+   datahead = nlcfits.cachedheader(image,ext)
+   head = nlcfits.cachedheader(image,headerext)
+   naxis = datahead.get('NAXIS',0)
+   if naxis == 0:
+      header._error("imextract(): extension %d has no data!" %(ext+1))
+   if datahead['BITPIX'] not in _dtypes:
+      header._error("imextract(): unknown BITPIX %s" %datahead['BITPIX'])
+   shape = tuple(datahead['NAXIS%d' %i] for i in range(naxis,0,-1))
+   data = numpy.memmap(image,dtype=_dtypes[datahead['BITPIX']],mode='r',
+      offset=datahead.offset,shape=shape)
+   data = _select(data,plane,region)
+
+   fp = open(junk,'wb')
+   try:
+      fp.write(''.join(_outputcards(datahead,head,data.shape,region)))
+      fp.write(' '*(-fp.tell() % 2880))
+      if data.ndim == 1:
+         data = data[numpy.newaxis]
+      step = max(_blockbytes//(data.shape[-1]*data.itemsize),1) # rows per block
+      for idx in numpy.ndindex(*data.shape[:-2]): # each 2D plane
+         for i in xrange(0,data.shape[-2],step):
+            fp.write(data[idx][i:i+step].tobytes())
+      fp.write('\0'*(-fp.tell() % 2880))
+   finally:
+      fp.close()
 
-   return ext
+atexit.register(_cleanup)
@@ -1,6 +1,5 @@
 from . import header
 from . import stick
-import tempfile
 import math
 
 def vector(xcol,ycol,anglecol,lengthcol,datafile=None,taper=45,vent=0.0,
@@ -65,8 +64,8 @@ def vector(xcol,ycol,anglecol,lengthcol,datafile=None,taper=45,vent=0.0,
          n4 = len(lengthcol)
          if n1 != n2 or n1 != n3 or n1 != n4:
             header._error('vector(): In vector, xcol, ycol, anglecol, and lengthcol must all have the same number of elements!')
-         x = [header._translatecoords(i,'ra') for i in xcol]
-         y = [header._translatecoords(i,'dec') for i in ycol]
+         x = header._translatecoordlist(xcol,'ra')
+         y = header._translatecoordlist(ycol,'dec')
          l = [scale*i for i in lengthcol]
          a = [start+i for i in anglecol]
       else: # if there is a datafile, read in and scale
@@ -84,21 +83,18 @@ def vector(xcol,ycol,anglecol,lengthcol,datafile=None,taper=45,vent=0.0,
                a.append(start+float(t[anglecol - 1]))
          fp2.close()
       # now write out new file with length's scaled, and aligned center or right
-      junkfile = tempfile.mktemp()
-      header._tmplist.append(junkfile)
-      fp2 = open(junkfile,'w')
-      for i in xrange(len(x)):
-         if align == 'center':
-            x1 = x[i] - 0.5*l[i]*math.cos(math.pi/180.0*a[i])
-            y1 = y[i] - 0.5*l[i]*math.sin(math.pi/180.0*a[i])
-         elif align == 'right':
-            x1 = x[i] - l[i]*math.cos(math.pi/180.0*a[i])
-            y1 = y[i] - l[i]*math.sin(math.pi/180.0*a[i])
-         else:
-            x1 = x[i]
-            y1 = y[i]
-         fp2.write('%4.4e  %4.4e  %4.4e  %4.4e\n' %(x1,y1,a[i],l[i]))
-      fp2.close()
+      x = header._tolist(x)
+      y = header._tolist(y)
+      if align == 'center':
+         x1 = [x[i] - 0.5*l[i]*math.cos(math.pi/180.0*a[i]) for i in xrange(len(x))]
+         y1 = [y[i] - 0.5*l[i]*math.sin(math.pi/180.0*a[i]) for i in xrange(len(x))]
+      elif align == 'right':
+         x1 = [x[i] - l[i]*math.cos(math.pi/180.0*a[i]) for i in xrange(len(x))]
+         y1 = [y[i] - l[i]*math.sin(math.pi/180.0*a[i]) for i in xrange(len(x))]
+      else:
+         x1 = x
+         y1 = y
+      junkfile = header._writecolumns([x1,y1,a,l],'%4.4e  %4.4e  %4.4e  %4.4e')
       xcol      = 1
       ycol      = 2
       anglecol  = 3
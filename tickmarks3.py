@@ -2,9 +2,59 @@
 """Script to generate proper WCS tickmarks in WIP.  WIP assumes the sky is
 flat, and so can be off for large fields.  This uses the worldpos module."""
 
+import nlcastro
 import nlclib
+import nlcfits
 import pywcs,pyfits
 from numpy import arange,amin,amax,where,interp,all,diff,pi,sin,cos,arccos,sign
+from numpy import asarray,ceil,clip,concatenate,cumsum,errstate,floor,linspace,mod
+from numpy import searchsorted
+
+_adaptivelength  = 2048 # edges longer than this (pixels) are sampled adaptively
+_adaptivesamples = 64   # number of coarse samples along an adaptive edge
+
+def _edgesamples(pixels,func,adaptive):
+   """Return the pixels along an edge to evaluate the wcs at, and the
+      function getTickLocs() should refine ticks with (None to use every
+      pixel of the edge)"""
+
+   if adaptive is None:
+      adaptive = pixels.shape[0] > _adaptivelength
+   if not adaptive or pixels.shape[0] <= _adaptivesamples:
+      return pixels,None
+   return linspace(pixels[0],pixels[-1],_adaptivesamples),func
+
+def _getwcs(fitsfile,ext):
+   """Return the pyfits header and pywcs WCS of fitsfile, cached between
+      calls"""
+
+   def load():
+      head = pyfits.getheader(fitsfile,ext=ext)
+      return head,pywcs.WCS(head)
+
+   return nlcfits.cached('tickmarks3.wcs',fitsfile,ext,load)
+
+def _refineticks(func,pixels,coords,tickmark,periodic,tol):
+   """Find the pixel of every tickmark value by bisection.  coords are the
+      (unwrapped, increasing) values of func at the coarse pixels, which
+      bracket each tickmark.  All ticks are refined together, so func is
+      called once per iteration no matter how many ticks there are."""
+
+   pixels = asarray(pixels,dtype=float)
+   k = clip(searchsorted(coords,tickmark),1,len(coords)-1)
+   lo,hi = pixels[k-1],pixels[k]
+   clo,chi = coords[k-1],coords[k]
+   while len(lo) > 0 and amax(abs(hi - lo)) > tol:
+      mid = 0.5*(lo + hi)
+      cmid = asarray(func(mid),dtype=float)
+      if periodic: # put value on the same turn as the tickmark
+         cmid = tickmark + mod(cmid - tickmark + 180,360) - 180
+      below = cmid < tickmark
+      lo,clo = where(below,mid,lo),where(below,cmid,clo)
+      hi,chi = where(below,hi,mid),where(below,chi,cmid)
+   with errstate(all='ignore'): # linear within the final bracket
+      frac = where(chi > clo,(tickmark - clo)/(chi - clo),0.5)
+   return lo + clip(frac,0,1)*(hi - lo)
 
 def _convert(value,coord,precision=0):
    """Convert a single value in deg to sexagesimal.  Use in conjunction with
@@ -16,59 +66,7 @@ def _convert(value,coord,precision=0):
       coord     = either 'ra' or 'dec' to specify coordinate type
       precision = number of decimal places for rounding seconds"""
 
-   negFlag = False # set to true if value is negative
-   try:
-      tmp = map(float,value.split(':'))
-      if tmp[0] < 0:
-         negFlag = True
-         tmp[0] = abs(tmp[0])
-   except ValueError:
-      nlclib.error('Invalid string given for conversion to sexagesimal: %s' %value)
-
-   n = len(tmp)
-   if n == 1: # assume it was in degrees
-      junk = tmp[0]
-      if coord == 'ra':
-         junk = junk/15.0
-      hours = int(junk)
-      try:
-         junk = 60*(junk%hours)
-         minutes = int(junk)
-      except ZeroDivisionError:
-         minutes = int(60*junk)
-      try:
-         seconds = 60*(junk%minutes)
-      except ZeroDivisionError:
-         seconds = 60*junk
-      while seconds >= 60:
-         seconds = seconds - 60
-         minutes += 1
-      while minutes >= 60:
-         minutes = minutes - 60
-         hours += 1
-      tmp = [hours,minutes,seconds]
-   elif n == 2: # assume it was already sexagesimal, but no seconds given
-      tmp.append(0.0)
-
-   # now convert to a string
-   seconds = round(tmp[2],precision)
-   if precision == 0:
-      seconds = int(seconds)
-   while seconds >= 60:
-      seconds -= 60
-      tmp[1] += 1
-   minutes = tmp[1]
-   while minutes >= 60:
-      minutes -= 60
-      tmp[0] += 1
-   if seconds < 10:
-      tmp = "%d:%02d:0%s" %(tmp[0],minutes,str(seconds))
-   else:
-      tmp = "%d:%02d:%s" %(tmp[0],minutes,str(seconds))
-   if negFlag: # catch cases where deg. is neg
-      tmp = '-' + tmp
-
-   return tmp
+   return deg2sex(value,coord,precision)
 
 def deg2sex(value,coord,precision=0):
    """Convert degrees to sexagesimal
@@ -78,11 +76,16 @@ def deg2sex(value,coord,precision=0):
       precision = number of decimal places for rounding seconds"""
 
    if isinstance(value,float) or isinstance(value,int) or isinstance(value,str):
-      tmp = _convert(str(value),coord,precision)
+      values = [value]
    else:
-      tmp = []
-      for c in value:
-         tmp.append(_convert(str(c),coord,precision))
+      values = value
+   try:
+      degrees = nlcastro.sex2degarray(values,coord)
+   except ValueError, e:
+      nlclib.error('Invalid string given for conversion to sexagesimal: %s' %e)
+   tmp = nlcastro.deg2sexarray(degrees,coord,precision,strings=True)
+   if isinstance(value,float) or isinstance(value,int) or isinstance(value,str):
+      tmp = tmp[0]
    return tmp
 
 def angdist(ra1,dec1,ra2,dec2):
@@ -157,17 +160,37 @@ def getstepoffset(offset,coord):
 
    return offstep[idx],offlabel[idx]
 
-def getTickLocs(pixels,coords,stepsize,wcsrange=(0,360)):
-   """Get tickmark locations in pixel coordinates."""
+def getTickLocs(pixels,coords,stepsize,wcsrange=(0,360),func=None,tol=0.01):
+   """Get tickmark locations in pixel coordinates.  Only the ticks between
+      the smallest and largest coords are generated.  A wcsrange of (0,360)
+      is treated as periodic, so an axis can cross RA=0.
+
+      If pixels is only a coarse sampling of the edge, give func(pixels),
+      which returns the exact coords at any pixels, to refine each tick
+      position by bisection down to tol pixels."""
 
+   coords = asarray(coords,dtype=float)
+   periodic = tuple(wcsrange) == (0,360)
+   if periodic: # unwrap jumps across 360 -> 0
+      coords = coords + 360*concatenate(([0],cumsum(diff(coords) < -180)))
    if not all(diff(coords) > 0):
       nlclib.error("coords passed to getTickLocs() must be monotonically increasing!")
    minval = amin(coords)
    maxval = amax(coords)
-   tickmark = arange(wcsrange[0],wcsrange[1]+stepsize,stepsize)
+   if not periodic:
+      minval = max(minval,wcsrange[0])
+      maxval = min(maxval,wcsrange[1])
+   first = floor((minval - wcsrange[0])/stepsize)
+   last  = ceil((maxval - wcsrange[0])/stepsize)
+   tickmark = wcsrange[0] + stepsize*arange(first,last+1)
    mask = where((tickmark >= minval) & (tickmark <= maxval))
    tickmark = tickmark[mask]
-   tickpix  = interp(tickmark,coords,pixels)
+   if func is None:
+      tickpix = interp(tickmark,coords,pixels)
+   else:
+      tickpix = _refineticks(func,pixels,coords,tickmark,periodic,tol)
+   if periodic: # back to 0-360
+      tickmark = mod(tickmark,360)
    return tickpix,tickmark
 
 def makelabel(tickmark,step,coord):
@@ -225,7 +248,7 @@ def makelabel(tickmark,step,coord):
                mylabel.append(r"$%s^{''}$" %(t[2]))
    return mylabel
 
-def getcoord(fitsfile,ext=0,limits=None,side='left'):
+def getcoord(fitsfile,ext=0,limits=None,side='left',adaptive=None):
    """Return two lists of locations (in pixels) and axis labels for the
       given side.
 
@@ -234,10 +257,14 @@ def getcoord(fitsfile,ext=0,limits=None,side='left'):
       limits   = tuple/list of xmin,xmax,ymin,ymax as pixel coordinates
                  (defaults to entire image).  Limits must be zero-based
                  pixel coordinates
-      side     = string.  Either left, right, top, or bottom"""
-
-   head = pyfits.getheader(fitsfile,ext=ext)
-   wcs = pywcs.WCS(head)
+      side     = string.  Either left, right, top, or bottom
+      adaptive = boolean.  If True, the wcs is only evaluated at a few
+                 points along the edge and each tick is then found by
+                 bisection, so the work depends on the number of ticks
+                 instead of the length of the edge.  If None (default),
+                 True for edges longer than _adaptivelength pixels."""
+
+   head,wcs = _getwcs(fitsfile,ext)
    if limits is None:
       xmin = 1
       xmax = head['naxis1']
@@ -251,14 +278,17 @@ def getcoord(fitsfile,ext=0,limits=None,side='left'):
 
    if side in ('bottom','top'): # top or bottom edge
       pixels = arange(xmax,xmin-1,-1)
-      nx = pixels.shape[0]
       if side == 'bottom':
-         ra,dec = wcs.wcs_pix2sky(pixels,[ymin]*nx,0)
+         y = ymin
       elif side == 'top':
-         ra,dec = wcs.wcs_pix2sky(pixels,[ymax]*nx,0)
-      stepra,ralabel = getstepra((ra[0],ra[-1]))
-      minorpix,minortick = getTickLocs(pixels,ra,stepra,(0,360))
-      majorpix,majortick = getTickLocs(pixels,ra,ralabel,(0,360))
+         y = ymax
+      func = lambda p: asarray(wcs.wcs_pix2sky(p,[y]*len(p),0)[0]) # RA
+      pixels,refine = _edgesamples(pixels,func,adaptive)
+      ra = func(pixels)
+      # ra increases along pixels, so this is the width even across RA=0
+      stepra,ralabel = getstepra((0,mod(ra[-1] - ra[0],360)))
+      minorpix,minortick = getTickLocs(pixels,ra,stepra,(0,360),refine)
+      majorpix,majortick = getTickLocs(pixels,ra,ralabel,(0,360),refine)
       if ralabel < 1/240.: # label steps less than 1 hour-second
          majorwcs = deg2sex(majortick,'ra',precision=1)
       else:
@@ -268,14 +298,16 @@ def getcoord(fitsfile,ext=0,limits=None,side='left'):
       return majorpix[::-1],majorwcs # reverse pixel order too
    elif side in ('left','right'): # left or right edge
       pixels = arange(ymin,ymax+1)
-      ny = pixels.shape[0]
       if side == 'left':
-         ra,dec = wcs.wcs_pix2sky([xmin]*ny,pixels,0)
+         x = xmin
       elif side == 'right':
-         ra,dec = wcs.wcs_pix2sky([xmax]*ny,pixels,0)
+         x = xmax
+      func = lambda p: asarray(wcs.wcs_pix2sky([x]*len(p),p,0)[1]) # Dec
+      pixels,refine = _edgesamples(pixels,func,adaptive)
+      dec = func(pixels)
       stepdec,declabel = getstepdec((dec[0],dec[-1]))
-      minorpix,minortick = getTickLocs(pixels,dec,stepdec,(-90,90))
-      majorpix,majortick = getTickLocs(pixels,dec,declabel,(-90,90))
+      minorpix,minortick = getTickLocs(pixels,dec,stepdec,(-90,90),refine)
+      majorpix,majortick = getTickLocs(pixels,dec,declabel,(-90,90),refine)
       if declabel < 1/3600.: # label steps less than 1 arcsecond
          majorwcs = deg2sex(majortick,'dec',precision=1)
       else:
@@ -295,8 +327,7 @@ def getcoordoffset(fitsfile,ext=0,limits=None,side='left'):
                  (defaults to entire image)
       side     = string.  Either left, right, top, or bottom"""
 
-   head = pyfits.getheader(fitsfile,ext=ext)
-   wcs = pywcs.WCS(head)
+   head,wcs = _getwcs(fitsfile,ext)
    if limits is None:
       xmin = 1
       xmax = head['naxis1']
@@ -321,7 +352,7 @@ def getcoordoffset(fitsfile,ext=0,limits=None,side='left'):
       offset = sign(ra-ra0)*angdist(ra,dec,ra0,dec0)
       stepoff,offlabel = getstepoffset(offset,'so')
 
-      stepra,ralabel = getstepra((ra[0],ra[-1]))
+      stepra,ralabel = getstepra((0,mod(ra[-1] - ra[0],360)))
       minorpix,minortick = getTickLocs(pixels,ra,stepra,(0,360))
       majorpix,majortick = getTickLocs(pixels,ra,ralabel,(0,360))
       if ralabel < 1/240.: # label steps less than 1 hour-second
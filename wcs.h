@@ -0,0 +1,74 @@
+/*  wcs.h -- the parts of the WCSTools wcs.h header that worldpos.c needs.
+ *
+ *  worldpos.c was written against the WorldCoor structure of Doug Mink's
+ *  WCSTools.  Only the members and projection codes it uses are declared
+ *  here, so worldpos.c can be compiled on its own into the shared library
+ *  used by worldpos.py (see worldposarray.c).
+ */
+#ifndef _wcs_h_
+#define _wcs_h_
+
+#ifndef PI
+#define PI	3.141592653589793238462643
+#endif
+
+#define degrad(x)	((x)*PI/180.)
+#define raddeg(x)	((x)*180./PI)
+
+/* Projection codes, as in WCSTools.  0 and below are linear. */
+#define WCS_PIX -1	/* Pixel WCS */
+#define WCS_LIN  0	/* Linear projection */
+#define WCS_AZP  1	/* Zenithal/Azimuthal Perspective */
+#define WCS_SZP  2	/* Zenithal/Azimuthal Perspective */
+#define WCS_TAN  3	/* Gnomonic = Tangent Plane */
+#define WCS_SIN  4	/* Orthographic/synthesis */
+#define WCS_STG  5	/* Stereographic */
+#define WCS_ARC  6	/* Zenithal/azimuthal equidistant */
+#define WCS_ZPN  7	/* Zenithal/azimuthal PolyNomial */
+#define WCS_ZEA  8	/* Zenithal/azimuthal Equal Area */
+#define WCS_AIR  9	/* Airy */
+#define WCS_CYP 10	/* CYlindrical Perspective */
+#define WCS_CAR 11	/* Cartesian */
+#define WCS_MER 12	/* Mercator */
+#define WCS_CEA 13	/* Cylindrical Equal Area */
+#define WCS_COP 14	/* Conic PerSpective (COP) */
+#define WCS_COD 15	/* COnic equiDistant */
+#define WCS_COE 16	/* COnic Equal area */
+#define WCS_COO 17	/* COnic Orthomorphic */
+#define WCS_BON 18	/* Bonne */
+#define WCS_PCO 19	/* Polyconic */
+#define WCS_SFL 20	/* Sanson-Flamsteed (GLobal Sinusoidal) */
+#define WCS_PAR 21	/* Parabolic */
+#define WCS_AIT 22	/* Hammer-Aitoff */
+#define WCS_MOL 23	/* Mollweide */
+#define WCS_CSC 24	/* COBE quadrilateralized Spherical Cube */
+#define WCS_QSC 25	/* Quadrilateralized Spherical Cube */
+#define WCS_TSC 26	/* Tangential Spherical Cube */
+#define WCS_NCP 27	/* Special case of SIN from AIPS*/
+#define WCS_GLS 28	/* Same as SFL from AIPS*/
+#define WCS_DSS 29	/* Digitized Sky Survey plate solution */
+#define WCS_PLT 30	/* Plate fit polynomials (SAO) */
+#define WCS_TNX 31	/* Tangent Plane (NOAO corrections) */
+
+struct WorldCoor {
+  double	xref;		/* X reference coordinate value (deg) */
+  double	yref;		/* Y reference coordinate value (deg) */
+  double	xrefpix;	/* X reference pixel */
+  double	yrefpix;	/* Y reference pixel */
+  double	xinc;		/* X coordinate increment (deg) */
+  double	yinc;		/* Y coordinate increment (deg) */
+  double	rot;		/* rotation around axis (deg) (N through E) */
+  double	cd[4];		/* rotation matrix */
+  double	dc[4];		/* inverse rotation matrix */
+  double	nxpix;		/* Number of pixels in X-dimension of image */
+  int		rotmat;		/* 0 if CDELT, CROTA; 1 if CD */
+  int		coorflip;	/* 0 if x=RA, y=Dec; 1 if x=Dec, y=RA */
+  int		prjcode;	/* projection code (-1-32) */
+};
+
+int worldpos (double xpix, double ypix, struct WorldCoor *wcs,
+              double *xpos, double *ypos);
+int worldpix (double xpos, double ypos, struct WorldCoor *wcs,
+              double *xpix, double *ypix);
+
+#endif
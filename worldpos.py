@@ -114,9 +114,52 @@ world coordinates on the sky with various projections."""
 # 31 October 2012 - Added code so that sky2xy() will know about sexagesimal
 # (given as a string) and convert the values to degrees.
 #
+# 18 October 2026 - Added _worldpos_array() and _xypix_array(), numpy
+# versions of _worldpos() and _xypix() that convert whole arrays at once.
+# xy2sky() and sky2xy() use them when given numpy arrays.  Points outside
+# the projection come back as NaN rather than raising ValueError.
+#
+# 18 October 2026 - The wcs class now builds a _plan when it is created.  The
+# plan holds all the constants that _worldpos() and _xypix() recomputed for
+# every point, plus the forward/inverse kernel for the projection.  xy2sky()
+# and sky2xy() go straight to the plan for single values, lists and arrays.
+#
+# 18 October 2026 - The wcs class reads only the header blocks of the fits
+# file through nlcfits.readheader() instead of pyfits.open(), so the data
+# are never touched.  A pyfits HDUList can still be passed instead of a name.
+# Headers are cached by nlcfits, so building the same wcs again is cheap.
+#
+# 18 October 2026 - Sexagesimal strings are converted by
+# nlcastro.sex2degarray(), which parses a whole list at once.  This also
+# fixes declinations like -00:30:00, which used to come out positive.
+#
+# 18 October 2026 - Optional compiled backend.  worldpos.c (with the small
+# wcs.h and the array loops in worldposarray.c) can be built into a shared
+# library next to this file:
+#
+#    cc -O2 -shared -fPIC -o libworldpos.so worldpos.c worldposarray.c -lm
+#
+# When it is there (or libworldpos is found on the library path), _plan
+# hands whole arrays to worldpos_array()/worldpix_array() through ctypes,
+# so xy2sky() and sky2xy() pick it up without any change.  Otherwise (and
+# for linear projections) the numpy code above is used.  Set
+# worldpos._clib = None to force the numpy code.
+#
+# 18 October 2026 - Added tabwcs and wcs.approx(), a fast approximate
+# transform.  The exact projection is evaluated on a coarse grid and
+# interpolated with bicubics, refining the grid until the error is below a
+# tolerance in pixels (1e-3 by default).  A coordinate map of every pixel
+# of a large image costs a few thousand exact evaluations instead of one
+# per pixel.
+#
 import math   # used by _worldpos() and _xypix()
+import os     # used by _loadclib()
 import sys    # used by _checkproj() and wcs class
-import pyfits # used by wcs class
+import numpy  # used by _worldpos_array() and _xypix_array()
+import ctypes as _ctypes # used by _loadclib().  ctypes is the projection list
+from ctypes import util as _ctypesutil
+import nlcfits # used by wcs class
+import nlcastro # used by wcs class
 
 cond2r = math.pi/180.
 deps   = 1.0e-5
@@ -541,6 +584,597 @@ def _xypix(xpos, ypos, xref, yref, xrefpix, yrefpix, xinc, yinc, proj,
    ypix = dy + yrefpix
    return xpix,ypix
 
+def _geomer(yref, xinc, yinc, cosr, sinr):
+   """Return the geo1,geo2,geo3 constants for the -MER projection"""
+   dt = yinc * cosr + xinc * sinr
+   if dt == 0.0:
+      dt = 1.0
+   dy = (yref/2.0 + 45.0) * cond2r
+   dx = dy + dt / 2.0 * cond2r
+   dy = math.log(math.tan(dy))
+   dx = math.log(math.tan(dx))
+   geo2 = dt * cond2r / (dx - dy)
+   geo3 = geo2 * dy
+   geo1 = math.cos(yref*cond2r)
+   if geo1 <= 0.0:
+      geo1 = 1.0
+   return geo1,geo2,geo3
+
+def _geoait(yref, xinc, yinc, cosr, sinr):
+   """Return the geo1,geo2,geo3 constants for the -AIT projection"""
+   dt = yinc*cosr + xinc*sinr
+   if dt == 0.0:
+      dt = 1.0
+   dt = dt * cond2r
+   dy = yref * cond2r
+   dx = math.sin(dy+dt)/math.sqrt((1.0 + math.cos(dy+dt))/2.0) - \
+        math.sin(dy)/math.sqrt((1.0 + math.cos(dy))/2.0)
+   if dx == 0.0:
+      dx = 1.0
+   geo2 = dt / dx
+   dt = xinc*cosr - yinc* sinr
+   if dt == 0.0:
+      dt = 1.0
+   dt = dt * cond2r
+   dx = 2.0 * math.cos(dy) * math.sin(dt/2.0)
+   if dx == 0.0:
+      dx = 1.0
+   geo1 = dt * math.sqrt((1 + math.cos(dy)*math.cos(dt/2.0))/2.0) / dx
+   geo3 = geo2 * math.sin(dy) / math.sqrt((1 + math.cos(dy))/2.0)
+   return geo1,geo2,geo3
+
+def _worldpos_array(xpix, ypix, xref, yref, xrefpix, yrefpix, xinc, yinc,
+   proj, rot=None, cd=None):
+   """Convert arrays of x,y pixel values to world coordinates in degrees
+
+      This is the numpy version of _worldpos().  The arguments are the same,
+      except xpix and ypix can be numpy arrays (or anything that
+      numpy.asarray() understands) of any shape.  Every point is converted
+      at once rather than one at a time.
+
+      returns the two coordinates as float64 arrays with the same shape as
+      the input.  Points where the angle is too large for the projection are
+      set to NaN instead of raising a ValueError.  ValueError is still raised
+      if xinc or yinc is zero."""
+
+   plan = _plan(xref, yref, xrefpix, yrefpix, xinc, yinc, proj, rot=rot, cd=cd)
+   return plan.xy2sky(xpix,ypix)
+
+def _xypix_array(xpos, ypos, xref, yref, xrefpix, yrefpix, xinc, yinc, proj,
+   rot=None, dc=None):
+   """Convert arrays of ra,dec to x,y pixels
+
+      This is the numpy version of _xypix().  The arguments are the same,
+      except xpos and ypos can be numpy arrays (or anything that
+      numpy.asarray() understands) of any shape.  Every point is converted
+      at once rather than one at a time.
+
+      returns the x,y pixel positions as float64 arrays with the same shape
+      as the input.  Points where the angle is too large for the projection
+      are set to NaN instead of raising an exception.  ValueError is still
+      raised if xinc or yinc is zero."""
+
+   plan = _plan(xref, yref, xrefpix, yrefpix, xinc, yinc, proj, rot=rot, dc=dc)
+   return plan.sky2xy(xpos,ypos)
+
+# Forward kernels for _plan.  Each takes the plan and the offsets l,m (and
+# l*l + m*m) in radians and returns the unwrapped ra,dec in radians plus a
+# boolean array that is True where the angle is too large for projection.
+
+def _fwd_sin(p, l, m, sins):
+   bad  = sins > 1.0
+   coss = numpy.sqrt(1.0 - sins)
+   dt   = p.sin0 * coss + p.cos0 * m
+   bad |= numpy.abs(dt) > 1
+   dect = numpy.arcsin(dt)
+   rat  = p.cos0 * coss - p.sin0 * m
+   bad |= (rat == 0.0) & (l == 0.0)
+   rat  = numpy.arctan2(l, rat) + p.ra0
+   return rat,dect,bad
+
+def _fwd_tan(p, l, m, sins):
+   bad  = sins > 1.0
+   dect = p.cos0 - m * p.sin0
+   bad |= dect == 0.0
+   rat  = p.ra0 + numpy.arctan2(l, dect)
+   dect = numpy.arctan(numpy.cos(rat-p.ra0) * (m * p.cos0 + p.sin0) / dect)
+   return rat,dect,bad
+
+def _fwd_arc(p, l, m, sins):
+   bad  = sins >= math.pi**2
+   sins = numpy.sqrt(sins)
+   coss = numpy.cos(sins)
+   sins = numpy.where(sins != 0.0, numpy.sin(sins) / sins, 1.0)
+   dt   = m * p.cos0 * sins + p.sin0 * coss
+   bad |= numpy.abs(dt) > 1
+   dect = numpy.arcsin(dt)
+   da   = coss - dt * p.sin0
+   dt   = l * sins * p.cos0
+   bad |= (da == 0.0) & (dt == 0.0)
+   rat  = p.ra0 + numpy.arctan2(dt, da)
+   return rat,dect,bad
+
+def _fwd_ncp(p, l, m, sins): # north celestial pole
+   dect = p.cos0 - m * p.sin0
+   bad  = dect == 0.0
+   rat  = p.ra0 + numpy.arctan2(l, dect)
+   dt   = numpy.cos(rat-p.ra0)
+   bad |= dt == 0.0
+   dect = dect / dt
+   bad |= numpy.abs(dect) > 1.0
+   dect = numpy.arccos(dect)
+   if p.dec0 < 0.0:
+      dect = -dect
+   return rat,dect,bad
+
+def _fwd_gls(p, l, m, sins): # global sinusoid, Samson-Flamsteed
+   dect = p.dec0 + m
+   bad  = numpy.abs(dect) > math.pi/2.
+   coss = numpy.cos(dect)
+   bad |= numpy.abs(l) > math.pi*coss
+   rat  = numpy.where(coss > deps, p.ra0 + l / coss, p.ra0)
+   return rat,dect,bad
+
+def _fwd_mer(p, l, m, sins): # mercator
+   rat = l / p.geo1 + p.ra0
+   bad = numpy.abs(rat - p.ra0) > 2*math.pi
+   if p.geo2 != 0.0:
+      dt = numpy.exp((m + p.geo3) / p.geo2)
+   else:
+      dt = numpy.ones(m.shape)
+   dect = 2.0 * numpy.arctan(dt) - math.pi/2.
+   return rat,dect,bad
+
+def _fwd_ait(p, l, m, sins): # Aitoff
+   origin = (l == 0.0) & (m == 0.0) # reference point maps to itself
+   dz   = 4.0 - l*l/(4.0*p.geo1*p.geo1) - ((m+p.geo3)/p.geo2)**2
+   bad  = (dz > 4.0) | (dz < 2.0)
+   dz   = 0.5 * numpy.sqrt(dz)
+   dd   = (m + p.geo3) * dz / p.geo2
+   bad |= numpy.abs(dd) > 1.0
+   dd   = numpy.arcsin(dd)
+   bad |= numpy.abs(numpy.cos(dd)) < deps
+   da   = l * dz / (2.0 * p.geo1 * numpy.cos(dd))
+   bad |= numpy.abs(da) > 1.0
+   da   = numpy.arcsin(da)
+   rat  = numpy.where(origin, p.ra0, p.ra0 + 2.0 * da)
+   dect = numpy.where(origin, p.dec0, dd)
+   return rat,dect,bad & ~origin
+
+def _fwd_stg(p, l, m, sins): # Sterographic
+   dz   = (4.0 - sins) / (4.0 + sins)
+   bad  = numpy.abs(dz) > 1.0
+   dect = dz * p.sin0 + m * p.cos0 * (1.0+dz) / 2.0
+   bad |= numpy.abs(dect) > 1.0
+   dect = numpy.arcsin(dect)
+   rat  = numpy.cos(dect)
+   bad |= numpy.abs(rat) < deps
+   rat  = l * (1.0+dz) / (2.0 * rat)
+   bad |= numpy.abs(rat) > 1.0
+   rat  = numpy.arcsin(rat)
+   mg   = 1.0 + numpy.sin(dect) * p.sin0 + numpy.cos(dect) * p.cos0 * numpy.cos(rat)
+   bad |= numpy.abs(mg) < deps
+   mg   = 2*(numpy.sin(dect)*p.cos0 - numpy.cos(dect)*p.sin0*numpy.cos(rat)) / mg
+   rat  = numpy.where(numpy.abs(mg-m) > deps, math.pi - rat, rat)
+   rat  = p.ra0 + rat
+   return rat,dect,bad
+
+def _fwd_lin(p, l, m, sins): # default is linear
+   return p.ra0 + l, p.dec0 + m, numpy.zeros(l.shape,dtype=bool)
+
+# Inverse kernels for _plan.  Each takes the plan, ra-ra0 and dec in radians,
+# plus cos(dec), sin(dec) and cos(ra-ra0), and returns the offsets l,m in
+# radians plus a boolean array that is True where the angle is too large.
+
+def _inv_sin(p, dra, dec, coss, sins, cosa):
+   sint = sins * p.sin0 + coss * p.cos0 * cosa
+   l = numpy.sin(dra) * coss
+   m = sins * p.cos0 - coss * p.sin0 * cosa
+   return l,m,sint < 0.0
+
+def _inv_tan(p, dra, dec, coss, sins, cosa):
+   sint = sins * p.sin0 + coss * p.cos0 * cosa
+   l = numpy.sin(dra) * coss / sint
+   m = (sins * p.cos0 - coss * p.sin0 * cosa) / sint
+   return l,m,sint <= 0.0
+
+def _inv_arc(p, dra, dec, coss, sins, cosa):
+   sint = sins * p.sin0 + coss * p.cos0 * cosa
+   m = numpy.arccos(numpy.clip(sint,-1.0,1.0))
+   m = numpy.where(m != 0, m / numpy.sin(m), 1.0)
+   l = numpy.sin(dra) * coss * m
+   m = m * (sins * p.cos0 - coss * p.sin0 * cosa)
+   return l,m,numpy.zeros(m.shape,dtype=bool)
+
+def _inv_ncp(p, dra, dec, coss, sins, cosa): # North celestial pole
+   l = numpy.sin(dra) * coss
+   if p.dec0 == 0.0: # can't stand the equator
+      return l,numpy.zeros(l.shape),numpy.ones(l.shape,dtype=bool)
+   m = (p.cos0 - coss * cosa) / p.sin0
+   return l,m,numpy.zeros(m.shape,dtype=bool)
+
+def _inv_gls(p, dra, dec, coss, sins, cosa): # global sinusoid, samson-flamsteed
+   if abs(p.dec0) > math.pi/2.:
+      bad = numpy.ones(dec.shape,dtype=bool)
+   else:
+      bad = numpy.abs(dec) > math.pi/2.
+   return dra * coss, dec - p.dec0, bad
+
+def _inv_mer(p, dra, dec, coss, sins, cosa): # mercator
+   dt = numpy.tan(dec / 2.0 + math.pi/4.)
+   m  = p.geo2 * numpy.log(dt) - p.geo3
+   return p.geo1 * dra, m, dt < deps
+
+def _inv_ait(p, dra, dec, coss, sins, cosa): # Aitoff
+   da  = dra / 2.0
+   bad = numpy.abs(da) > math.pi/2.
+   dt  = numpy.sqrt((1 + coss * numpy.cos(da))/2.)
+   bad |= numpy.abs(dt) < deps
+   l = 2.0 * p.geo1 * coss * numpy.sin(da) / dt
+   m = p.geo2 * sins / dt - p.geo3
+   return l,m,bad
+
+def _inv_stg(p, dra, dec, coss, sins, cosa): # Sterographic
+   bad = numpy.abs(dec) > math.pi/2.
+   dd  = 1.0 + sins * p.sin0 + coss * p.cos0 * cosa
+   bad |= numpy.abs(dd) < deps
+   dd  = 2.0 / dd
+   l = numpy.sin(dra) * coss * dd
+   m = dd * (sins * p.cos0 - coss * p.sin0 * cosa)
+   return l,m,bad
+
+def _inv_lin(p, dra, dec, coss, sins, cosa): # linear
+   return dra, dec - p.dec0, numpy.zeros(dra.shape,dtype=bool)
+
+_kernels = {'-sin' : (_fwd_sin,_inv_sin), '-tan' : (_fwd_tan,_inv_tan),
+            '-arc' : (_fwd_arc,_inv_arc), '-ncp' : (_fwd_ncp,_inv_ncp),
+            '-gls' : (_fwd_gls,_inv_gls), '-sfl' : (_fwd_gls,_inv_gls),
+            '-mer' : (_fwd_mer,_inv_mer), '-ait' : (_fwd_ait,_inv_ait),
+            '-stg' : (_fwd_stg,_inv_stg)}
+
+# projection codes of worldpos.c (see wcs.h)
+_prjcodes = {'-tan' : 3, '-sin' : 4, '-stg' : 5, '-arc' : 6, '-mer' : 12,
+             '-sfl' : 20, '-ait' : 22, '-ncp' : 27, '-gls' : 28}
+
+def _loadclib():
+   """Load the compiled worldpos.c if it has been built.  Returns the
+      ctypes library or None, in which case the numpy code is used."""
+
+   here = os.path.dirname(os.path.abspath(__file__))
+   names = [os.path.join(here,'libworldpos' + ext) for ext in ('.so','.dylib')]
+   found = _ctypesutil.find_library('worldpos')
+   if found is not None:
+      names.append(found)
+   for name in names:
+      try:
+         lib = _ctypes.CDLL(name)
+      except OSError:
+         continue
+      if not hasattr(lib,'worldpos_array'): # some other libworldpos
+         continue
+      darr = numpy.ctypeslib.ndpointer(numpy.float64,flags='C_CONTIGUOUS')
+      barr = numpy.ctypeslib.ndpointer(numpy.uint8,flags='C_CONTIGUOUS')
+      for func in (lib.worldpos_array,lib.worldpix_array):
+         func.restype  = None
+         func.argtypes = [_ctypes.c_long,darr,darr,darr,darr,darr,
+            _ctypes.c_int,_ctypes.c_int,darr,darr,barr]
+      return lib
+   return None
+
+_clib = _loadclib()
+
+class _plan(object):
+   """Precomputed constants and kernels for one WCS geometry.
+
+      All the per-point setup work done by _worldpos() and _xypix() (the
+      projection lookup, the sin/cos of the reference declination and
+      rotation, the cd matrix products and the -MER/-AIT geo terms) is done
+      once here.  xy2sky() and sky2xy() then only do the array arithmetic.
+
+      The arguments are the same as _worldpos() and _xypix().  cd is only
+      needed for xy2sky() and dc (its inverse) for sky2xy().  A plan is
+      read-only once built.
+
+      If the compiled worldpos.c is loaded (_clib), the conversions go
+      through it instead, with the same arguments (cargs)."""
+
+   __slots__ = ('proj','xref','yref','xrefpix','yrefpix','ra0','dec0',
+                'cos0','sin0','geo1','geo2','geo3','fwdmat','invmat',
+                'fwdkernel','invkernel','cargs','_frozen')
+
+   def __init__(self, xref, yref, xrefpix, yrefpix, xinc, yinc, proj,
+      rot=None, cd=None, dc=None):
+      proj = proj.lower()
+      _checkproj(proj)
+      # check axis increments - bail out if either 0
+      if (xinc == 0.0) or (yinc == 0.0):
+         raise ValueError("Input xinc or yinc is zero!")
+
+      self.proj    = proj
+      self.xref    = xref
+      self.yref    = yref
+      self.xrefpix = xrefpix
+      self.yrefpix = yrefpix
+      self.ra0     = xref * cond2r
+      self.dec0    = yref * cond2r
+      self.cos0    = math.cos(self.dec0)
+      self.sin0    = math.sin(self.dec0)
+      self.geo1 = self.geo2 = self.geo3 = None
+      # fwdmat converts pixel offsets to l,m in radians, invmat converts
+      # l,m in radians back to pixel offsets
+      self.fwdmat = None
+      self.invmat = None
+      if cd is not None or dc is not None:
+         if proj in ('-ait','-mer'):
+            raise ValueError('cd matrix cannot be used with -AIT or -MER projections!')
+         if cd is not None:
+            if len(cd) != 4:
+               raise IndexError("You must give four values for the cd matrix!")
+            self.fwdmat = tuple(a*cond2r for a in cd)
+         if dc is not None:
+            if len(dc) != 4:
+               raise IndexError("You must give four values for the cd matrix!")
+            self.invmat = tuple(a/cond2r for a in dc)
+      elif rot is not None:
+         cosr = math.cos(rot*cond2r)
+         sinr = math.sin(rot*cond2r)
+         self.fwdmat = (xinc*cosr*cond2r, -yinc*sinr*cond2r,
+                        xinc*sinr*cond2r,  yinc*cosr*cond2r)
+         self.invmat = (cosr/(xinc*cond2r),  sinr/(xinc*cond2r),
+                       -sinr/(yinc*cond2r),  cosr/(yinc*cond2r))
+         if proj == '-mer':
+            self.geo1,self.geo2,self.geo3 = _geomer(yref, xinc, yinc, cosr, sinr)
+         elif proj == '-ait':
+            self.geo1,self.geo2,self.geo3 = _geoait(yref, xinc, yinc, cosr, sinr)
+      else: # both are None
+         raise ValueError("You must define either rot or cd keywords!")
+      self.fwdkernel,self.invkernel = _kernels.get(proj,(_fwd_lin,_inv_lin))
+      self.cargs = self._cargs(xinc, yinc, rot)
+      self._frozen = True
+
+   def __setattr__(self, name, value):
+      if getattr(self,'_frozen',False):
+         raise AttributeError("_plan is read-only")
+      object.__setattr__(self,name,value)
+
+   def _cargs(self, xinc, yinc, rot):
+      """Arguments for worldpos_array()/worldpix_array(): the parameter
+         array, cd and dc matrices (degrees), rotmat flag and projection
+         code.  None for projections worldpos.c is not used for."""
+
+      if self.proj not in _prjcodes:
+         return None
+      par = numpy.array([self.xref, self.yref, self.xrefpix, self.yrefpix,
+         xinc, yinc, rot or 0.0])
+      # -MER and -AIT work from xinc, yinc and rot, the rest use the same
+      # matrices as the numpy kernels
+      rotmat = int(self.proj not in ('-mer','-ait'))
+      cd = numpy.zeros(4)
+      dc = numpy.zeros(4)
+      if self.fwdmat is not None:
+         cd[:] = self.fwdmat
+         cd /= cond2r
+      if self.invmat is not None:
+         dc[:] = self.invmat
+         dc *= cond2r
+      return par, cd, dc, rotmat, _prjcodes[self.proj]
+
+   def _ccall(self, func, a, b):
+      """Run a worldpos.c array loop over the float64 arrays a,b.  Returns
+         the two outputs and the bad point flags with the shape of a"""
+
+      shape = a.shape
+      a = numpy.ascontiguousarray(a).ravel()
+      b = numpy.ascontiguousarray(b).ravel()
+      outa = numpy.empty(a.size)
+      outb = numpy.empty(a.size)
+      bad  = numpy.empty(a.size,dtype=numpy.uint8)
+      par,cd,dc,rotmat,prjcode = self.cargs
+      func(a.size, a, b, par, cd, dc, rotmat, prjcode, outa, outb, bad)
+      return outa.reshape(shape), outb.reshape(shape), (bad != 0).reshape(shape)
+
+   def _forward(self, xpix, ypix):
+      """Convert x,y pixels to ra,dec in degrees.  Returns ra,dec and a
+         boolean array that is True where the angle is too large for the
+         projection (ra,dec are meaningless there)"""
+
+      if self.fwdmat is None:
+         raise ValueError("No cd matrix given to convert pixels to world coordinates!")
+      xpix = numpy.asarray(xpix,dtype=numpy.float64)
+      ypix = numpy.asarray(ypix,dtype=numpy.float64)
+      if xpix.shape != ypix.shape:
+         raise IndexError("number of values in x and y are not equal!")
+      if _clib is not None and self.cargs is not None:
+         return self._ccall(_clib.worldpos_array, xpix, ypix)
+      dx = xpix - self.xrefpix
+      dy = ypix - self.yrefpix
+      a,b,c,d = self.fwdmat
+      l = a*dx + b*dy
+      m = c*dx + d*dy
+      with numpy.errstate(invalid='ignore',divide='ignore',over='ignore'):
+         rat,dect,bad = self.fwdkernel(self, l, m, l*l + m*m)
+         # return ra in range
+         dt = rat - self.ra0
+         rat = numpy.where(dt > math.pi, rat - 2*math.pi,
+            numpy.where(dt < -math.pi, rat + 2*math.pi, rat))
+         rat = numpy.where(rat < 0.0, rat + 2*math.pi, rat)
+      # correct units back to degrees
+      return rat / cond2r, dect / cond2r, bad
+
+   def _inverse(self, xpos, ypos):
+      """Convert ra,dec in degrees to x,y pixels.  Returns x,y and a boolean
+         array that is True where the angle is too large for the projection
+         (x,y are meaningless there)"""
+
+      if self.invmat is None:
+         raise ValueError("No inverse cd matrix given to convert world coordinates to pixels!")
+      xpos = numpy.asarray(xpos,dtype=numpy.float64)
+      ypos = numpy.asarray(ypos,dtype=numpy.float64)
+      if xpos.shape != ypos.shape:
+         raise IndexError("number of values in ra and dec are not equal!")
+      if _clib is not None and self.cargs is not None:
+         return self._ccall(_clib.worldpix_array, xpos, ypos)
+
+      # 0h wrap-around tests added by D.Wells 10/12/94:
+      dt = xpos - self.xref
+      dt = numpy.where(dt > +180, dt - 360, numpy.where(dt < -180, dt + 360, dt))
+      dra = dt * cond2r
+      dec = ypos * cond2r
+      with numpy.errstate(invalid='ignore',divide='ignore',over='ignore'):
+         l,m,bad = self.invkernel(self, dra, dec, numpy.cos(dec),
+            numpy.sin(dec), numpy.cos(dra))
+      a,b,c,d = self.invmat
+      return a*l + b*m + self.xrefpix, c*l + d*m + self.yrefpix, bad
+
+   def xy2sky(self, xpix, ypix):
+      """Convert x,y pixels to ra,dec in degrees.  NaN marks positions
+         outside the projection."""
+      ra,dec,bad = self._forward(xpix,ypix)
+      return numpy.where(bad,numpy.nan,ra),numpy.where(bad,numpy.nan,dec)
+
+   def sky2xy(self, xpos, ypos):
+      """Convert ra,dec in degrees to x,y pixels.  NaN marks positions
+         outside the projection."""
+      x,y,bad = self._inverse(xpos,ypos)
+      return numpy.where(bad,numpy.nan,x),numpy.where(bad,numpy.nan,y)
+
+# Tabulated transforms for tabwcs.  The exact transform is evaluated on a
+# regular grid of control points and interpolated with 4x4 point Lagrange
+# bicubics.  Their error along an axis goes as (t+1)t(t-1)(t-2), which is
+# largest in the middle of a cell, so that is where the error is checked.
+
+def _cubicweights(u, n):
+   """Cell index and the four Lagrange cubic weights for positions u, given
+      in cells from the start of a grid of n cells.  The weights go with the
+      (padded) nodes i,i+1,i+2,i+3."""
+
+   i = numpy.clip(numpy.floor(u).astype(int), 0, n - 1)
+   t = u - i
+   tp = t + 1
+   tm = t - 1
+   tmm = t - 2
+   return i, (-t*tm*tmm/6., tp*tm*tmm/2., -tp*t*tmm/2., tp*t*tm/6.)
+
+class _table(object):
+   """A transform func(a,b) -> (u,v) tabulated on a grid of na x nb cells
+      over box=(a1,a2,b1,b2), plus a ring of nodes just outside the box for
+      the bicubic interpolation.  Cells marked in exact (an nb x na array)
+      are computed with func instead, as are points outside the box.
+      nodes may be NaN where func is undefined."""
+
+   __slots__ = ('func','box','na','nb','da','db','nodes','exact')
+
+   def __init__(self, func, box, na, nb):
+      a1,a2,b1,b2 = box
+      self.func = func
+      self.box  = box
+      self.na   = na
+      self.nb   = nb
+      self.da   = (a2 - a1)/float(na)
+      self.db   = (b2 - b1)/float(nb)
+      bb,aa = numpy.meshgrid(b1 + self.db*numpy.arange(-1,nb+2),
+         a1 + self.da*numpy.arange(-1,na+2), indexing='ij')
+      self.nodes = func(aa,bb)
+      nan = numpy.isnan(self.nodes[0]) | numpy.isnan(self.nodes[1])
+      # a cell can't be interpolated if any of its 4x4 nodes is undefined
+      self.exact = numpy.zeros((nb,na),dtype=bool)
+      for j in range(4):
+         for i in range(4):
+            self.exact |= nan[j:j+nb,i:i+na]
+
+   def _weights(self, p, lo, step, n):
+      """Interpolation matrix for the 1-D positions p along one axis, plus
+         the cell of each position and whether it is inside the box"""
+
+      u = (p - lo)/step
+      inside = (u >= 0) & (u <= n)
+      idx,w = _cubicweights(numpy.where(inside,u,0.0), n)
+      mat = numpy.zeros((len(p),n+3))
+      rows = numpy.arange(len(p))
+      for k in range(4):
+         mat[rows,idx+k] = w[k]
+      return mat, idx, inside
+
+   def __call__(self, a, b):
+      """Interpolate at the points a,b (1-D float64 arrays)"""
+
+      ua = (a - self.box[0])/self.da
+      ub = (b - self.box[2])/self.db
+      inside = (ua >= 0) & (ua <= self.na) & (ub >= 0) & (ub <= self.nb)
+      ia,wa = _cubicweights(numpy.where(inside,ua,0.0), self.na)
+      ib,wb = _cubicweights(numpy.where(inside,ub,0.0), self.nb)
+      out = []
+      for node in self.nodes:
+         v = 0.0
+         for j in range(4):
+            for i in range(4):
+               v = v + wb[j]*wa[i]*node[ib+j,ia+i]
+         out.append(v)
+      return self._patch(out, ~inside | self.exact[ib,ia], a, b)
+
+   def grid(self, a, b):
+      """Interpolate on every pair of the 1-D arrays a,b.  The results have
+         shape (len(b),len(a))"""
+
+      wa,ia,ina = self._weights(a, self.box[0], self.da, self.na)
+      wb,ib,inb = self._weights(b, self.box[2], self.db, self.nb)
+      # undefined nodes only matter to exact cells, but would spread NaN
+      # through the whole matrix product
+      out = [numpy.dot(wb,numpy.dot(numpy.where(numpy.isnan(node),0.0,node),
+         wa.T)) for node in self.nodes]
+      todo = ~(inb[:,numpy.newaxis] & ina) | self.exact[ib][:,ia]
+      bb,aa = numpy.meshgrid(b, a, indexing='ij')
+      return self._patch(out, todo, aa, bb)
+
+   def _patch(self, out, todo, a, b):
+      """Replace the interpolated values where todo is True with func"""
+
+      if todo.any():
+         for v,e in zip(out,self.func(a[todo],b[todo])):
+            v[todo] = e
+      return out
+
+def _buildtable(func, box, err, tol, nmax):
+   """Tabulate func over box, doubling the number of cells along an axis
+      until the interpolation error err(exact,approx) is at most tol at the
+      middle of every cell edge along that axis, and at the cell centers.
+      The number of cells stops at nmax=(na,nb), after that the cells that
+      are still too far off are computed exactly."""
+
+   a1,a2,b1,b2 = box
+   na = min(8,nmax[0])
+   nb = min(8,nmax[1])
+   while True:
+      table = _table(func, box, na, nb)
+      amid = a1 + table.da*(numpy.arange(na) + 0.5)
+      bmid = b1 + table.db*(numpy.arange(nb) + 0.5)
+      anode = a1 + table.da*numpy.arange(na + 1)
+      bnode = b1 + table.db*numpy.arange(nb + 1)
+      errors = []
+      for a,b in ((amid,bmid),(amid,bnode),(anode,bmid)):
+         bb,aa = numpy.meshgrid(b, a, indexing='ij')
+         approx = table.grid(a,b)
+         e = err(func(aa,bb), approx)
+         # NaN is fine where both are undefined (exact cells), not otherwise
+         e[numpy.isnan(e)] = numpy.where(numpy.isnan(approx[0]),0.0,
+            numpy.inf)[numpy.isnan(e)]
+         errors.append(e)
+      # errors at the centers, and halfway between nodes along a and b
+      center,alonga,alongb = errors
+      cellerr = numpy.maximum.reduce([center,alonga[:-1],alonga[1:],
+         alongb[:,:-1],alongb[:,1:]])
+      cellerr[table.exact] = 0.0
+      if cellerr.max() <= tol:
+         break
+      growa = na < nmax[0] and max(alonga.max(),center.max()) > tol
+      growb = nb < nmax[1] and max(alongb.max(),center.max()) > tol
+      if not (growa or growb):
+         table.exact |= cellerr > tol
+         break
+      na = min(2*na,nmax[0]) if growa else na
+      nb = min(2*nb,nmax[1]) if growb else nb
+   return table
+
 class wcs:
    def __init__(self,filename,ext=0,rot=0,cd=False):
       """Get the WCS geometry
@@ -552,17 +1186,16 @@ class wcs:
          cd       - set to true to use CD matrix instead of rot."""
       self.header = {'rot' : None, 'cd' : None, 'dc' : None}
       if isinstance(filename,str):
+         # only read the header blocks, the data are never needed here
          self.filename = filename
-         img = pyfits.open(filename)
+         head = nlcfits.cachedheader(filename,ext)
+         hdrkeys = head
       else:
-         img = filename
+         # assume a pyfits.open() HDUList was passed in
          self.filename = None
-         # assume a pyfits.open hdu was passed as sys.stdin
-         # TODO: Doesn't work currently
-         #self.filename = None
-         #img = pyfits.open(filename,mode='readonly')
+         head = filename[ext].header
+         hdrkeys = head.ascardlist().keys() # list of existing keywords
       self.ext = ext
-      hdrkeys = img[ext].header.ascardlist().keys() # list of existing keywords
       if 'CRVAL1' not in hdrkeys:
          raise KeyError("CRVAL1 missing from header!")
       if 'CRVAL2' not in hdrkeys:
@@ -577,37 +1210,37 @@ class wcs:
          raise KeyError("NAXIS2 missing from header!")
       if 'CTYPE1' not in hdrkeys:
          raise KeyError("CTYPE1 missing from header!")
-      self.header['crval1'] = float(img[ext].header['crval1'])
-      self.header['crval2'] = float(img[ext].header['crval2'])
-      self.header['crpix1'] = float(img[ext].header['crpix1'])
-      self.header['crpix2'] = float(img[ext].header['crpix2'])
-      self.header['naxis1'] = float(img[ext].header['naxis1'])
-      self.header['naxis2'] = float(img[ext].header['naxis2'])
-      self.header['proj']   = img[ext].header['ctype1'][-4:] # just want projection
+      self.header['crval1'] = float(head['crval1'])
+      self.header['crval2'] = float(head['crval2'])
+      self.header['crpix1'] = float(head['crpix1'])
+      self.header['crpix2'] = float(head['crpix2'])
+      self.header['naxis1'] = float(head['naxis1'])
+      self.header['naxis2'] = float(head['naxis2'])
+      self.header['proj']   = head['ctype1'][-4:] # just want projection
 
       if cd is True: # use CD matrix
-         #wcs['cdelt1'] = float(img[ext].header['cd1_1'])
-         #wcs['cdelt2'] = float(img[ext].header['cd2_2'])
+         #wcs['cdelt1'] = float(head['cd1_1'])
+         #wcs['cdelt2'] = float(head['cd2_2'])
          cd = [0.,0.,0.,0.]
          dc = [0.,0.,0.,0.] # inverse of cd
          missing = 0
          if 'CD1_1' in hdrkeys:
-            cd[0] = float(img[ext].header['cd1_1'])
+            cd[0] = float(head['cd1_1'])
          else:
             sys.stderr.write("### Warning! Cannot CD1_1 keyword\n")
             missing += 1
          if 'CD1_2' in hdrkeys:
-            cd[1] = float(img[ext].header['cd1_2'])
+            cd[1] = float(head['cd1_2'])
          else:
             sys.stderr.write("### Warning! Cannot CD1_2 keyword\n")
             missing += 1
          if 'CD2_1' in hdrkeys:
-            cd[2] = float(img[ext].header['cd2_1'])
+            cd[2] = float(head['cd2_1'])
          else:
             sys.stderr.write("### Warning! Cannot CD2_1 keyword\n")
             missing += 1
          if 'CD2_2' in hdrkeys:
-            cd[3] = float(img[ext].header['cd2_2'])
+            cd[3] = float(head['cd2_2'])
          else:
             sys.stderr.write("### Warning! Cannot CD2_2 keyword\n")
             missing += 1
@@ -623,138 +1256,228 @@ class wcs:
          self.header['dc'] = dc
       else: # use rotation
          try:
-            self.header['cdelt1'] = float(img[ext].header['cdelt1'])
+            self.header['cdelt1'] = float(head['cdelt1'])
          except KeyError:
             raise KeyError("CDELT1 missing from header!")
          try:
-            self.header['cdelt2'] = float(img[ext].header['cdelt2'])
+            self.header['cdelt2'] = float(head['cdelt2'])
          except KeyError:
             raise KeyError("CDELT2 missing from header!")
 
          if isinstance(rot,str): # is a keyword
             if rot in hdrkeys:
-               self.header['rot'] = float(img[ext].header[rot])
+               self.header['rot'] = float(head[rot])
             else:
                raise KeyError("Cannot find rotation angle keyword %s!" %rot)
          else:
             self.header['rot'] = rot
-      if self.filename is None:
-         pass
+
+      # precompute everything needed by xy2sky() and sky2xy() once.  Note,
+      # changing self.header afterwards does not update the plan.
+      wcs = self.header
+      if wcs['cd'] is not None:
+         self._plan = _plan(wcs['crval1'], wcs['crval2'], wcs['crpix1'],
+            wcs['crpix2'], wcs['cd'][0], wcs['cd'][3], wcs['proj'],
+            cd=wcs['cd'], dc=wcs['dc'])
       else:
-         img.close()
+         self._plan = _plan(wcs['crval1'], wcs['crval2'], wcs['crpix1'],
+            wcs['crpix2'], wcs['cdelt1'], wcs['cdelt2'], wcs['proj'],
+            rot=wcs['rot'])
 
    def sky2xy(self,ra,dec):
       """Convert ra,dec into x,y pixels
 
-         ra,dec - can be either single values or iterable list/tuples/etc"""
+         ra,dec - can be either single values or iterable list/tuples/etc.
+                  If either is a numpy array, numpy arrays are returned, with
+                  NaN for any position outside the projection.  Otherwise
+                  a ValueError is raised for such positions."""
 
-      wcs = self.header
+      if isinstance(ra,numpy.ndarray) or isinstance(dec,numpy.ndarray):
+         ra  = numpy.asarray(ra)
+         dec = numpy.asarray(dec)
+         if ra.dtype.kind in 'SUO': # strings, presumably sexagesimal
+            ra = nlcastro.sex2degarray(ra,'ra')
+         if dec.dtype.kind in 'SUO':
+            dec = nlcastro.sex2degarray(dec,'dec')
+         return self._plan.sky2xy(ra,dec)
       # if ra or dec are strings (presumably sexagesimal, convert to degrees)
       if isinstance(ra,str):
          ra = self._sex2deg(ra,'ra')
       if isinstance(dec,str):
          dec = self._sex2deg(dec,'dec')
-      try: # if ra,dec are iterable, then iterate over all values
+      try: # if ra,dec are iterable, then convert all values at once
          n1 = len(ra)
          n2 = len(dec)
-         if n1 != n2:
-            raise IndexError("number of values in ra and dec are not equal!")
-         x = []
-         y = []
-         # ensure all values in iterable are in degrees
-         ra  = map(lambda a: self._sex2deg(a,'ra'),ra)
-         dec = map(lambda a: self._sex2deg(a,'dec'),dec)
-         if wcs['cd'] is not None:
-            for a,b in zip(ra,dec):
-               t1,t2 = _xypix(a, b, wcs['crval1'], wcs['crval2'], wcs['crpix1'], 
-                  wcs['crpix2'], wcs['cd'][0], wcs['cd'][3], wcs['proj'], 
-                  dc=wcs['dc'])
-               x.append(t1)
-               y.append(t2)
-         elif wcs['rot'] is not None:
-            for a,b in zip(ra,dec):
-               t1,t2 = _xypix(a, b, wcs['crval1'], wcs['crval2'], wcs['crpix1'], 
-                  wcs['crpix2'], wcs['cdelt1'], wcs['cdelt2'], wcs['proj'],
-                  rot=wcs['rot'])
-               x.append(t1)
-               y.append(t2)
-         else:
-            raise KeyError("Either rot or cd must be specified with wcs!")
       except TypeError: # ra,dec are single values
-         if wcs['cd'] is not None:
-            x,y = _xypix(ra, dec, wcs['crval1'], wcs['crval2'], wcs['crpix1'], 
-               wcs['crpix2'], wcs['cd'][0], wcs['cd'][3], wcs['proj'], 
-               dc=wcs['dc'])
-         elif wcs['rot'] is not None:
-            x,y = _xypix(ra, dec, wcs['crval1'], wcs['crval2'], wcs['crpix1'], 
-               wcs['crpix2'], wcs['cdelt1'], wcs['cdelt2'], wcs['proj'],
-               rot=wcs['rot'])
-         else:
-            raise KeyError("Either rot or cd must be specified with wcs!")      
-      return x,y
+         x,y,bad = self._plan._inverse(ra,dec)
+         if bad:
+            raise ValueError("Angle too large for projection!")
+         return float(x),float(y)
+      if n1 != n2:
+         raise IndexError("number of values in ra and dec are not equal!")
+      # ensure all values in iterable are in degrees
+      ra  = nlcastro.sex2degarray(ra,'ra')
+      dec = nlcastro.sex2degarray(dec,'dec')
+      x,y,bad = self._plan._inverse(ra,dec)
+      if bad.any():
+         raise ValueError("Angle too large for projection!")
+      return x.tolist(),y.tolist()
 
    def xy2sky(self,x,y):
       """Convert x,y into ra,dec
 
-         x,y - can be either single values or iterable list/tuples/etc"""
+         x,y - can be either single values or iterable list/tuples/etc.  If
+               either is a numpy array, numpy arrays are returned, with NaN
+               for any pixel outside the projection.  Otherwise a ValueError
+               is raised for such pixels."""
 
-      wcs = self.header
-      try: # if x,y are iterable, then iterate over all values
+      if isinstance(x,numpy.ndarray) or isinstance(y,numpy.ndarray):
+         return self._plan.xy2sky(x,y)
+      try: # if x,y are iterable, then convert all values at once
          n1 = len(x)
          n2 = len(y)
-         if n1 != n2:
-            raise IndexError("number of values in x and y are not equal!")
-         ra = []
-         dec = []
-         for a,b in zip(x,y):
-            if wcs['cd'] is not None:
-               t1,t2 = _worldpos(a, b, wcs['crval1'], wcs['crval2'], wcs['crpix1'], 
-                  wcs['crpix2'], wcs['cd'][0], wcs['cd'][3], wcs['proj'], 
-                  cd=wcs['cd'])
-            elif wcs['rot'] is not None:
-               t1,t2 = _worldpos(a, b, wcs['crval1'], wcs['crval2'], wcs['crpix1'], 
-                  wcs['crpix2'], wcs['cdelt1'], wcs['cdelt2'], wcs['proj'],
-                  rot=wcs['rot'])
-            else:
-               raise KeyError("Either rot or cd must be specified with wcs!")
-            ra.append(t1)
-            dec.append(t2)
       except TypeError: # x,y are single values
-         if wcs['cd'] is not None:
-            ra,dec = _worldpos(x, y, wcs['crval1'], wcs['crval2'], wcs['crpix1'], 
-               wcs['crpix2'], wcs['cd'][0], wcs['cd'][3], wcs['proj'], 
-               cd=wcs['cd'])
-         elif wcs['rot'] is not None:
-            ra,dec = _worldpos(x, y, wcs['crval1'], wcs['crval2'], wcs['crpix1'], 
-               wcs['crpix2'], wcs['cdelt1'], wcs['cdelt2'], wcs['proj'],
-               rot=wcs['rot'])
-         else:
-            raise KeyError("Either rot or cd must be specified with wcs!")      
-      return ra,dec
+         ra,dec,bad = self._plan._forward(x,y)
+         if bad:
+            raise ValueError("Angle too large for projection!")
+         return float(ra),float(dec)
+      if n1 != n2:
+         raise IndexError("number of values in x and y are not equal!")
+      ra,dec,bad = self._plan._forward(x,y)
+      if bad.any():
+         raise ValueError("Angle too large for projection!")
+      return ra.tolist(),dec.tolist()
+
+   def approx(self,tol=1e-3,limits=None):
+      """Return a tabwcs, a fast approximation of this wcs good to tol
+         pixels, for converting large arrays such as a coordinate map of
+         every pixel (see tabwcs.skymap()).
+
+         tol    - maximum error in pixels
+         limits - (x1,x2,y1,y2) pixel box where the approximation is used.
+                  Defaults to the whole image."""
+
+      if limits is None:
+         limits = (0.5,self.header['naxis1'] + 0.5,0.5,
+            self.header['naxis2'] + 0.5)
+      return tabwcs(self._plan.xy2sky,self._plan.sky2xy,limits,tol)
 
    def _sex2deg(self,value,coord):
       '''Convert sexagesimal to degrees, unless it is already in degrees'''
 
       if isinstance(value,str): # is a string
-         factor = 1.0    # divide each part by a factor to convert it to degrees
-         negFlag = False # set to true if negative declination
-         tmp = map(float,value.split(':'))
-         if tmp[0] < 0:
-            negFlag = True
-         for i in range(len(tmp)): # convert each part to degrees
-            tmp[i] = abs(tmp[i])/factor
-            factor = factor*60.0
-
-         degrees = sum(tmp)
-         if coord == 'ra':
-            if len(tmp) == 1: # if only 1 value input, assume it was already in
-               return degrees # degrees
-            else:
-               return 15*degrees # convert hours to degrees
-         elif coord == 'dec':
-            if negFlag:
-               return -1*degrees
-            else:
-               return degrees
+         return float(nlcastro.sex2degarray([value],coord)[0])
       elif isinstance(value,(float,int)): # assume it is already in degrees
          return value
+
+class tabwcs(object):
+   """Fast approximate version of a WCS, for transforming many points (e.g.
+      a coordinate map of every pixel) where the exact projection is not
+      needed.
+
+      The exact transform is evaluated on a coarse grid of control points
+      over the pixel box limits=(x1,x2,y1,y2) and interpolated with
+      bicubics.  The grid is refined until the error, in pixels, is at most
+      tol at the middle of every cell and cell edge.  Cells that still miss
+      tol at a grid spacing of about 4 pixels, points outside the box and
+      points outside the projection are computed exactly.  sky2xy() uses a
+      second grid over the ra,dec range of the box.
+
+      xy2sky  - function converting x,y pixel arrays to ra,dec in degrees
+      sky2xy  - function converting ra,dec arrays in degrees to x,y pixels
+      limits  - (x1,x2,y1,y2) pixel box, in the same pixel convention as
+                xy2sky and sky2xy
+      tol     - maximum error in pixels
+
+      Normally made by wcs.approx().  xy2sky() and sky2xy() take numpy
+      arrays (or anything numpy.asarray() understands) of any shape and
+      return arrays, with NaN outside the projection."""
+
+   def __init__(self, xy2sky, sky2xy, limits, tol=1e-3):
+      x1,x2,y1,y2 = [float(a) for a in limits]
+      if x2 <= x1 or y2 <= y1:
+         raise ValueError("limits must be given as x1,x2,y1,y2 with x1 < x2 and y1 < y2!")
+      self.limits = (x1,x2,y1,y2)
+      self.tol    = tol
+      self._xy2sky = xy2sky
+      self._sky2xy = sky2xy
+
+      # ra is unwrapped around the center, so it is smooth across 0h
+      xc,yc = numpy.array([(x1 + x2)/2.]),numpy.array([(y1 + y2)/2.])
+      self._ra0 = float(xy2sky(xc,yc)[0][0])
+      if numpy.isnan(self._ra0):
+         raise ValueError("Center of limits is outside the projection!")
+      # pixel size in degrees, to convert ra,dec errors to pixels
+      ra,dec = self._unwrapped(xc + numpy.array([0.,1.,0.]),
+         yc + numpy.array([0.,0.,1.]))
+      cosd = math.cos(dec[0]*cond2r)
+      scale = math.sqrt(abs((ra[1] - ra[0])*cosd*(dec[2] - dec[0]) -
+         (ra[2] - ra[0])*cosd*(dec[1] - dec[0])))
+      if not scale > 0:
+         raise ValueError("Cannot find the pixel size at the center of limits!")
+
+      def skyerr(exact, approx):
+         dra = (exact[0] - approx[0])*numpy.cos(exact[1]*cond2r)
+         return numpy.hypot(dra, exact[1] - approx[1])/scale
+
+      def pixerr(exact, approx):
+         return numpy.hypot(exact[0] - approx[0], exact[1] - approx[1])
+
+      # the error is only checked at some points per cell, so leave a margin
+      nmax = (max(8,int((x2 - x1)/4.)),max(8,int((y2 - y1)/4.)))
+      tol = tol/2.
+      self._fwd = _buildtable(self._unwrapped, self.limits, skyerr, tol, nmax)
+      ra,dec = [node[1:-1,1:-1] for node in self._fwd.nodes]
+      good = numpy.isfinite(ra).any()
+      if good:
+         ra1,ra2 = numpy.nanmin(ra),numpy.nanmax(ra)
+         dec1,dec2 = numpy.nanmin(dec),numpy.nanmax(dec)
+         good = ra2 > ra1 and dec2 > dec1
+      if good: # widen the range a little, the box edges are not straight
+         pad = 0.01*max(ra2 - ra1,dec2 - dec1)
+         self._inv = _buildtable(self._sky2xy, (ra1 - pad,ra2 + pad,
+            max(dec1 - pad,-90.),min(dec2 + pad,90.)), pixerr, tol, nmax)
+      else:
+         self._inv = None
+
+   def skymap(self):
+      """Return ra,dec in degrees of every pixel in limits, as 2-D arrays
+         with shape (ny,nx)"""
+
+      x1,x2,y1,y2 = self.limits
+      ra,dec = self._fwd.grid(numpy.arange(math.ceil(x1),math.floor(x2) + 1),
+         numpy.arange(math.ceil(y1),math.floor(y2) + 1))
+      return ra % 360., dec
+
+   def sky2xy(self, ra, dec):
+      """Convert ra,dec in degrees to x,y pixels.  NaN marks positions
+         outside the projection."""
+
+      ra,dec = self._asarrays(ra,dec)
+      ra = self._ra0 + (ra - self._ra0 + 180.) % 360. - 180.
+      if self._inv is None:
+         x,y = self._sky2xy(ra,dec)
+      else:
+         x,y = self._inv(ra.ravel(),dec.ravel())
+      return x.reshape(ra.shape), y.reshape(ra.shape)
+
+   def xy2sky(self, x, y):
+      """Convert x,y pixels to ra,dec in degrees.  NaN marks positions
+         outside the projection."""
+
+      x,y = self._asarrays(x,y)
+      ra,dec = self._fwd(x.ravel(),y.ravel())
+      return (ra % 360.).reshape(x.shape), dec.reshape(x.shape)
+
+   def _asarrays(self, a, b):
+      a = numpy.asarray(a,dtype=numpy.float64)
+      b = numpy.asarray(b,dtype=numpy.float64)
+      if a.shape != b.shape:
+         raise IndexError("number of values in the two coordinates are not equal!")
+      return a, b
+
+   def _unwrapped(self, x, y):
+      """Exact xy2sky, with ra within 180 degrees of the center"""
+
+      ra,dec = self._xy2sky(x,y)
+      return self._ra0 + (ra - self._ra0 + 180.) % 360. - 180., dec
@@ -0,0 +1,70 @@
+/*  worldposarray.c -- array versions of worldpos() and worldpix().
+ *
+ *  worldpos.py loads these through ctypes when they have been compiled
+ *  into a shared library next to it:
+ *
+ *     cc -O2 -shared -fPIC -o libworldpos.so worldpos.c worldposarray.c -lm
+ *
+ *  (use libworldpos.dylib on Mac OS X).  Each function converts n points
+ *  in one call, so python pays the call overhead once per array instead of
+ *  once per point.  bad[i] is set to the worldpos()/worldpix() return code
+ *  of point i (0 if fine, 1 if the angle is too large for the projection).
+ */
+#include "wcs.h"
+
+/* par holds xref, yref, xrefpix, yrefpix, xinc, yinc and rot.  cd and dc
+   are the matrix and its inverse (degrees/pixel and pixels/degree), only
+   used if rotmat is 1. */
+
+static void
+setwcs (struct WorldCoor *wcs, const double *par, const double *cd,
+        const double *dc, int rotmat, int prjcode)
+{
+  int i;
+
+  wcs->xref = par[0];
+  wcs->yref = par[1];
+  wcs->xrefpix = par[2];
+  wcs->yrefpix = par[3];
+  wcs->xinc = par[4];
+  wcs->yinc = par[5];
+  wcs->rot = par[6];
+  wcs->nxpix = 0.0;
+  for (i = 0; i < 4; i++) {
+    wcs->cd[i] = cd[i];
+    wcs->dc[i] = dc[i];
+    }
+  wcs->rotmat = rotmat;
+  wcs->coorflip = 0;
+  wcs->prjcode = prjcode;
+}
+
+void
+worldpos_array (long n, const double *xpix, const double *ypix,
+                const double *par, const double *cd, const double *dc,
+                int rotmat, int prjcode, double *xpos, double *ypos,
+                unsigned char *bad)
+{
+  struct WorldCoor wcs;
+  long i;
+
+  setwcs (&wcs, par, cd, dc, rotmat, prjcode);
+  for (i = 0; i < n; i++)
+    bad[i] = (unsigned char) worldpos (xpix[i], ypix[i], &wcs,
+                                       &xpos[i], &ypos[i]);
+}
+
+void
+worldpix_array (long n, const double *xpos, const double *ypos,
+                const double *par, const double *cd, const double *dc,
+                int rotmat, int prjcode, double *xpix, double *ypix,
+                unsigned char *bad)
+{
+  struct WorldCoor wcs;
+  long i;
+
+  setwcs (&wcs, par, cd, dc, rotmat, prjcode);
+  for (i = 0; i < n; i++)
+    bad[i] = (unsigned char) worldpix (xpos[i], ypos[i], &wcs,
+                                       &xpix[i], &ypix[i]);
+}